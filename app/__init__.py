@@ -3,19 +3,48 @@ from flask import Flask
 from flask_bootstrap import Bootstrap
 from flask_mail import Mail
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_pagedown import PageDown
 
 from config import config
+from .follow_index import FollowGraph
+from .background import BackgroundTasks
+from .fragments import FragmentCache
+from .last_seen import LastSeenBuffer
+from .auth_cache import AuthCache
+from .profiling import RequestProfiler
+from .mailer import Outbox
+from .http_cache import ConditionalGet
+from .fulltext import Search
+from .identicon import Avatars
+from .engine_profile import EngineProfile
+from .replication import ReplicaRouter, RoutingSQLAlchemy
+from .compression import Compress
+from .fingerprint import Assets
+from .ratelimit import RateLimiter
 
 bootstrap = Bootstrap()
 mail = Mail()
 moment = Moment()
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 pagedown = PageDown()
+follow_graph = FollowGraph()
+tasks = BackgroundTasks()
+fragment_cache = FragmentCache()
+last_seen_buffer = LastSeenBuffer()
+auth_cache = AuthCache()
+profiler = RequestProfiler()
+outbox = Outbox()
+conditional_get = ConditionalGet()
+search = Search()
+avatars = Avatars()
+db_profile = EngineProfile()
+replica = ReplicaRouter()
+compress = Compress()
+assets = Assets()
+limiter = RateLimiter()
 
 
 def create_app(config_name):
@@ -23,12 +52,26 @@ def create_app(config_name):
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
 
+    compress.init_app(app)
+    assets.init_app(app)
     bootstrap.init_app(app)
     mail.init_app(app)
     moment.init_app(app)
     db.init_app(app)
+    db_profile.init_app(app)
+    replica.init_app(app)
     login_manager.init_app(app)
     pagedown.init_app(app)
+    follow_graph.init_app(app)
+    tasks.init_app(app)
+    fragment_cache.init_app(app)
+    last_seen_buffer.init_app(app)
+    auth_cache.init_app(app)
+    profiler.init_app(app)
+    outbox.init_app(app)
+    conditional_get.init_app(app)
+    search.init_app(app)
+    limiter.init_app(app)
 
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
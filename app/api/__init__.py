@@ -2,4 +2,5 @@ from flask import Blueprint
 
 api = Blueprint('api', __name__)
 
-from . import authentication, posts, users, comments, errors
\ No newline at end of file
+from . import authentication, posts, users, comments, errors, export, \
+    search, moderation
\ No newline at end of file
@@ -1,8 +1,10 @@
 from flask import g, jsonify
 from flask_httpauth import HTTPBasicAuth
 from . import api
-from ..models import User
-from .errors import unauthorized, forbidden
+from .. import auth_cache, outbox, limiter
+from ..models import User, Permission
+from .decorators import permission_required
+from .errors import unauthorized, forbidden, too_many_requests
 
 auth = HTTPBasicAuth()
 
@@ -15,27 +17,43 @@ def verify_password(email_or_token, password):
         g.current_user = User.verify_auth_token(email_or_token)
         g.token_used = True
         return g. current_user is not None
-    user = User.query.filter_by(email=email_or_token).first()
+    user = auth_cache.verify_credentials(email_or_token, password)
     if not user:
         return False
     g.current_user = user
     g.token_used = False
-    return user.verify_password(password)
+    return True
+
+
+def rate_limited(user):
+    """A 429 response if the request is over its rate limit, else None."""
+    decision = limiter.hit(user)
+    if decision is not None and not decision.allowed:
+        return too_many_requests('Rate limit exceeded', decision.retry_after)
 
 
 @auth.error_handler
 def auth_error():
-    return unauthorized('Invalid credentials')
+    # Failed logins count against the remote address.
+    return rate_limited(None) or unauthorized('Invalid credentials')
 
 
 @api.before_request
 @auth.login_required
 def before_request():
+    limited = rate_limited(g.current_user)
+    if limited:
+        return limited
     if (not g.current_user.is_anonymous and
        not g.current_user.confirmed):
         return forbidden('Unconfirmed account')
 
 
+@api.after_request
+def after_request(response):
+    return limiter.add_headers(response)
+
+
 @api.route('/tokens/', methods=['POST'])
 def get_token():
     if g.current_user.is_anonymous or g.token_used:
@@ -45,3 +63,13 @@ def get_token():
                     'expiration': 3600})
 
 
+@api.route('/auth-cache/')
+@permission_required(Permission.ADMIN)
+def get_auth_cache_stats():
+    return jsonify(auth_cache.stats())
+
+
+@api.route('/outbox/')
+@permission_required(Permission.ADMIN)
+def get_outbox_stats():
+    return jsonify(outbox.stats())
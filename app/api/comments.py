@@ -3,31 +3,41 @@ from flask import request, g, jsonify, current_app, url_for
 
 from ..models import Post, Permission, Comment
 from .decorators import permission_required
-from .. import db
+from .. import db, conditional_get
+from ..http_cache import collection_version, make_etag
+from ..pagination import paginate, pagination_json
+from ..replication import read_only
 from . import api
 
 
 @api.route('/comments/<int:id>')
+@read_only
 def get_comment(id):
+    updated_at, = db.session.query(Comment.updated_at).filter_by(
+        id=id).first_or_404()
+    not_modified = conditional_get.check(
+        make_etag('comment', id, updated_at), updated_at)
+    if not_modified:
+        return not_modified
     comment = Comment.query.get_or_404(id)
     return jsonify(comment.to_json())
 
 
 @api.route('/comments/')
+@read_only
 def get_comments():
-    page = request.args.get('page', 1, type=int)
+    latest_id, updated_at, deletions = collection_version(Comment.query,
+                                                          Comment)
+    not_modified = conditional_get.check(
+        make_etag('comments', request.full_path, latest_id, updated_at,
+                  deletions),
+        updated_at)
+    if not_modified:
+        return not_modified
     per_page = current_app.config['FLASKY_COMMENTS_PER_PAGE']
-    pagination = Comment.query.paginate(page,
-                                   per_page=per_page,
-                                   error_out=False)
+    pagination = paginate(Comment.query, per_page, Comment.timestamp,
+                          Comment.id)
     comments = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_comments', page=page-1)
-    next = None
-    if pagination.has_next:
-        next = url_for('api.get_comments', page=page+1)
-    return jsonify({'comments': [comment.to_json() for comment in comments],
-                    'prev_url': prev,
-                    'next_url': next,
-                    'count': pagination.total})
\ No newline at end of file
+    json_comments = {'comments': [comment.to_json() for comment in comments]}
+    json_comments.update(pagination_json(pagination, 'api.get_comments'))
+    return jsonify(json_comments)
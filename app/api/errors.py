@@ -1,3 +1,5 @@
+import math
+
 from flask import request, jsonify, render_template
 
 from app.exceptions import ValidationError
@@ -44,6 +46,13 @@ def method_not_allowed(message):
     return response 
 
 
+def too_many_requests(message, retry_after):
+    response = jsonify({'error': 'too many requests', 'message': message})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(math.ceil(retry_after), 1))
+    return response
+
+
 def internal_server_error(message):
     response = jsonify({'error': 'internal server error', 'message': message})
     response.status_code = 500
@@ -0,0 +1,89 @@
+"""Streaming NDJSON export of posts and comments.
+
+Rows are read through a server-side cursor FLASKY_EXPORT_CHUNK_ROWS at a
+time and written out as they are read, so memory use does not grow with
+the export. Rows come in ``updated_at`` order, each with its ``id`` and
+``updated_at``. Passing the last ``updated_at`` seen as ``since`` fetches
+only the rows written at or after it. The boundary is inclusive, so
+clients should deduplicate by ``type`` and ``id``.
+"""
+from datetime import datetime
+
+from flask import Response, current_app, g, json, request, \
+    stream_with_context
+
+from ..models import Comment, Permission, Post, User
+from ..replication import read_only
+from .decorators import permission_required
+from .errors import bad_request, forbidden
+from . import api
+
+
+def parse_since():
+    """The ``since`` argument as a datetime; raises ValueError if bad."""
+    since = request.args.get('since')
+    if since is None:
+        return None
+    return datetime.fromisoformat(since)
+
+
+def export_rows(model, kind, query, since):
+    if since is not None:
+        query = query.filter(model.updated_at >= since)
+    query = (query.order_by(model.updated_at, model.id)
+             .execution_options(stream_results=True)
+             .yield_per(current_app.config['FLASKY_EXPORT_CHUNK_ROWS']))
+    for row in query:
+        item = row.to_json()
+        item.update(type=kind, id=row.id,
+                    updated_at=row.updated_at and row.updated_at.isoformat())
+        yield json.dumps(item)
+
+
+def stream(exports):
+    chunk_rows = current_app.config['FLASKY_EXPORT_CHUNK_ROWS']
+
+    def generate():
+        chunk = []
+        for model, kind, query, since in exports:
+            for line in export_rows(model, kind, query, since):
+                chunk.append(line)
+                if len(chunk) >= chunk_rows:
+                    yield '\n'.join(chunk) + '\n'
+                    chunk = []
+        if chunk:
+            yield '\n'.join(chunk) + '\n'
+    return Response(stream_with_context(generate()),
+                    mimetype='application/x-ndjson')
+
+
+def export(post_query, comment_query):
+    try:
+        since = parse_since()
+    except ValueError:
+        return bad_request('since must be an ISO 8601 timestamp')
+    kinds = request.args.get('type', 'posts,comments').split(',')
+    exports = []
+    if 'posts' in kinds:
+        exports.append((Post, 'post', post_query, since))
+    if 'comments' in kinds:
+        exports.append((Comment, 'comment', comment_query, since))
+    return stream(exports)
+
+
+@api.route('/users/<int:id>/export')
+@read_only
+def export_user(id):
+    user = User.query.get_or_404(id)
+    if g.current_user.id != user.id and \
+            not g.current_user.can(Permission.ADMIN):
+        return forbidden('Insufficient permissions')
+    return export(Post.query.filter_by(author_id=user.id),
+                  Comment.query.filter_by(author_id=user.id))
+
+
+@api.route('/export')
+@permission_required(Permission.ADMIN)
+@read_only
+def export_all():
+    return export(Post.query, Comment.query)
@@ -0,0 +1,53 @@
+"""The comment moderation queue.
+
+The queue holds comments nobody has reviewed yet and comments readers
+have reported since. POSTing ``{"action": "enable" | "disable", "ids":
+[...]}`` moderates up to FLASKY_MODERATION_BATCH_SIZE of them in one
+transaction.
+"""
+from flask import request, jsonify, current_app
+
+from .. import db
+from ..models import Comment, Permission
+from ..pagination import paginate, pagination_json
+from .decorators import permission_required
+from .errors import bad_request
+from . import api
+
+
+@api.route('/moderation')
+@permission_required(Permission.MODERATE)
+def get_moderation_queue():
+    per_page = current_app.config['FLASKY_COMMENTS_PER_PAGE']
+    pagination = paginate(Comment.awaiting_review(), per_page,
+                          Comment.timestamp, Comment.id)
+    comments = []
+    for comment in pagination.items:
+        item = comment.to_json()
+        item.update(id=comment.id, reviewed=comment.reviewed,
+                    flagged=comment.flagged)
+        comments.append(item)
+    json_comments = {'comments': comments}
+    json_comments.update(pagination_json(pagination,
+                                         'api.get_moderation_queue'))
+    return jsonify(json_comments)
+
+
+@api.route('/moderation', methods=['POST'])
+@permission_required(Permission.MODERATE)
+def moderate_comments():
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    ids = data.get('ids')
+    limit = current_app.config['FLASKY_MODERATION_BATCH_SIZE']
+    if action not in ('enable', 'disable'):
+        return bad_request('action must be enable or disable')
+    if not isinstance(ids, list) or not ids or \
+            not all(isinstance(id, int) for id in ids):
+        return bad_request('ids must be a list of comment ids')
+    if len(ids) > limit:
+        return bad_request(f'at most {limit} ids at once')
+    comments = Comment.moderate(ids, disabled=action == 'disable')
+    db.session.commit()
+    return jsonify({'action': action,
+                    'updated': sorted(comment.id for comment in comments)})
@@ -2,34 +2,42 @@ from flask import request, g, jsonify, current_app, url_for
 
 from ..models import Post, Permission, Comment
 from .decorators import permission_required
-from .. import db
+from .errors import forbidden
+from .. import db, conditional_get
+from ..http_cache import collection_version, make_etag
+from ..pagination import paginate, pagination_json
+from ..replication import read_only
 from . import api
 
 
 @api.route('/posts/<int:id>')
+@read_only
 def get_post(id):
+    updated_at, = db.session.query(Post.updated_at).filter_by(
+        id=id).first_or_404()
+    not_modified = conditional_get.check(make_etag('post', id, updated_at),
+                                         updated_at)
+    if not_modified:
+        return not_modified
     post = Post.query.get_or_404(id)
     return jsonify(post.to_json())
 
 
 @api.route('/posts/')
+@read_only
 def get_posts():
-    page = request.args.get('page', 1, type=int)
+    latest_id, updated_at, deletions = collection_version(Post.query, Post)
+    not_modified = conditional_get.check(
+        make_etag('posts', request.full_path, latest_id, updated_at,
+                  deletions), updated_at)
+    if not_modified:
+        return not_modified
     per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
-    pagination = Post.query.paginate(page,
-                                     per_page=per_page,
-                                     error_out=False)
+    pagination = paginate(Post.query, per_page, Post.timestamp, Post.id)
     posts = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_posts', page=page-1)
-    next = None
-    if pagination.has_next:
-        next = url_for('api.get_posts', page=page+1)
-    return jsonify({'posts': [post.to_json() for post in posts],
-                    'prev_url': prev,
-                    'next_url': next,
-                    'count': pagination.total})
+    json_posts = {'posts': [post.to_json() for post in posts]}
+    json_posts.update(pagination_json(pagination, 'api.get_posts'))
+    return jsonify(json_posts)
 
 
 @api.route('/posts/', methods=['POST'])
@@ -58,24 +66,26 @@ def edit_post(id):
 
 
 @api.route('/posts/<int:id>/comments/')
+@read_only
 def get_post_comments(id):
-    post = Post.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
+    db.session.query(Post.id).filter_by(id=id).first_or_404()
+    latest_id, updated_at, deletions = collection_version(
+        Comment.query.filter_by(post_id=id), Comment)
+    not_modified = conditional_get.check(
+        make_etag('post_comments', request.full_path, latest_id, updated_at,
+                  deletions),
+        updated_at)
+    if not_modified:
+        return not_modified
+    post = Post.query.get(id)
     per_page = current_app.config['FLASKY_COMMENTS_PER_PAGE']
-    pagination = post.comments.paginate(page,
-                                        per_page=per_page,
-                                        error_out=False)
+    pagination = paginate(post.comments, per_page, Comment.timestamp,
+                          Comment.id, descending=False)
     comments = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_comments', page=page-1)
-    next = None
-    if pagination.has_next:
-        next = url_for('api.get_comments', page=page+1)
-    return jsonify({'comments': [comment.to_json() for comment in comments],
-                    'prev_url': prev,
-                    'next_url': next,
-                    'count': pagination.total})
+    json_comments = {'comments': [comment.to_json() for comment in comments]}
+    json_comments.update(pagination_json(pagination, 'api.get_post_comments',
+                                         id=id))
+    return jsonify(json_comments)
 
 
 @api.route('/posts/<int:id>/comments/', methods=['POST'])
@@ -0,0 +1,30 @@
+from flask import request, jsonify, url_for
+
+from .. import search as fulltext
+from ..fulltext import search_kinds
+from ..replication import read_only
+from .errors import bad_request
+from . import api
+
+
+@api.route('/search')
+@read_only
+def search():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return bad_request('q is required')
+    type = request.args.get('type')
+    page = fulltext.query(query, kinds=search_kinds(type),
+                          cursor=request.args.get('cursor'))
+    results = []
+    for hit in page.hits:
+        item = hit.item.to_json()
+        item.update(type=hit.kind, id=hit.item.id, score=hit.score,
+                    snippet=str(hit.snippet))
+        results.append(item)
+    return jsonify({
+        'results': results,
+        'next': page.next_cursor,
+        'next_url': page.next_cursor and url_for(
+            'api.search', q=query, type=type, cursor=page.next_cursor)
+    })
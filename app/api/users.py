@@ -1,55 +1,58 @@
-
 from flask import request, g, jsonify, current_app, url_for
 
 from ..models import User, Post, Permission
 from .decorators import permission_required
-from .. import db
+from .. import db, conditional_get
+from ..http_cache import collection_version, make_etag
+from ..pagination import paginate, pagination_json
+from ..replication import read_only
 from . import api
 
 
 @api.route('/users/<int:id>')
+@read_only
 def get_user(id):
+    version = db.session.query(User.username, User.member_since,
+                               User.last_seen, User.post_count).filter_by(
+        id=id).first_or_404()
+    not_modified = conditional_get.check(make_etag('user', id, *version))
+    if not_modified:
+        return not_modified
     user = User.query.get_or_404(id)
     return jsonify(user.to_json())
 
 
 @api.route('/users/<int:id>/posts/')
+@read_only
 def get_user_posts(id):
-    user = User.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
+    db.session.query(User.id).filter_by(id=id).first_or_404()
+    latest_id, updated_at, deletions = collection_version(
+        Post.query.filter_by(author_id=id), Post)
+    not_modified = conditional_get.check(
+        make_etag('user_posts', request.full_path, latest_id, updated_at,
+                  deletions),
+        updated_at)
+    if not_modified:
+        return not_modified
+    user = User.query.get(id)
     per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
-    pagination = user.posts.paginate(page,
-                                     per_page=per_page,
-                                     error_out=False)
+    pagination = paginate(user.posts, per_page, Post.timestamp, Post.id)
     posts = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_posts', page=page-1)
-    next = None
-    if pagination.has_next:
-        next = url_for('api.get_posts', page=page+1)
-    return jsonify({'posts': [post.to_json() for post in posts],
-                    'prev_url': prev,
-                    'next_url': next,
-                    'count': pagination.total})
+    json_posts = {'posts': [post.to_json() for post in posts]}
+    json_posts.update(pagination_json(pagination, 'api.get_user_posts',
+                                      id=id))
+    return jsonify(json_posts)
 
 
 @api.route('/users/<int:id>/timeline/')
+@read_only
 def get_user_followed_posts(id):
     user = User.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
     per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
-    pagination = user.followed_posts.paginate(page,
-                                              per_page=per_page,
-                                              error_out=False)
+    pagination = paginate(user.followed_posts, per_page, Post.timestamp,
+                          Post.id)
     posts = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_posts', page=page-1)
-    next = None
-    if pagination.has_next:
-        next = url_for('api.get_posts', page=page+1)
-    return jsonify({'posts': [post.to_json() for post in posts],
-                    'prev_url': prev,
-                    'next_url': next,
-                    'count': pagination.total})
\ No newline at end of file
+    json_posts = {'posts': [post.to_json() for post in posts]}
+    json_posts.update(pagination_json(pagination,
+                                      'api.get_user_followed_posts', id=id))
+    return jsonify(json_posts)
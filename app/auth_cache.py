@@ -0,0 +1,163 @@
+"""Caches for the API authentication path.
+
+Verified tokens are remembered by their SHA-256 digest together with the
+user id and the token expiry, so a repeated token skips the signature
+check. Users are kept as detached snapshots for
+FLASKY_USER_SNAPSHOT_TTL seconds and merged into the request session
+without a query.
+
+When FLASKY_CREDENTIAL_CACHE_TTL is set, successful email and password
+checks of HTTP Basic auth are remembered for that many seconds as well,
+so a repeated login skips the password hash. Entries are keyed by an
+HMAC of the credentials under a key that never leaves the process, and
+hold only the user id and the password hash that was checked.
+
+Committing a change to a user's password, email, role or confirmation
+drops that user's snapshot, tokens and credentials in this process.
+Other processes pick the change up when their entries expire.
+"""
+import hashlib
+import hmac
+import os
+import time
+
+from flask import current_app
+from sqlalchemy.orm import joinedload, object_session
+
+from .cache import LRUCache
+
+INVALIDATE_KEY = 'auth_cache_invalidate'
+
+
+class AuthCacheState:
+    def __init__(self, config):
+        self.tokens = LRUCache(max_entries=config['FLASKY_TOKEN_CACHE_SIZE'])
+        self.users = LRUCache(max_entries=config['FLASKY_TOKEN_CACHE_SIZE'],
+                              ttl=config['FLASKY_USER_SNAPSHOT_TTL'])
+        self.credentials = None
+        if config['FLASKY_CREDENTIAL_CACHE_TTL']:
+            self.credentials = LRUCache(
+                max_entries=config['FLASKY_TOKEN_CACHE_SIZE'],
+                ttl=config['FLASKY_CREDENTIAL_CACHE_TTL'])
+        self.credential_key = os.urandom(32)
+
+
+class AuthCache:
+    def init_app(self, app):
+        app.extensions['auth_cache'] = AuthCacheState(app.config)
+
+    @property
+    def state(self):
+        return current_app.extensions['auth_cache']
+
+    @staticmethod
+    def digest(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def token_user_id(self, token):
+        """The user id of a verified, unexpired token, if cached."""
+        key = self.digest(token)
+        entry = self.state.tokens.get(key)
+        if entry is None:
+            return None
+        user_id, expires = entry
+        if expires <= time.time():
+            self.state.tokens.pop(key)
+            return None
+        return user_id
+
+    def remember_token(self, token, user_id, expires):
+        self.state.tokens.set(self.digest(token), (user_id, expires))
+
+    def credential_digest(self, email, password):
+        message = '\0'.join([email, password]).encode('utf-8')
+        return hmac.new(self.state.credential_key, message,
+                        hashlib.sha256).digest()
+
+    def verify_credentials(self, email, password):
+        """The user for an email and password, or None if they don't match.
+
+        Falls back to the password hash check on a cache miss or when the
+        credential cache is disabled.
+        """
+        from .models import User
+        credentials = self.state.credentials
+        if credentials is not None:
+            key = self.credential_digest(email, password)
+            entry = credentials.get(key)
+            if entry is not None:
+                user = self.load_user(entry[0])
+                if user is not None and user.email == email and \
+                        user.password_hash == entry[1]:
+                    return user
+                credentials.pop(key)
+        user = User.query.filter_by(email=email).first()
+        if user is None or not user.verify_password(password):
+            return None
+        if credentials is not None:
+            credentials.set(key, (user.id, user.password_hash))
+        return user
+
+    def stats(self):
+        state = self.state
+        stats = {'tokens': state.tokens.stats(),
+                 'users': state.users.stats()}
+        if state.credentials is not None:
+            stats['credentials'] = state.credentials.stats()
+        return stats
+
+    def load_user(self, user_id):
+        """The user, from a snapshot when one is fresh."""
+        from . import db
+        from .models import User
+        # A user already in the session may carry newer, unsaved state.
+        user = db.session.identity_map.get(
+            db.session.identity_key(User, user_id))
+        if user is not None:
+            return user
+        snapshot = self.state.users.get(user_id)
+        if snapshot is None:
+            session = db.create_session({})()
+            try:
+                snapshot = (session.query(User)
+                            .options(joinedload(User.role))
+                            .get(user_id))
+            finally:
+                session.close()
+            if snapshot is None:
+                return None
+            self.state.users.set(user_id, snapshot)
+        return db.session.merge(snapshot, load=False)
+
+    def invalidate(self, user_ids):
+        """Forget users; None in user_ids drops every snapshot."""
+        if None in user_ids:
+            self.state.users.clear()
+        for user_id in user_ids:
+            self.state.users.pop(user_id)
+        self.state.tokens.discard_where(lambda entry: entry[0] in user_ids)
+        if self.state.credentials is not None:
+            self.state.credentials.discard_where(
+                lambda entry: entry[0] in user_ids)
+
+    @staticmethod
+    def on_user_changed(target, value, oldvalue, initiator):
+        """for db.event.listen method"""
+        session = object_session(target)
+        if target.id is not None and session is not None:
+            session.info.setdefault(INVALIDATE_KEY, set()).add(target.id)
+
+    @staticmethod
+    def on_role_changed(target, value, oldvalue, initiator):
+        """Role permissions are part of every snapshot of its users."""
+        session = object_session(target)
+        if target.id is not None and session is not None:
+            session.info.setdefault(INVALIDATE_KEY, set()).add(None)
+
+    def after_commit(self, session):
+        user_ids = session.info.pop(INVALIDATE_KEY, None)
+        if user_ids:
+            self.invalidate(user_ids)
+
+    def after_rollback(self, session):
+        session.info.pop(INVALIDATE_KEY, None)
@@ -0,0 +1,54 @@
+"""Background worker pool for work kept off the request path.
+
+Tasks run in a thread of a bounded pool, inside an application context
+of the app which submitted them.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from flask import current_app
+
+
+class TaskPool:
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='flasky-task')
+        self.futures = set()
+        self.lock = threading.Lock()
+
+    def track(self, future):
+        with self.lock:
+            self.futures.add(future)
+        future.add_done_callback(self.untrack)
+
+    def untrack(self, future):
+        with self.lock:
+            self.futures.discard(future)
+
+
+class BackgroundTasks:
+    def init_app(self, app):
+        app.extensions['tasks'] = TaskPool(app.config['FLASKY_TASK_WORKERS'])
+
+    def submit(self, fn, *args, **kwargs):
+        app = current_app._get_current_object()
+        pool = app.extensions['tasks']
+        future = pool.executor.submit(self._run, app, fn, args, kwargs)
+        pool.track(future)
+        return future
+
+    def wait(self, timeout=None):
+        """Block until every submitted task has finished."""
+        pool = current_app.extensions['tasks']
+        with pool.lock:
+            futures = list(pool.futures)
+        wait(futures, timeout=timeout)
+
+    @staticmethod
+    def _run(app, fn, args, kwargs):
+        with app.app_context():
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                app.logger.exception('Background task %s failed',
+                                     fn.__name__)
@@ -0,0 +1,311 @@
+"""Load test with a scripted traffic mix.
+
+Requests go through the Flask test client, or over HTTP to a threaded
+local server hit by several concurrent clients. The report gives the
+throughput and the p50/p95/p99 latency of every endpoint, in
+milliseconds, and can be compared against a saved baseline.
+
+The traffic logs in as accounts of its own, bench-member and
+bench-moderator, which are added for the run and removed after it
+together with their follows and the posts they wrote. The rest of the
+database is only read.
+"""
+import http.cookiejar
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from base64 import b64encode
+from json import dumps
+from urllib.parse import urlencode
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from . import db
+from .models import User, Role, Post
+
+# name, weight
+MIX = [
+    ('index', 30),
+    ('timeline', 15),
+    ('user', 15),
+    ('post', 15),
+    ('moderate', 5),
+    ('api_read', 15),
+    ('api_write', 5),
+]
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return None
+    rank = max(1, math.ceil(p / 100.0 * len(values)))
+    return values[rank - 1]
+
+
+class TestClient:
+    """Adapter over the Flask test client."""
+    def __init__(self, app):
+        self.client = app.test_client(use_cookies=True)
+
+    def request(self, method, url, data=None, json=None, headers=None):
+        response = self.client.open(url, method=method, data=data,
+                                    json=json, headers=headers)
+        response.close()
+        return response.status_code
+
+
+class HTTPClient:
+    """Adapter over urllib for a running server, keeping cookies."""
+    class NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            self.NoRedirect)
+
+    def request(self, method, url, data=None, json=None, headers=None):
+        headers = dict(headers or {})
+        body = None
+        if json is not None:
+            body = dumps(json).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urlencode(data).encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        request = urllib.request.Request(self.base_url + url, data=body,
+                                         headers=headers, method=method)
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class Session:
+    """One simulated visitor of each kind, sharing a client factory."""
+    def __init__(self, client_factory, dataset, rng):
+        self.rng = rng
+        self.dataset = dataset
+        self.anonymous = client_factory()
+        self.member = client_factory()
+        self.moderator = client_factory()
+        self.login(self.member, dataset['member'])
+        self.member.request('GET', '/followed')
+        self.login(self.moderator, dataset['moderator'])
+        self.api = client_factory()
+        credentials = b64encode((dataset['token'] + ':').encode('utf-8'))
+        self.api_headers = {
+            'Authorization': 'Basic ' + credentials.decode('utf-8'),
+            'Accept': 'application/json'}
+
+    @staticmethod
+    def login(client, email):
+        status = client.request('POST', '/auth/login', data={
+            'email': email, 'password': 'password'})
+        if status != 302:
+            raise RuntimeError(f'Could not log in {email}: {status}')
+
+    def index(self):
+        return self.anonymous.request('GET', '/')
+
+    def timeline(self):
+        return self.member.request('GET', '/')
+
+    def user(self):
+        username = self.rng.choice(self.dataset['usernames'])
+        return self.anonymous.request('GET', f'/user/{username}')
+
+    def post(self):
+        return self.anonymous.request(
+            'GET', f'/post/{self.rng.choice(self.dataset["post_ids"])}')
+
+    def moderate(self):
+        return self.moderator.request('GET', '/moderate')
+
+    def api_read(self):
+        return self.api.request('GET', '/api/v1/posts/',
+                                headers=self.api_headers)
+
+    def api_write(self):
+        return self.api.request('POST', '/api/v1/posts/',
+                                json={'body': 'Benchmark post'},
+                                headers=self.api_headers)
+
+
+# Domain of the accounts the benchmark adds, reserved for examples.
+ACCOUNT_DOMAIN = 'bench.example.com'
+
+
+def dataset(app, sample=200):
+    """Add the accounts the traffic mix uses and collect the ids it reads.
+
+    bench-member follows the same users as the member who follows the
+    most, so its timeline is as heavy as a real one.
+    """
+    with app.app_context():
+        remove_accounts(app)
+        busiest = User.query.order_by(User.followed_count.desc(),
+                                      User.id).first()
+        if busiest is None:
+            raise RuntimeError('The database has no users.')
+        moderator = User(email=f'bench-moderator@{ACCOUNT_DOMAIN}',
+                         username='bench-moderator', password='password',
+                         confirmed=True,
+                         role=Role.query.filter_by(name='Moderator').first())
+        member = User(email=f'bench-member@{ACCOUNT_DOMAIN}',
+                      username='bench-member', password='password',
+                      confirmed=True)
+        db.session.add_all([moderator, member])
+        for follow in busiest.followed:
+            if follow.followed_id != busiest.id:
+                member.follow(follow.followed)
+        db.session.commit()
+        return {
+            'moderator': moderator.email,
+            'member': member.email,
+            'token': member.generate_auth_token(expiration=24 * 3600),
+            'usernames': [name for name, in db.session.query(User.username)
+                          .order_by(User.id).limit(sample)],
+            'post_ids': [id for id, in db.session.query(Post.id)
+                         .order_by(Post.id.desc()).limit(sample)],
+        }
+
+
+def remove_accounts(app):
+    """Delete the benchmark accounts, their follows and their posts."""
+    with app.app_context():
+        accounts = User.query.filter(
+            User.email.like(f'%@{ACCOUNT_DOMAIN}')).all()
+        if not accounts:
+            return
+        for post in Post.query.filter(
+                Post.author_id.in_([user.id for user in accounts])).all():
+            db.session.delete(post)
+        for user in accounts:
+            db.session.delete(user)
+        db.session.commit()
+
+
+class Benchmark:
+    def __init__(self, app, requests=1000, concurrency=1, server=False,
+                 seed=0):
+        self.app = app
+        self.requests = requests
+        self.concurrency = concurrency
+        self.server = server
+        self.seed = seed
+        self.timings = {name: [] for name, weight in MIX}
+        self.errors = {name: 0 for name, weight in MIX}
+        self.failures = []
+        self.lock = threading.Lock()
+
+    def run(self):
+        data = dataset(self.app)
+        try:
+            return self.send_traffic(data)
+        finally:
+            remove_accounts(self.app)
+
+    def send_traffic(self, data):
+        httpd = None
+        if self.server:
+            httpd = make_server('127.0.0.1', 0, self.app, threaded=True,
+                                request_handler=QuietHandler)
+            threading.Thread(target=httpd.serve_forever, daemon=True).start()
+            base_url = f'http://127.0.0.1:{httpd.server_port}'
+            client_factory = lambda: HTTPClient(base_url)
+        else:
+            client_factory = lambda: TestClient(self.app)
+        try:
+            workers = [threading.Thread(
+                target=self.worker,
+                args=(client_factory, data, random.Random(self.seed + i),
+                      self.requests // self.concurrency +
+                      (i < self.requests % self.concurrency)))
+                for i in range(self.concurrency)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            if httpd is not None:
+                httpd.shutdown()
+        if self.failures:
+            raise self.failures[0]
+        return self.report(elapsed)
+
+    def worker(self, *args):
+        try:
+            self.send(*args)
+        except Exception as e:
+            self.failures.append(e)
+
+    def send(self, client_factory, data, rng, count):
+        session = Session(client_factory, data, rng)
+        names = [name for name, weight in MIX]
+        weights = [weight for name, weight in MIX]
+        timings = {name: [] for name in names}
+        errors = dict.fromkeys(names, 0)
+        for name in rng.choices(names, weights=weights, k=count):
+            start = time.perf_counter()
+            status = getattr(session, name)()
+            timings[name].append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                errors[name] += 1
+        with self.lock:
+            for name in names:
+                self.timings[name].extend(timings[name])
+                self.errors[name] += errors[name]
+
+    def report(self, elapsed):
+        endpoints = {}
+        total = 0
+        for name, timings in self.timings.items():
+            timings.sort()
+            total += len(timings)
+            endpoints[name] = {
+                'requests': len(timings),
+                'errors': self.errors[name],
+                'p50': percentile(timings, 50),
+                'p95': percentile(timings, 95),
+                'p99': percentile(timings, 99),
+            }
+        return {
+            'mode': 'server' if self.server else 'test_client',
+            'concurrency': self.concurrency,
+            'requests': total,
+            'seconds': elapsed,
+            'throughput': total / elapsed if elapsed else None,
+            'endpoints': endpoints,
+        }
+
+
+def compare(report, baseline, tolerance=0.1):
+    """Endpoints whose p95 regressed by more than ``tolerance``."""
+    regressions = {}
+    for name, current in report['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before or not before.get('p95') or current['p95'] is None:
+            continue
+        ratio = current['p95'] / before['p95']
+        if ratio > 1 + tolerance:
+            regressions[name] = {'baseline_p95': before['p95'],
+                                 'p95': current['p95'],
+                                 'ratio': ratio}
+    return regressions
@@ -0,0 +1,79 @@
+"""Small in-process caches."""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe LRU mapping bounded by entry count and total size.
+
+    ``size`` of an entry is given by the caller, e.g. its length in
+    bytes. Entries also expire ``ttl`` seconds after they were stored.
+    """
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl is not None and \
+                    time.monotonic() > entry[2]:
+                self._discard(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size=1):
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires = None
+        if self.ttl is not None:
+            expires = time.monotonic() + self.ttl
+        with self.lock:
+            self._discard(key)
+            self.entries[key] = (value, size, expires)
+            self.bytes += size
+            while ((self.max_entries is not None and
+                    len(self.entries) > self.max_entries) or
+                   (self.max_bytes is not None and
+                    self.bytes > self.max_bytes)):
+                self._discard(next(iter(self.entries)))
+
+    def pop(self, key):
+        with self.lock:
+            self._discard(key)
+
+    def discard_where(self, predicate):
+        """Drop every entry whose value matches the predicate."""
+        with self.lock:
+            for key in [key for key, entry in self.entries.items()
+                        if predicate(entry[0])]:
+                self._discard(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'entries': len(self.entries),
+                    'bytes': self.bytes}
+
+    def _discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
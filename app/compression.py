@@ -0,0 +1,169 @@
+"""gzip and brotli compression of responses.
+
+Responses of the FLASKY_COMPRESS_MIMETYPES are compressed when the
+client's Accept-Encoding allows it. Responses smaller than
+FLASKY_COMPRESS_MIN_SIZE are not compressed. brotli is used when the
+``brotli`` package is installed and the client prefers it, or likes it
+as much as gzip.
+Streamed responses, such as the API export, are compressed chunk by
+chunk, and each chunk is flushed so the client still gets rows as they
+are read. A strong ETag is made weak on a compressed response, since
+the bytes are no longer the ones it was computed for.
+
+Static files are not compressed per request. ``flask assets compress``
+writes a ``.br`` and a ``.gz`` copy next to each file in the static
+folder, and the static view sends the one the client accepts. A copy
+older than its file is ignored.
+"""
+import mimetypes
+import os
+import zlib
+
+from flask import current_app, request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Suffix of the precompressed copy of a static file, per coding.
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + \
+            compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def brotli_stream(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+STREAMS = {'br': brotli_stream, 'gzip': gzip_stream}
+
+
+def encoded(body, charset):
+    """The chunks of a streamed body as bytes, closing it after."""
+    try:
+        for chunk in body:
+            yield chunk.encode(charset) if isinstance(chunk, str) else chunk
+    finally:
+        close = getattr(body, 'close', None)
+        if close is not None:
+            close()
+
+
+def codings():
+    """The codings the app can compress with, best first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def accepted(offered):
+    """The offered codings the client accepts, in its order of preference.
+
+    Ties keep the order of offered.
+    """
+    accept = request.accept_encodings
+    return sorted((coding for coding in offered if accept[coding] > 0),
+                  key=lambda coding: -accept[coding])
+
+
+def precompress(folder, level=9, quality=11):
+    """Write the compressed copies of the static files under folder.
+
+    Files that would not shrink are left alone. Returns the paths
+    written.
+    """
+    compressible = current_app.config['FLASKY_COMPRESS_MIMETYPES']
+    written = []
+    for root, _, names in os.walk(folder):
+        for name in sorted(names):
+            if name.endswith(tuple(SUFFIXES.values())) or \
+                    mimetypes.guess_type(name)[0] not in compressible:
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            for coding in codings():
+                compressed = b''.join(STREAMS[coding](
+                    [data], quality if coding == 'br' else level))
+                if len(compressed) >= len(data):
+                    continue
+                with open(path + SUFFIXES[coding], 'wb') as f:
+                    f.write(compressed)
+                written.append(path + SUFFIXES[coding])
+    return written
+
+
+class Compress:
+    def init_app(self, app):
+        # after_request functions run last registered first; initialize
+        # this before the extensions whose hooks change the response.
+        app.after_request(self.compress)
+        app.view_functions['static'] = self.send_static_file
+
+    @staticmethod
+    def compress(response):
+        config = current_app.config
+        if response.status_code != 200 or response.direct_passthrough or \
+                response.mimetype not in config['FLASKY_COMPRESS_MIMETYPES']:
+            return response
+        response.vary.add('Accept-Encoding')
+        if 'Content-Encoding' in response.headers or \
+                response.cache_control.no_transform:
+            return response
+        preferred = accepted(codings())
+        if not preferred:
+            return response
+        coding = preferred[0]
+        level = config['FLASKY_COMPRESS_BROTLI_QUALITY'] if coding == 'br' \
+            else config['FLASKY_COMPRESS_LEVEL']
+        if response.is_streamed:
+            response.response = STREAMS[coding](
+                encoded(response.response, response.charset), level)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < config['FLASKY_COMPRESS_MIN_SIZE']:
+                return response
+            response.set_data(b''.join(STREAMS[coding]([data], level)))
+        response.headers['Content-Encoding'] = coding
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    @staticmethod
+    def send_static_file(filename):
+        """The static view, sending a precompressed copy where one fits."""
+        folder = current_app.static_folder
+        max_age = current_app.get_send_file_max_age(filename)
+        path = safe_join(folder, filename)
+        for coding in accepted(SUFFIXES):
+            copy = path and path + SUFFIXES[coding]
+            if copy and os.path.isfile(copy) and os.path.isfile(path) and \
+                    os.path.getmtime(copy) >= os.path.getmtime(path):
+                response = send_from_directory(
+                    folder, filename + SUFFIXES[coding],
+                    mimetype=mimetypes.guess_type(filename)[0],
+                    cache_timeout=max_age)
+                response.headers['Content-Encoding'] = coding
+                break
+        else:
+            response = send_from_directory(folder, filename,
+                                           cache_timeout=max_age)
+        if response.mimetype in \
+                current_app.config['FLASKY_COMPRESS_MIMETYPES']:
+            response.vary.add('Accept-Encoding')
+        return response
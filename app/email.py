@@ -1,22 +1,17 @@
-
-from threading import Thread
 from flask import current_app, render_template
-from flask_mail import Message, Mail
-from . import mail
-
-
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+from . import db, outbox
+from .models import OutboxMessage
 
 
 def send_email(to, subject, template, **kwargs):
+    """Queue an email in the outbox; its workers deliver it."""
     app = current_app._get_current_object()
-    msg = Message(app.config['FLASKY_MAIL_SUBJECT_PREFIX'] + ' ' + subject,
-                  sender=app.config['FLASKY_MAIL_SENDER'], recipients=[to])
-    msg.body = render_template(template + '.txt', **kwargs)
-    msg.html = render_template(template + '.html', **kwargs)
-    tr = Thread(target=send_async_email, args=(app, msg))
-    tr.start()
-    # mail.send(msg)
-    return tr
+    message = OutboxMessage(
+        subject=app.config['FLASKY_MAIL_SUBJECT_PREFIX'] + ' ' + subject,
+        sender=app.config['FLASKY_MAIL_SENDER'], recipient=to,
+        body=render_template(template + '.txt', **kwargs),
+        html=render_template(template + '.html', **kwargs))
+    db.session.add(message)
+    db.session.commit()
+    outbox.notify()
+    return message
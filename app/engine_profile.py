@@ -0,0 +1,139 @@
+"""Database engine profile: connection pool settings and SQLite pragmas.
+
+The settings go into SQLALCHEMY_ENGINE_OPTIONS before Flask-SQLAlchemy
+creates the engine. Options set there explicitly still win.
+
+- SQLite database file: connections are kept in a QueuePool sized by
+  the FLASKY_DB_POOL_* settings, instead of the NullPool that
+  Flask-SQLAlchemy picks. Each new connection runs
+  FLASKY_SQLITE_PRAGMAS, as they were when the options were filled in,
+  with or without an app context. WAL journaling is among them, so
+  readers no longer wait for a writer, or a writer for readers.
+- In-memory SQLite: the pool stays a single shared connection.
+- Any other database: it gets the same pool settings, plus pre-ping.
+
+``report()`` reads back what a connection actually got. It is logged on
+the first request, and ``flask db-profile`` prints it. A pragma the
+database would not take, such as WAL on a network filesystem, shows up
+there as a mismatch.
+"""
+import sqlite3
+
+from flask import current_app
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_recycle', 'pool_timeout',
+                'pool_pre_ping')
+# How SQLite reads back the pragmas that take names.
+SYNCHRONOUS = {0: 'off', 1: 'normal', 2: 'full', 3: 'extra'}
+
+
+class EngineProfile:
+    def init_app(self, app):
+        # The options as given, for configure() to start again from.
+        app.extensions['engine_profile'] = dict(
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+        self.configure(app)
+        app.before_first_request(self.log_report)
+
+    @staticmethod
+    def configure(app):
+        """Fill in the engine options for the app's database URI.
+
+        Call again if the URI changes before the engine is created.
+        """
+        options = dict(app.extensions['engine_profile'])
+        pool = {'pool_size': app.config['FLASKY_DB_POOL_SIZE'],
+                'max_overflow': app.config['FLASKY_DB_MAX_OVERFLOW'],
+                'pool_recycle': app.config['FLASKY_DB_POOL_RECYCLE'],
+                'pool_timeout': app.config['FLASKY_DB_POOL_TIMEOUT']}
+        url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        if url.get_backend_name() == 'sqlite':
+            # Listens on this engine's pool only, with this app's pragmas.
+            listener = EngineProfile.pragma_listener(
+                app.config['FLASKY_SQLITE_PRAGMAS'])
+            options['pool_events'] = list(options.get('pool_events', ())) + \
+                [(listener, 'connect')]
+        if url.get_backend_name() != 'sqlite':
+            pool['pool_pre_ping'] = True
+        elif url.database in (None, '', ':memory:'):
+            # Flask-SQLAlchemy keeps the one connection in a StaticPool.
+            pool = {}
+        else:
+            options.setdefault('poolclass', QueuePool)
+            connect_args = dict(options.get('connect_args', {}))
+            # Pooled connections are handed from thread to thread.
+            connect_args.setdefault('check_same_thread', False)
+            options['connect_args'] = connect_args
+        for key, value in pool.items():
+            options.setdefault(key, value)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    @staticmethod
+    def pragma_listener(pragmas):
+        """A pool connect listener running ``pragmas`` on each new SQLite
+        connection."""
+        pragmas = dict(pragmas)
+
+        def set_pragmas(connection, record):
+            if not isinstance(connection, sqlite3.Connection):
+                return
+            cursor = connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+            cursor.close()
+        return set_pragmas
+
+    def report(self):
+        """The pool in use and its settings and, on SQLite, each pragma as
+        configured and as in effect on a pooled connection."""
+        from . import db
+        engine = db.engine
+        options = current_app.config['SQLALCHEMY_ENGINE_OPTIONS']
+        report = {'dialect': engine.dialect.name,
+                  'database': repr(engine.url),
+                  'pool': type(engine.pool).__name__}
+        if isinstance(engine.pool, QueuePool):
+            report.update((key, options[key]) for key in POOL_OPTIONS
+                          if key in options)
+        if engine.dialect.name == 'sqlite':
+            pragmas = {}
+            # Read on the DBAPI connection, out of sight of the query
+            # counters and the request profiler.
+            connection = engine.raw_connection()
+            try:
+                cursor = connection.cursor()
+                for name, value in \
+                        current_app.config['FLASKY_SQLITE_PRAGMAS'].items():
+                    row = cursor.execute(f'PRAGMA {name}').fetchone()
+                    effective = row[0] if row else None
+                    if name == 'synchronous':
+                        effective = SYNCHRONOUS.get(effective, effective)
+                    pragmas[name] = {'configured': value,
+                                     'effective': effective}
+                cursor.close()
+            finally:
+                connection.close()
+            report['pragmas'] = pragmas
+        return report
+
+    @staticmethod
+    def mismatches(report):
+        """Pragmas the database did not take as configured."""
+        return sorted(name for name, pragma in report.get('pragmas', {})
+                      .items() if str(pragma['effective']).lower() !=
+                      str(pragma['configured']).lower())
+
+    def log_report(self):
+        from . import db
+        report = self.report()
+        current_app.logger.info('Database profile: %r', report)
+        mismatches = self.mismatches(report)
+        # An in-memory database has no journal or file to map.
+        if mismatches and db.engine.url.database not in (None, '',
+                                                         ':memory:'):
+            current_app.logger.warning(
+                'Database did not take pragmas as configured: %s',
+                ', '.join(f'{name}={report["pragmas"][name]["effective"]}'
+                          for name in mismatches))
@@ -1,9 +1,17 @@
 """Fake testing data"""
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from hashlib import md5
+from itertools import accumulate
 from random import randint
 from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
 from faker import Faker
-from . import db
-from .models import User, Post
+from . import db, search
+from .models import (User, Post, Comment, Follow, Role, TimelineEntry,
+                     repair_counters)
 
 
 def users(count=100):
@@ -28,11 +36,201 @@ def users(count=100):
 
 def posts(count=100):
     fake = Faker()
-    user_count = User.query.count()
+    user_ids = [id for id, in db.session.query(User.id)]
     for i in range(count):
-        u = User.query.offset(randint(0, user_count - 1)).first()
         p = Post(body=fake.text(),
                  timestamp=fake.past_date(),
-                 author=u)
+                 author_id=user_ids[randint(0, len(user_ids) - 1)])
         db.session.add(p)
-    db.session.commit()
\ No newline at end of file
+    db.session.commit()
+
+
+class Progress:
+    """Prints rows done and rows/sec for one table."""
+    def __init__(self, label, total, echo):
+        self.label = label
+        self.total = total
+        self.echo = echo
+        self.done = 0
+        self.start = time.monotonic()
+
+    def update(self, rows):
+        self.done += rows
+        elapsed = time.monotonic() - self.start
+        rate = self.done / elapsed if elapsed else 0
+        done = self.done if self.total is None else \
+            f'{self.done}/{self.total}'
+        self.echo(f'{self.label}: {done} rows, {rate:.0f} rows/sec')
+
+
+# Default reference time of generated timestamps.
+EPOCH = datetime(2024, 1, 1)
+
+
+class BulkGenerator:
+    """Seed a large dataset with batched Core inserts.
+
+    The rows bypass the mapper events, so the denormalized counters and
+    the timelines are computed with set based statements at the end.
+    Timestamps fall in the ``days`` before ``now``, so equal seeds and
+    reference times give equal datasets.
+    """
+    def __init__(self, seed=0, batch_size=5000, workers=None,
+                 password='password', days=365, now=EPOCH, echo=print):
+        self.rng = random.Random(seed)
+        self.fake = Faker()
+        self.fake.seed_instance(seed)
+        self.batch_size = batch_size
+        self.workers = workers
+        # One hash for every generated account.
+        self.password_hash = generate_password_hash(password)
+        self.now = now
+        self.seconds = days * 24 * 3600
+        self.echo = echo
+        self.user_ids = []
+
+    def run(self, users=1000, posts=10000, comments=10000, follows=20):
+        if self.workers == 0:
+            self.pool = None
+            self.generate(users, posts, comments, follows)
+            return
+        with ProcessPoolExecutor(self.workers) as self.pool:
+            self.generate(users, posts, comments, follows)
+
+    def generate(self, users, posts, comments, follows):
+        self.add_users(users)
+        self.add_follows(follows)
+        # Fan-out decisions below read the follower counts.
+        repair_counters()
+        first_post = self.add_posts(posts)
+        self.add_comments(comments, first_post, posts)
+        repair_counters()
+        start = time.monotonic()
+        TimelineEntry.fan_out_since(db.session.connection(), first_post)
+        db.session.commit()
+        self.echo(f'timelines: {time.monotonic() - start:.1f}s')
+        # The rows went in as Core inserts, which the index never saw.
+        start = time.monotonic()
+        search.rebuild()
+        self.echo(f'search index: {time.monotonic() - start:.1f}s')
+
+    def timestamp(self):
+        return self.now - timedelta(seconds=self.rng.randrange(self.seconds))
+
+    def next_id(self, model):
+        return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+    def insert(self, model, rows, progress):
+        db.session.execute(model.__table__.insert(), rows)
+        db.session.commit()
+        progress.update(len(rows))
+
+    def render(self, render, bodies):
+        if self.pool is None:
+            return [render(body) for body in bodies]
+        chunksize = max(1, len(bodies) // (4 * (self.workers or 4)))
+        return list(self.pool.map(render, bodies, chunksize=chunksize))
+
+    def batches(self, count):
+        for start in range(0, count, self.batch_size):
+            yield range(start, min(count, start + self.batch_size))
+
+    def add_users(self, count):
+        fake = self.fake
+        role_id = Role.query.filter_by(default=True).first().id
+        first = self.next_id(User)
+        progress = Progress('users', count, self.echo)
+        for batch in self.batches(count):
+            rows = []
+            for i in batch:
+                id = first + i
+                username = f'{fake.user_name()}{id}'
+                email = f'{username}@{fake.free_email_domain()}'
+                member_since = self.timestamp()
+                rows.append({
+                    'id': id, 'email': email, 'username': username,
+                    'role_id': role_id, 'confirmed': True,
+                    'password_hash': self.password_hash,
+                    'name': fake.name(), 'location': fake.city(),
+                    'about_me': fake.sentence(),
+                    'member_since': member_since, 'last_seen': member_since,
+                    'avatar_hash': md5(email.lower().encode(
+                        'utf-8')).hexdigest(),
+                    'post_count': 0, 'follower_count': 0,
+                    'followed_count': 0})
+            self.insert(User, rows, progress)
+        self.user_ids = list(range(first, first + count))
+
+    def add_follows(self, average):
+        """Everyone follows themselves plus a power-law number of others.
+
+        Targets are drawn by Zipf popularity, so a few users collect
+        most followers as on a real social graph.
+        """
+        ids = self.user_ids
+        if not ids:
+            return
+        popular = ids[:]
+        self.rng.shuffle(popular)
+        weights = list(accumulate(1.0 / rank
+                                  for rank in range(1, len(popular) + 1)))
+        alpha = 2.0
+        scale = average * (alpha - 1) / alpha
+        progress = Progress('follows', None, self.echo)
+        rows = []
+        for follower in ids:
+            degree = min(len(ids) - 1,
+                         int(scale * self.rng.paretovariate(alpha)))
+            followed = {follower}
+            for _ in range(4):
+                if len(followed) > degree:
+                    break
+                followed.update(self.rng.choices(
+                    popular, cum_weights=weights,
+                    k=degree + 1 - len(followed)))
+            rows.extend({'follower_id': follower, 'followed_id': id,
+                         'timestamp': self.timestamp()}
+                        for id in sorted(followed))
+            if len(rows) >= self.batch_size:
+                self.insert(Follow, rows, progress)
+                rows = []
+        if rows:
+            self.insert(Follow, rows, progress)
+
+    def add_posts(self, count):
+        first = self.next_id(Post)
+        progress = Progress('posts', count, self.echo)
+        for batch in self.batches(count):
+            bodies = [self.fake.text() for _ in batch]
+            htmls = self.render(Post.render, bodies)
+            rows = []
+            for i, body, html in zip(batch, bodies, htmls):
+                timestamp = self.timestamp()
+                rows.append({'id': first + i, 'body': body, 'body_html': html,
+                             'timestamp': timestamp, 'updated_at': timestamp,
+                             'author_id': self.rng.choice(self.user_ids),
+                             'comment_count': 0})
+            self.insert(Post, rows, progress)
+        return first
+
+    def add_comments(self, count, first_post, posts):
+        if not posts:
+            return
+        progress = Progress('comments', count, self.echo)
+        for batch in self.batches(count):
+            bodies = [self.fake.sentence() for _ in batch]
+            htmls = self.render(Comment.render, bodies)
+            rows = []
+            for body, html in zip(bodies, htmls):
+                timestamp = self.timestamp()
+                author_id = self.rng.choice(self.user_ids)
+                post_id = first_post + self.rng.randrange(posts)
+                rows.append({'body': body, 'body_html': html,
+                             'timestamp': timestamp, 'updated_at': timestamp,
+                             'disabled': False, 'author_id': author_id,
+                             'post_id': post_id})
+            self.insert(Comment, rows, progress)
+
+
+def bulk(users=1000, posts=10000, comments=10000, follows=20, **kwargs):
+    BulkGenerator(**kwargs).run(users, posts, comments, follows)
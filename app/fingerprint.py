@@ -0,0 +1,98 @@
+"""Static files under content-hashed names, cached by clients for good.
+
+``flask assets build`` copies each static file to
+``dist/<name>.<hash>.<ext>``, where the hash is taken from the file's
+bytes. It writes ``dist/manifest.json`` mapping each original name to
+its copy, then compresses the copies. Copies from earlier builds are
+kept, so pages cached with the old names still find their files.
+
+The manifest is read once, when the app starts. From then on
+``url_for('static', filename='styles.css')`` gives the URL of the
+hashed copy. A hashed URL always serves the same bytes, so it is sent
+as ``public, immutable`` with a max-age of FLASKY_ASSETS_MAX_AGE. Run
+the build again, and restart, after changing a static file. Without a
+manifest the original names are used.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from flask import current_app
+
+BUILD_DIR = 'dist'
+MANIFEST = 'manifest.json'
+# Hex digits of the content hash put into the file name.
+HASH_LENGTH = 12
+
+
+def build(folder):
+    """Write the hashed copies of the files in a static folder and their
+    manifest. Returns the manifest."""
+    output = os.path.join(folder, BUILD_DIR)
+    manifest = {}
+    for root, dirs, names in os.walk(folder):
+        dirs[:] = sorted(name for name in dirs
+                         if os.path.join(root, name) != output)
+        for name in sorted(names):
+            # Compressed copies are written by the compress step.
+            if name.endswith(('.gz', '.br')):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+            base, ext = os.path.splitext(os.path.relpath(path, folder))
+            hashed = os.path.join(BUILD_DIR, f'{base}.{digest}{ext}')
+            target = os.path.join(folder, hashed)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, 'wb') as f:
+                    f.write(data)
+            manifest[os.path.relpath(path, folder).replace(os.sep, '/')] = \
+                hashed.replace(os.sep, '/')
+    os.makedirs(output, exist_ok=True)
+    # Written aside and renamed, so a starting app never reads half of it.
+    fd, temp = tempfile.mkstemp(dir=output)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temp, os.path.join(output, MANIFEST))
+    return manifest
+
+
+class Assets:
+    def init_app(self, app):
+        self.load(app)
+        app.url_defaults(self.hashed_url)
+        # Wraps the static view, so initialize this after compress.
+        send_static_file = app.view_functions['static']
+
+        def send_hashed_static_file(filename):
+            response = send_static_file(filename)
+            if filename in current_app.extensions['assets'][1]:
+                max_age = current_app.config['FLASKY_ASSETS_MAX_AGE']
+                response.cache_control.public = True
+                response.cache_control.max_age = max_age
+                response.cache_control.immutable = True
+                response.expires = time.time() + max_age
+            return response
+        app.view_functions['static'] = send_hashed_static_file
+
+    @staticmethod
+    def load(app):
+        """Read the manifest of the static folder; call again after a
+        build to pick it up without a restart."""
+        path = os.path.join(app.static_folder, BUILD_DIR, MANIFEST)
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {}
+        app.extensions['assets'] = (manifest, frozenset(manifest.values()))
+
+    @staticmethod
+    def hashed_url(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = current_app.extensions['assets'][0].get(
+                values['filename'], values['filename'])
@@ -0,0 +1,156 @@
+"""In-process index of the follow graph.
+
+For each user the ids they follow are kept as a sorted ``array('i')``,
+loaded lazily from the follows table, so ``is_following`` and bulk
+membership checks are a binary search instead of a query. Follow
+inserts and deletes are collected during the flush and patched into the
+index once the transaction commits.
+
+The index holds at most FLASKY_FOLLOW_INDEX_MAX_EDGES ids; the least
+recently used users are evicted first. Entries also expire after
+FLASKY_FOLLOW_INDEX_TTL seconds, which bounds how stale the index can be
+after another worker process changed the graph.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy.orm import object_session
+
+PENDING_KEY = 'follow_graph_pending'
+
+
+def contains(ids, user_id):
+    i = bisect_left(ids, user_id)
+    return i < len(ids) and ids[i] == user_id
+
+
+class FollowIndex:
+    def __init__(self, max_edges, ttl):
+        self.max_edges = max_edges
+        self.ttl = ttl
+        self.edges = 0
+        self.version = 0
+        self.followed = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.followed.get(user_id)
+            if entry is None:
+                return None, self.version
+            loaded_at, ids = entry
+            if time.monotonic() - loaded_at > self.ttl:
+                self._evict(user_id)
+                return None, self.version
+            self.followed.move_to_end(user_id)
+            return ids, self.version
+
+    def put(self, user_id, ids, version):
+        with self.lock:
+            # A commit was applied while loading, the rows may be stale.
+            if version != self.version or len(ids) > self.max_edges:
+                return
+            self._evict(user_id)
+            self.followed[user_id] = (time.monotonic(), ids)
+            self.edges += len(ids)
+            while self.edges > self.max_edges:
+                self._evict(next(iter(self.followed)))
+
+    def apply(self, changes):
+        with self.lock:
+            self.version += 1
+            for follower_id, followed_id, delta in changes:
+                entry = self.followed.get(follower_id)
+                if entry is None:
+                    continue
+                ids = entry[1]
+                present = contains(ids, followed_id)
+                if delta > 0 and not present:
+                    insort(ids, followed_id)
+                    self.edges += 1
+                elif delta < 0 and present:
+                    ids.remove(followed_id)
+                    self.edges -= 1
+
+    def clear(self):
+        with self.lock:
+            self.version += 1
+            self.followed.clear()
+            self.edges = 0
+
+    def _evict(self, user_id):
+        entry = self.followed.pop(user_id, None)
+        if entry is not None:
+            self.edges -= len(entry[1])
+
+
+class FollowGraph:
+    def init_app(self, app):
+        app.extensions['follow_graph'] = FollowIndex(
+            app.config['FLASKY_FOLLOW_INDEX_MAX_EDGES'],
+            app.config['FLASKY_FOLLOW_INDEX_TTL'])
+
+    @property
+    def index(self):
+        return current_app.extensions['follow_graph']
+
+    def followed_ids(self, user_id):
+        """Sorted ids followed by the user, loaded on first use."""
+        ids, version = self.index.get(user_id)
+        if ids is None:
+            from .models import Follow
+            rows = (Follow.query.with_entities(Follow.followed_id)
+                    .filter_by(follower_id=user_id)
+                    .order_by(Follow.followed_id))
+            ids = array('i', [followed_id for followed_id, in rows])
+            self.index.put(user_id, ids, version)
+        return ids
+
+    def is_following(self, follower_id, followed_id):
+        if self._session_changed():
+            from .models import Follow
+            return Follow.query.filter_by(
+                follower_id=follower_id,
+                followed_id=followed_id).first() is not None
+        return contains(self.followed_ids(follower_id), followed_id)
+
+    def following_among(self, follower_id, user_ids):
+        """The subset of user_ids which follower_id follows."""
+        if self._session_changed():
+            from .models import Follow
+            rows = (Follow.query.with_entities(Follow.followed_id)
+                    .filter(Follow.follower_id == follower_id)
+                    .filter(Follow.followed_id.in_(list(user_ids))))
+            return {followed_id for followed_id, in rows}
+        ids = self.followed_ids(follower_id)
+        return {user_id for user_id in user_ids if contains(ids, user_id)}
+
+    def _session_changed(self):
+        """Uncommitted follows in this session are not in the index."""
+        from . import db
+        from .models import Follow
+        session = db.session()
+        if session.info.get(PENDING_KEY):
+            return True
+        return any(isinstance(obj, Follow)
+                   for obj in list(session.new) + list(session.deleted))
+
+    @staticmethod
+    def follow_listener(delta):
+        """Mapper event listener queueing a change until commit."""
+        def listener(mapper, connection, target):
+            pending = object_session(target).info.setdefault(PENDING_KEY, [])
+            pending.append((target.follower_id, target.followed_id, delta))
+        return listener
+
+    def after_commit(self, session):
+        changes = session.info.pop(PENDING_KEY, None)
+        if changes:
+            self.index.apply(changes)
+
+    def after_rollback(self, session):
+        session.info.pop(PENDING_KEY, None)
@@ -0,0 +1,56 @@
+"""Cache of rendered post and comment list items.
+
+The part of a list item that every viewer sees is rendered once and kept
+in an LRU cache bounded by FLASKY_FRAGMENT_CACHE_BYTES. Its key holds a
+version computed from everything the fragment shows, so an edited body,
+a renamed author, a new comment or a moderation decision produces a new
+key and the stale entry ages out. Viewer dependent controls are rendered
+on every request and spliced in at VIEWER_SLOT.
+"""
+from flask import current_app, render_template, request
+from jinja2 import Markup
+
+from .cache import LRUCache
+
+VIEWER_SLOT = '<!-- viewer -->'
+
+
+class FragmentCache:
+    def init_app(self, app):
+        app.extensions['fragment_cache'] = LRUCache(
+            max_bytes=app.config['FLASKY_FRAGMENT_CACHE_BYTES'])
+        app.add_template_global(self.post, 'post_fragment')
+        app.add_template_global(self.comment, 'comment_fragment')
+
+    @property
+    def cache(self):
+        return current_app.extensions['fragment_cache']
+
+    def post(self, post, viewer=''):
+        author = post.author
+        version = hash((post.body, post.body_html, post.timestamp,
+                        post.comment_count, author.username,
+                        author.avatar_hash))
+        return self.render('_post_fragment.html', ('post', post.id, version),
+                           viewer, post=post)
+
+    def comment(self, comment, viewer='', moderate=False):
+        author = comment.author
+        version = hash((comment.body, comment.body_html, comment.timestamp,
+                        comment.disabled, bool(moderate), author.username,
+                        author.avatar_hash))
+        return self.render('_comment_fragment.html',
+                           ('comment', comment.id, version), viewer,
+                           comment=comment, moderate=moderate)
+
+    def render(self, template, key, viewer, **context):
+        # Links and avatar urls depend on the scheme and host.
+        key += (request.host_url,)
+        parts = self.cache.get(key)
+        if parts is None:
+            html = render_template(template, **context)
+            parts = tuple(html.split(VIEWER_SLOT, 1))
+            if len(parts) == 1:
+                parts += ('',)
+            self.cache.set(key, parts, size=len(html))
+        return Markup(''.join([parts[0], str(viewer), parts[1]]))
@@ -0,0 +1,278 @@
+"""Full-text search over post and comment bodies.
+
+On SQLite the bodies are indexed in the FTS5 table ``search_index`` and
+results are ranked by bm25. Other databases fall back to a LIKE scan,
+which needs no index but reads every row. FLASKY_SEARCH_BACKEND picks
+'fts5' or 'like', or 'auto' for whichever the database supports.
+
+Both kinds of row share the index. The rowid of an entry is ``id * 2``
+for a post and ``id * 2 + 1`` for a comment. Mapper events keep the index
+current as rows are written, and disabled comments are left out.
+``rebuild()`` refills the index in bulk, for rows written with Core
+statements.
+"""
+import base64
+import binascii
+import json
+import re
+from collections import namedtuple
+
+from flask import current_app
+from jinja2 import Markup, escape
+from sqlalchemy import text
+
+KINDS = ('post', 'comment')
+# Snippet delimiters, swapped for <mark> after the text is escaped.
+OPEN, CLOSE = '\x02', '\x03'
+
+Hit = namedtuple('Hit', 'kind item score snippet')
+SearchPage = namedtuple('SearchPage', 'hits next_cursor')
+
+
+def index_key(kind, id):
+    return id * 2 + KINDS.index(kind)
+
+
+def split_key(key):
+    return KINDS[key % 2], key // 2
+
+
+def terms(query):
+    """The words of a user's query, safe to quote into MATCH."""
+    limit = current_app.config['FLASKY_SEARCH_MAX_TERMS']
+    return [word.lower() for word in re.findall(r'\w+', query)][:limit]
+
+
+def search_kinds(type):
+    """The kinds named by a ``type`` argument such as 'posts,comments'."""
+    names = (type or 'posts,comments').split(',')
+    return tuple(kind for kind in KINDS if kind + 's' in names)
+
+
+def highlight(snippet):
+    return Markup(str(escape(snippet)).replace(OPEN, '<mark>')
+                  .replace(CLOSE, '</mark>'))
+
+
+def encode_cursor(score, key):
+    data = json.dumps([score, key]).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (score, key), or None for a bad cursor."""
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        score, key = json.loads(data.decode('utf-8'))
+    except (binascii.Error, TypeError, ValueError):
+        return None
+    if not isinstance(score, (int, float)) or not isinstance(key, int):
+        return None
+    return score, key
+
+
+def kind_filter(kinds, column):
+    if set(kinds) >= set(KINDS):
+        return ''
+    return f' AND {column} % 2 = {KINDS.index(kinds[0])}'
+
+
+class FTS5Backend:
+    name = 'fts5'
+
+    def create(self, connection):
+        connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_index "
+            "USING fts5(body, tokenize='porter unicode61')")
+
+    def drop(self, connection):
+        connection.execute('DROP TABLE IF EXISTS search_index')
+
+    def index(self, connection, kind, id, body):
+        self.remove(connection, kind, id)
+        connection.execute(
+            text('INSERT INTO search_index (rowid, body) '
+                 'VALUES (:key, :body)'),
+            key=index_key(kind, id), body=body)
+
+    def remove(self, connection, kind, id):
+        connection.execute(text('DELETE FROM search_index WHERE rowid = :key'),
+                           key=index_key(kind, id))
+
+    def rebuild(self, connection):
+        self.create(connection)
+        connection.execute('DELETE FROM search_index')
+        connection.execute(
+            'INSERT INTO search_index (rowid, body) '
+            'SELECT id * 2, body FROM posts WHERE body IS NOT NULL')
+        connection.execute(
+            'INSERT INTO search_index (rowid, body) '
+            'SELECT id * 2 + 1, body FROM comment WHERE body IS NOT NULL '
+            'AND (disabled IS NULL OR disabled = 0)')
+        connection.execute(
+            "INSERT INTO search_index (search_index) VALUES ('optimize')")
+
+    def matches(self, connection, words, kinds, after, limit):
+        """(key, score, snippet) of the best matches after a cursor."""
+        match = ' '.join('"%s"' % word for word in words)
+        where = kind_filter(kinds, 'key')
+        params = {'match': match, 'limit': limit}
+        if after is not None:
+            where += ' AND (score > :score OR (score = :score AND key > :key))'
+            params.update(score=after[0], key=after[1])
+        rows = connection.execute(text(
+            'SELECT key, score FROM ('
+            'SELECT rowid AS key, bm25(search_index) AS score '
+            'FROM search_index WHERE search_index MATCH :match) '
+            'WHERE 1 = 1' + where + ' ORDER BY score, key LIMIT :limit'),
+            **params).fetchall()
+        if not rows:
+            return []
+        # Snippets only for the rows on this page.
+        keys = ', '.join(str(int(key)) for key, score in rows)
+        snippets = dict(connection.execute(text(
+            'SELECT rowid, snippet(search_index, 0, :open, :close, '
+            "'…', 24) FROM search_index "
+            f'WHERE search_index MATCH :match AND rowid IN ({keys})'),
+            open=OPEN, close=CLOSE, match=match).fetchall())
+        return [(key, score, snippets.get(key, '')) for key, score in rows]
+
+
+class LikeBackend:
+    """Unindexed search for databases without FTS5."""
+    name = 'like'
+    context = 80
+
+    def create(self, connection):
+        pass
+
+    def drop(self, connection):
+        pass
+
+    def index(self, connection, kind, id, body):
+        pass
+
+    def remove(self, connection, kind, id):
+        pass
+
+    def rebuild(self, connection):
+        pass
+
+    def snippet(self, body, words):
+        pattern = re.compile('|'.join(re.escape(word) for word in words),
+                             re.IGNORECASE)
+        first = pattern.search(body)
+        start = max(0, first.start() - self.context) if first else 0
+        window = body[start:start + 2 * self.context]
+        window = pattern.sub(lambda m: OPEN + m.group(0) + CLOSE, window)
+        return ('…' if start else '') + window
+
+    def matches(self, connection, words, kinds, after, limit):
+        from . import db
+        from .models import Comment, Post
+        selects = []
+        for kind, model in (('post', Post), ('comment', Comment)):
+            if kind not in kinds:
+                continue
+            table = model.__table__
+            conditions = [table.c.body.ilike(
+                '%' + word.replace('\\', '\\\\').replace('%', '\\%')
+                .replace('_', '\\_') + '%', escape='\\') for word in words]
+            if model is Comment:
+                conditions.append(db.or_(table.c.disabled.is_(None),
+                                         table.c.disabled.is_(False)))
+            selects.append(db.select([
+                (table.c.id * 2 + KINDS.index(kind)).label('key'),
+                table.c.body]).where(db.and_(*conditions)))
+        found = db.union_all(*selects).alias('found')
+        query = db.select([found.c.key, found.c.body])
+        if after is not None:
+            query = query.where(found.c.key > after[1])
+        rows = connection.execute(query.order_by(found.c.key).limit(limit))
+        return [(key, 0, self.snippet(body, words)) for key, body in rows]
+
+
+BACKENDS = {backend.name: backend for backend in (FTS5Backend(),
+                                                  LikeBackend())}
+
+
+class Search:
+    def init_app(self, app):
+        name = app.config['FLASKY_SEARCH_BACKEND']
+        if name != 'auto' and name not in BACKENDS:
+            raise ValueError(f'Unknown search backend {name!r}')
+
+    @staticmethod
+    def backend(connection):
+        name = current_app.config['FLASKY_SEARCH_BACKEND']
+        if name == 'auto':
+            name = 'fts5' if connection.dialect.name == 'sqlite' else 'like'
+        return BACKENDS[name]
+
+    def query(self, query, kinds=KINDS, cursor=None, per_page=None):
+        """One page of hits for the query, best first."""
+        from . import db
+        from .models import Comment, Post, preload_authors
+        words = terms(query)
+        if not words or not kinds:
+            return SearchPage([], None)
+        per_page = per_page or current_app.config['FLASKY_SEARCH_PER_PAGE']
+        after = decode_cursor(cursor) if cursor else None
+        connection = db.session.connection()
+        rows = self.backend(connection).matches(connection, words, kinds,
+                                                after, per_page + 1)
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+        ids = {'post': [], 'comment': []}
+        for key, score, snippet in rows:
+            kind, id = split_key(key)
+            ids[kind].append(id)
+        items = {}
+        for kind, model in (('post', Post), ('comment', Comment)):
+            if ids[kind]:
+                found = model.query.filter(model.id.in_(ids[kind])).all()
+                preload_authors(found)
+                items.update(((kind, item.id), item) for item in found)
+        hits = []
+        for key, score, snippet in rows:
+            item = items.get(split_key(key))
+            if item is not None:
+                hits.append(Hit(split_key(key)[0], item, score,
+                                highlight(snippet)))
+        next_cursor = None
+        if more:
+            next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+        return SearchPage(hits, next_cursor)
+
+    def rebuild(self):
+        from . import db
+        connection = db.session.connection()
+        self.backend(connection).rebuild(connection)
+        db.session.commit()
+
+    # Mapper and metadata events, registered in models.py.
+
+    def on_write(self, mapper, connection, target):
+        from . import db
+        state = db.inspect(target)
+        changed = [name for name in ('body', 'disabled')
+                   if name in state.attrs and
+                   state.attrs[name].history.has_changes()]
+        if not changed:
+            return
+        kind = 'comment' if hasattr(target, 'disabled') else 'post'
+        backend = self.backend(connection)
+        if target.body and not getattr(target, 'disabled', False):
+            backend.index(connection, kind, target.id, target.body)
+        else:
+            backend.remove(connection, kind, target.id)
+
+    def on_delete(self, mapper, connection, target):
+        kind = 'comment' if hasattr(target, 'disabled') else 'post'
+        self.backend(connection).remove(connection, kind, target.id)
+
+    def after_create(self, metadata, connection, **kwargs):
+        self.backend(connection).create(connection)
+
+    def after_drop(self, metadata, connection, **kwargs):
+        self.backend(connection).drop(connection)
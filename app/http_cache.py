@@ -0,0 +1,80 @@
+"""Conditional GET support.
+
+A view works out a strong ETag, and where it has one a Last-Modified
+time, from a narrow query of version columns such as ``updated_at``.
+It then calls ``conditional_get.check()``. If the client already holds
+that version, ``check()`` returns a 304 response, so the view can return
+it before loading or serializing anything else. Otherwise the
+validators are added to the full response once the view is done.
+"""
+import hashlib
+
+from flask import current_app, g, request, session
+from flask_login import current_user
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def collection_version(query, model):
+    """(latest id, latest updated_at, deletions) of the rows a query
+    selects.
+
+    A new row raises the latest id, an edit the latest ``updated_at``
+    and a deletion the table's CollectionVersion stamp. Each is its own
+    subquery, so each is one index lookup rather than a walk of the
+    rows.
+    """
+    from . import db
+    from .models import CollectionVersion
+    query = query.order_by(None)
+    return db.session.query(
+        query.with_entities(db.func.max(model.id)).as_scalar()
+        .label('latest_id'),
+        query.with_entities(db.func.max(model.updated_at)).as_scalar()
+        .label('updated_at'),
+        db.session.query(CollectionVersion.deletions).filter_by(
+            name=model.__tablename__).as_scalar().label('deletions')).one()
+
+
+class ConditionalGet:
+    def init_app(self, app):
+        app.after_request(self.add_validators)
+
+    @staticmethod
+    def shared_page():
+        """Whether the page is the same for everyone who asks for it.
+
+        Pages seen while logged in or with flashed messages are not.
+        """
+        return not current_user.is_authenticated and \
+            not session.get('_flashes')
+
+    def check(self, etag, last_modified=None):
+        """A 304 response if the client's copy is current, else None."""
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        g.validators = (etag, last_modified)
+        if request.if_none_match:
+            # Weak comparison, so a copy compressed on the way out, whose
+            # ETag is weak, still validates.
+            fresh = request.if_none_match.contains_weak(etag)
+        elif request.if_modified_since and last_modified is not None:
+            fresh = last_modified.replace(microsecond=0) <= \
+                request.if_modified_since
+        else:
+            fresh = False
+        if not fresh:
+            return None
+        return current_app.response_class(status=304)
+
+    @staticmethod
+    def add_validators(response):
+        validators = g.get('validators')
+        if validators is not None and response.status_code in (200, 304):
+            etag, last_modified = validators
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+        return response
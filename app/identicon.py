@@ -0,0 +1,149 @@
+"""Identicon avatars rendered and served by the application itself.
+
+An identicon is a 5x5 grid, mirrored left to right, drawn in one colour
+on a light background. The cells and the colour both come from the
+user's ``avatar_hash``, so a hash always gives the same image. PNGs are
+written with zlib alone, in each of FLASKY_AVATAR_SIZES, and kept under
+FLASKY_AVATAR_DIR. A URL names the hash and the size, so what it serves
+never changes and clients may cache it for good.
+
+With FLASKY_LOCAL_AVATARS set, ``User.gravatar()`` links here instead
+of gravatar.com. A new ``avatar_hash`` has its images drawn in the
+background once the change commits.
+"""
+import os
+import re
+import struct
+import tempfile
+import zlib
+
+from flask import abort, current_app, request, url_for
+from sqlalchemy.orm import object_session
+
+HASH = re.compile(r'^[0-9a-f]{32}$')
+GRID = 5
+BACKGROUND = (240, 240, 240)
+# Bump when the drawing changes, so cached copies are replaced.
+VERSION = 1
+
+
+def png_chunk(kind, data):
+    chunk = kind + data
+    return struct.pack('>I', len(data)) + chunk + \
+        struct.pack('>I', zlib.crc32(chunk) & 0xffffffff)
+
+
+def render(hash, size):
+    """The identicon for a hex digest as PNG bytes, size pixels square."""
+    digits = [int(digit, 16) for digit in hash]
+    # Fifteen cells decide the three left columns; the rest mirror them.
+    filled = [[digits[column * GRID + row] % 2 == 0
+               for column in (0, 1, 2, 1, 0)] for row in range(GRID)]
+    colour = bytes.fromhex(hash[-6:])
+    # Half a cell of margin on each side.
+    cell = size / (GRID + 1)
+    margin = cell / 2
+    # The pattern is symmetric, so the right half of each row is the
+    # left half reflected, pixel for pixel.
+    half = [int((x - margin) // cell) if margin <= x else None
+            for x in range((size + 1) // 2)]
+    columns = half + half[:size // 2][::-1]
+    blank = b'\x00' + bytes(size)
+    rows = []
+    for y in range(size):
+        row = int((y - margin) // cell) if margin <= y < size - margin \
+            else None
+        if row is None:
+            rows.append(blank)
+            continue
+        # Palette index 1 is the colour, 0 the background.
+        rows.append(b'\x00' + bytes(
+            1 if column is not None and filled[row][column] else 0
+            for column in columns))
+    header = struct.pack('>IIBBBBB', size, size, 8, 3, 0, 0, 0)
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        png_chunk(b'IHDR', header),
+        png_chunk(b'PLTE', bytes(BACKGROUND) + colour),
+        png_chunk(b'IDAT', zlib.compress(b''.join(rows), 9)),
+        png_chunk(b'IEND', b'')])
+
+
+class Avatars:
+    @staticmethod
+    def sizes():
+        return current_app.config['FLASKY_AVATAR_SIZES']
+
+    def fit(self, size):
+        """The smallest stored size at least as large as size."""
+        sizes = sorted(self.sizes())
+        return next((stored for stored in sizes if stored >= size),
+                    sizes[-1])
+
+    def url(self, hash, size):
+        return url_for('main.avatar', hash=hash, size=self.fit(size))
+
+    @staticmethod
+    def path(hash, size):
+        return os.path.join(current_app.config['FLASKY_AVATAR_DIR'],
+                            hash[:2], f'{hash}-{size}-v{VERSION}.png')
+
+    def load(self, hash, size):
+        """The PNG for hash at size, drawn and stored on first use."""
+        path = self.path(hash, size)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        data = render(hash, size)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside and renamed, so readers never see half a file.
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp, path)
+        return data
+
+    def generate(self, hashes):
+        """Store every size of each hash; returns how many were drawn."""
+        drawn = 0
+        for hash in hashes:
+            for size in self.sizes():
+                if not os.path.exists(self.path(hash, size)):
+                    self.load(hash, size)
+                    drawn += 1
+        return drawn
+
+    def response(self, hash, size):
+        if not HASH.match(hash) or size not in self.sizes():
+            abort(404)
+        response = current_app.response_class(self.load(hash, size),
+                                              mimetype='image/png')
+        response.set_etag(f'{hash}-{size}-v{VERSION}')
+        response.cache_control.public = True
+        response.cache_control.max_age = \
+            current_app.config['FLASKY_AVATAR_MAX_AGE']
+        response.cache_control.immutable = True
+        return response.make_conditional(request)
+
+    # Mapper and session events, registered in models.py.
+
+    @staticmethod
+    def on_user_write(mapper, connection, target):
+        from . import db
+        history = db.inspect(target).attrs.avatar_hash.history
+        if history.has_changes() and target.avatar_hash and \
+                current_app.config['FLASKY_LOCAL_AVATARS']:
+            object_session(target).info.setdefault(
+                'avatars_pending', set()).add(target.avatar_hash)
+
+    def after_commit(self, session):
+        from . import tasks
+        hashes = session.info.pop('avatars_pending', None)
+        if hashes:
+            tasks.submit(self.generate, sorted(hashes))
+
+    @staticmethod
+    def after_rollback(session):
+        session.info.pop('avatars_pending', None)
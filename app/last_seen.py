@@ -0,0 +1,88 @@
+"""Write-behind buffer for ``User.last_seen``.
+
+Pinging a user used to commit on every authenticated request. Now a ping
+within FLASKY_LAST_SEEN_GRANULARITY seconds of the previous one is
+dropped, and the others are collected in memory and written with one
+bulk UPDATE every FLASKY_LAST_SEEN_FLUSH_INTERVAL seconds and at
+shutdown. An interval of 0 writes each ping straight away.
+"""
+import atexit
+import threading
+import weakref
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import bindparam
+from sqlalchemy.orm.attributes import set_committed_value
+
+
+class PendingPings:
+    def __init__(self):
+        self.pending = {}
+        self.timer = None
+        self.lock = threading.Lock()
+
+
+class LastSeenBuffer:
+    def __init__(self):
+        # Held weakly, so apps made by tests and benchmarks can be freed.
+        self.apps = weakref.WeakSet()
+        atexit.register(self.flush_all)
+
+    def init_app(self, app):
+        app.extensions['last_seen'] = PendingPings()
+        self.apps.add(app)
+
+    def touch(self, user):
+        app = current_app._get_current_object()
+        state = app.extensions['last_seen']
+        now = datetime.utcnow()
+        granularity = timedelta(
+            seconds=app.config['FLASKY_LAST_SEEN_GRANULARITY'])
+        with state.lock:
+            last_seen = state.pending.get(user.id, user.last_seen)
+            if last_seen is not None and now - last_seen < granularity:
+                return
+            state.pending[user.id] = now
+            interval = app.config['FLASKY_LAST_SEEN_FLUSH_INTERVAL']
+            if interval and state.timer is None:
+                state.timer = threading.Timer(interval, self.flush,
+                                              args=(app,))
+                state.timer.daemon = True
+                state.timer.start()
+        # Show the new time in this request without dirtying the session.
+        set_committed_value(user, 'last_seen', now)
+        if not interval:
+            self.flush(app)
+
+    def flush_all(self):
+        """Write the buffered pings of every app still alive."""
+        for app in list(self.apps):
+            self.flush(app)
+
+    def flush(self, app):
+        """Write the buffered pings with a single bulk UPDATE."""
+        state = app.extensions['last_seen']
+        with state.lock:
+            pending, state.pending = state.pending, {}
+            if state.timer is not None:
+                state.timer.cancel()
+                state.timer = None
+        if not pending:
+            return
+        from . import db
+        from .models import User
+        users = User.__table__
+        update = (users.update()
+                  .where(users.c.id == bindparam('user_id'))
+                  .values(last_seen=bindparam('seen')))
+        # No app context of our own here: tearing it down would remove
+        # the session of a request that flushes inline.
+        try:
+            with db.get_engine(app).begin() as connection:
+                connection.execute(update, [
+                    {'user_id': user_id, 'seen': seen}
+                    for user_id, seen in pending.items()])
+        except Exception:
+            app.logger.exception('Could not write %d last_seen updates',
+                                 len(pending))
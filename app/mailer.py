@@ -0,0 +1,192 @@
+"""Durable outbox for email.
+
+``send_email()`` stores a message in the outbox table and returns. A
+bounded pool of FLASKY_MAIL_WORKERS threads claims due messages in
+batches of FLASKY_MAIL_BATCH_SIZE and sends them over one SMTP
+connection, kept open for as long as there are messages to send. A
+failed message is tried again after an exponential backoff, and marked
+dead after FLASKY_MAIL_MAX_ATTEMPTS. A claim expires after
+FLASKY_MAIL_LEASE seconds, so messages held by a process that stopped
+are picked up by another. With no workers nothing is sent until
+``drain()`` runs, e.g. from ``flask outbox --drain``.
+"""
+import smtplib
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_mail import Message
+
+# Errors about one message; any other OSError means the connection broke.
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused,
+                  smtplib.SMTPDataError)
+
+
+class OutboxState:
+    def __init__(self):
+        self.wake = threading.Event()
+        self.threads = []
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+
+
+class Outbox:
+    def init_app(self, app):
+        app.extensions['outbox'] = OutboxState()
+        # Resume whatever a previous process left in the outbox.
+        app.before_first_request(self.notify)
+
+    @property
+    def state(self):
+        return current_app.extensions['outbox']
+
+    def notify(self):
+        """Wake the workers, starting them on first use."""
+        app = current_app._get_current_object()
+        state = self.state
+        with state.lock:
+            while len(state.threads) < app.config['FLASKY_MAIL_WORKERS']:
+                thread = threading.Thread(target=self.work, args=(app,),
+                                          daemon=True)
+                thread.start()
+                state.threads.append(thread)
+        state.wake.set()
+
+    def work(self, app):
+        state = app.extensions['outbox']
+        while True:
+            state.wake.clear()
+            try:
+                with app.app_context():
+                    self.drain()
+            except Exception:
+                app.logger.exception('Outbox worker failed')
+            state.wake.wait(app.config['FLASKY_MAIL_POLL_INTERVAL'])
+
+    def drain(self):
+        """Send every due message, returning how many were sent."""
+        from . import mail
+        sent = 0
+        batch = self.claim()
+        if not batch:
+            return sent
+        try:
+            with mail.connect() as connection:
+                while batch:
+                    message = batch[0]
+                    try:
+                        connection.send(self.build(message))
+                    except Exception as e:
+                        if isinstance(e, OSError) and \
+                                not isinstance(e, MESSAGE_ERRORS):
+                            raise
+                        self.retry(message, e)
+                    else:
+                        self.delivered(message)
+                        sent += 1
+                    batch.pop(0)
+                    if not batch:
+                        batch = self.claim()
+        except OSError as e:
+            # The server is unreachable or hung up; the rest of the batch
+            # backs off, and what else is due waits for the next round.
+            for message in batch:
+                self.retry(message, e)
+        return sent
+
+    def claim(self):
+        """Lease up to a batch of due messages to this worker."""
+        from . import db
+        from .models import OutboxMessage
+        config = current_app.config
+        now = datetime.utcnow()
+        claimable = [OutboxMessage.PENDING, OutboxMessage.SENDING]
+        ids = [id for id, in db.session.query(OutboxMessage.id)
+               .filter(OutboxMessage.status.in_(claimable))
+               .filter(OutboxMessage.next_attempt_at <= now)
+               .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id)
+               .limit(config['FLASKY_MAIL_BATCH_SIZE'])]
+        if not ids:
+            return []
+        outbox = OutboxMessage.__table__
+        lease = now + timedelta(seconds=config['FLASKY_MAIL_LEASE'])
+        claimed = []
+        for id in ids:
+            # Conditional, so that two workers never claim one message.
+            result = db.session.execute(
+                outbox.update()
+                .where(outbox.c.id == id)
+                .where(outbox.c.status.in_(claimable))
+                .where(outbox.c.next_attempt_at <= now)
+                .values(status=OutboxMessage.SENDING, next_attempt_at=lease))
+            if result.rowcount:
+                claimed.append(id)
+        db.session.commit()
+        return (OutboxMessage.query.filter(OutboxMessage.id.in_(claimed))
+                .order_by(OutboxMessage.id).all())
+
+    @staticmethod
+    def build(message):
+        return Message(message.subject, sender=message.sender,
+                       recipients=[message.recipient], body=message.body,
+                       html=message.html)
+
+    def delivered(self, message):
+        from . import db
+        from .models import OutboxMessage
+        message.status = OutboxMessage.SENT
+        message.attempts += 1
+        message.sent_at = datetime.utcnow()
+        message.last_error = None
+        db.session.commit()
+        with self.state.lock:
+            self.state.sent += 1
+
+    def retry(self, message, error):
+        from . import db
+        from .models import OutboxMessage
+        config = current_app.config
+        message.attempts += 1
+        message.last_error = repr(error)
+        if message.attempts >= config['FLASKY_MAIL_MAX_ATTEMPTS']:
+            message.status = OutboxMessage.DEAD
+            current_app.logger.error('Giving up on email %d to %s: %r',
+                                     message.id, message.recipient, error)
+        else:
+            backoff = min(config['FLASKY_MAIL_RETRY_BACKOFF'] *
+                          2 ** (message.attempts - 1),
+                          config['FLASKY_MAIL_MAX_BACKOFF'])
+            message.status = OutboxMessage.PENDING
+            message.next_attempt_at = (datetime.utcnow() +
+                                       timedelta(seconds=backoff))
+            current_app.logger.warning('Email %d to %s failed, retry in %ds: '
+                                       '%r', message.id, message.recipient,
+                                       backoff, error)
+        db.session.commit()
+        with self.state.lock:
+            self.state.failed += 1
+
+    def stats(self):
+        """Queue depth per status, the oldest due message and counters."""
+        from . import db
+        from .models import OutboxMessage
+        counts = dict(db.session.query(OutboxMessage.status,
+                                       db.func.count(OutboxMessage.id))
+                      .group_by(OutboxMessage.status))
+        oldest = (db.session.query(db.func.min(OutboxMessage.created_at))
+                  .filter(OutboxMessage.status.in_(
+                      [OutboxMessage.PENDING, OutboxMessage.SENDING]))
+                  .scalar())
+        state = self.state
+        with state.lock:
+            return {
+                'depth': {status: counts.get(status, 0) for status in (
+                    OutboxMessage.PENDING, OutboxMessage.SENDING,
+                    OutboxMessage.SENT, OutboxMessage.DEAD)},
+                'oldest_queued_seconds': oldest and
+                (datetime.utcnow() - oldest).total_seconds(),
+                'workers': len(state.threads),
+                'sent': state.sent,
+                'failed': state.failed,
+            }
@@ -59,4 +59,13 @@ class PostForm(FlaskForm):
 
 class CommentForm(FlaskForm):
     body = PageDownField("", validators=[DataRequired()])
-    submit = SubmitField('Submit')
\ No newline at end of file
+    submit = SubmitField('Submit')
+
+
+class ModerationForm(FlaskForm):
+    enable = SubmitField('Enable selected')
+    disable = SubmitField('Disable selected')
+
+
+class FlagForm(FlaskForm):
+    submit = SubmitField('Report')
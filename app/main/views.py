@@ -2,17 +2,23 @@
 from flask import render_template, session, redirect, url_for
 from flask import current_app, flash, request, abort, make_response
 from flask_login import login_required, current_user
+from flask_sqlalchemy import Pagination
 
-from .. import db
-from ..models import User, Post, Permission, Comment
+from .. import db, conditional_get, avatars, search as fulltext
+from ..fulltext import search_kinds
+from ..http_cache import collection_version, make_etag
+from ..models import User, Post, Permission, Comment, CollectionVersion
 from ..email import send_email
+from ..pagination import paginate
 from . import main
 from .forms import PostForm, EditProfileForm, EditProfileAdminForm
-from .forms import CommentForm
+from .forms import CommentForm, ModerationForm, FlagForm
 from ..decorators import admin_required, permission_required
+from ..replication import read_only
 
 
 @main.route('/', methods=['GET', 'POST'])
+@read_only
 def index():
     form = PostForm()
     if current_user.can(Permission.WRITE) and form.validate_on_submit():
@@ -28,10 +34,8 @@ def index():
         query = current_user.followed_posts
     else:
         query = Post.query
-    page = request.args.get('page', 1, type=int)
     per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
-    posts = query.order_by(Post.timestamp.desc())
-    pagination = posts.paginate(page, per_page, error_out=False)
+    pagination = paginate(query, per_page, Post.timestamp, Post.id)
     posts = pagination.items
     return render_template('index.html', form=form, posts=posts,
                            show_followed=show_followed, pagination=pagination)
@@ -54,12 +58,24 @@ def show_followed():
 
 
 @main.route('/user/<username>')
+@read_only
 def user(username):
+    if conditional_get.shared_page():
+        version = db.session.query(
+            User.id, User.name, User.location, User.about_me,
+            User.member_since, User.last_seen, User.avatar_hash,
+            User.role_id, User.post_count, User.follower_count,
+            User.followed_count).filter_by(username=username).first_or_404()
+        latest_id, updated_at, deletions = collection_version(
+            Post.query.filter_by(author_id=version.id), Post)
+        not_modified = conditional_get.check(
+            make_etag('user_page', request.full_path, *version, latest_id,
+                      updated_at, deletions))
+        if not_modified:
+            return not_modified
     user = User.query.filter_by(username=username).first_or_404()
-    page = request.args.get('page', 1, type=int)
-    per_page = current_app.config['FLASKY_POSTS_PER_PAGE'] 
-    posts = user.posts.order_by(Post.timestamp.desc())
-    pagination = posts.paginate(page, per_page, error_out=False)
+    per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
+    pagination = paginate(user.posts, per_page, Post.timestamp, Post.id)
     posts = pagination.items
     return render_template('user.html', user=user,
                            posts=posts, pagination=pagination)
@@ -112,7 +128,26 @@ def edit_profile_admin(id):
 
 
 @main.route('/post/<int:id>', methods=['GET', 'POST'])
+@read_only
 def post(id):
+    if request.method == 'GET' and conditional_get.shared_page():
+        version = db.session.query(
+            Post.updated_at, User.username, User.avatar_hash).join(
+            User, User.id == Post.author_id).filter(
+            Post.id == id).first_or_404()
+        latest_id, updated_at, deletions = collection_version(
+            Comment.query.filter_by(post_id=id), Comment)
+        # Commenters' names and avatars are on the page too, and deleted
+        # comments leave no updated_at behind.
+        stamps = CollectionVersion.stamps('comments', 'users')
+        last_modified = max(filter(None, [version.updated_at, updated_at] +
+                                   [stamp[3] for stamp in stamps]),
+                            default=None)
+        not_modified = conditional_get.check(
+            make_etag('post_page', request.full_path, *version, latest_id,
+                      updated_at, deletions, stamps), last_modified)
+        if not_modified:
+            return not_modified
     post = Post.query.get_or_404(id)
     form = CommentForm()
     if form.validate_on_submit():
@@ -123,14 +158,12 @@ def post(id):
         db.session.commit()
         flash('Your comment has been published!')
         return redirect(url_for('.post', id=post.id, page=-1))
-    page = request.args.get('page', 1, type=int)
     per_page = current_app.config['FLASKY_COMMENTS_PER_PAGE']
-    if page == -1:
-        page = (post.comments.count() - 1) // per_page + 1
-    comments = post.comments.order_by(Comment.timestamp.asc())
-    pagination = comments.paginate(page, per_page, error_out=False)
+    pagination = paginate(post.comments, per_page, Comment.timestamp,
+                          Comment.id, descending=False)
     comments = pagination.items
-    return render_template('post.html', posts=[post], form=form,
+    return render_template('post.html', posts=Post.preload([post]),
+                           form=form, flag_form=FlagForm(),
                            comments=comments, pagination=pagination)
 
 
@@ -186,6 +219,7 @@ def unfollow(username):
 
 
 @main.route('/followers/<username>')
+@read_only
 def followers(username):
     user = User.query.filter_by(username=username).first()
     if user is None:
@@ -193,7 +227,10 @@ def followers(username):
         return redirect(url_for('.index'))
     page = request.args.get('page', 1, type=int)
     per_page = current_app.config['FLASKY_FOLLOWERS_PER_PAGE']
-    pagination = user.followers.paginate(page, per_page, error_out=False)
+    # The total comes from the counter column rather than a COUNT(*).
+    items = user.followers.limit(per_page).offset((page - 1) * per_page).all()
+    pagination = Pagination(user.followers, page, per_page,
+                            user.follower_count, items)
     follows = [{'user': item.follower, 'timestamp': item.timestamp}
                for item in pagination.items if item.follower != user]
     return render_template('followers.html', user=user, title="Followers of",
@@ -202,6 +239,7 @@ def followers(username):
 
 
 @main.route('/followed_by/<username>')
+@read_only
 def followed_by(username):
     user = User.query.filter_by(username=username).first()
     if user is None:
@@ -209,7 +247,10 @@ def followed_by(username):
         return redirect(url_for('.index'))
     page = request.args.get('page', 1, type=int)
     per_page = current_app.config['FLASKY_FOLLOWERS_PER_PAGE']
-    pagination = user.followed.paginate(page, per_page, error_out=False)
+    # The total comes from the counter column rather than a COUNT(*).
+    items = user.followed.limit(per_page).offset((page - 1) * per_page).all()
+    pagination = Pagination(user.followed, page, per_page,
+                            user.followed_count, items)
     follows = [{'user': item.followed, 'timestamp': item.timestamp}
                for item in pagination.items if item.followed != user]
     return render_template('followers.html', user=user, title="Followed by",
@@ -221,13 +262,39 @@ def followed_by(username):
 @login_required
 @permission_required(Permission.MODERATE)
 def moderate():
-    comments = Comment.query.order_by(Comment.timestamp.desc())
-    page = request.args.get('page', 1, type=int)
     per_page = current_app.config['FLASKY_COMMENTS_PER_PAGE']
-    pagination = comments.paginate(page, per_page, error_out=False)
+    pagination = paginate(Comment.awaiting_review(), per_page,
+                          Comment.timestamp, Comment.id)
     comments = pagination.items
     return render_template('moderate.html', comments=comments,
-                           pagination=pagination, page=page)
+                           pagination=pagination, form=ModerationForm(),
+                           moderate=True,
+                           page=request.args.get('page', type=int),
+                           cursor=request.args.get('cursor'))
+
+
+@main.route('/moderate', methods=['POST'])
+@login_required
+@permission_required(Permission.MODERATE)
+def moderate_bulk():
+    form = ModerationForm()
+    ids = request.form.getlist('ids', type=int)
+    limit = current_app.config['FLASKY_MODERATION_BATCH_SIZE']
+    if not form.validate_on_submit():
+        abort(400)
+    if not ids:
+        flash('No comments were selected.')
+    elif len(ids) > limit:
+        flash(f'At most {limit} comments can be moderated at once.')
+    else:
+        disabled = bool(form.disable.data)
+        comments = Comment.moderate(ids, disabled)
+        db.session.commit()
+        flash(f'{len(comments)} comments '
+              f'{"disabled" if disabled else "enabled"}.')
+    return redirect(url_for('.moderate',
+                            page=request.args.get('page', type=int),
+                            cursor=request.args.get('cursor')))
 
 
 @main.route('/moderate/enable/<int:id>')
@@ -235,11 +302,12 @@ def moderate():
 @permission_required(Permission.MODERATE)
 def moderate_enable(id):
     comment = Comment.query.get_or_404(id)
-    comment.disabled = False
+    comment.review(disabled=False)
     db.session.add(comment)
     db.session.commit()
-    return redirect(url_for('.moderate', page=request.args.get('page', 1,
-                                                               type=int)))
+    return redirect(url_for('.moderate',
+                            page=request.args.get('page', type=int),
+                            cursor=request.args.get('cursor')))
 
 
 @main.route('/moderate/disable/<int:id>')
@@ -247,9 +315,40 @@ def moderate_enable(id):
 @permission_required(Permission.MODERATE)
 def moderate_disable(id):
     comment = Comment.query.get_or_404(id)
-    comment.disabled = True
+    comment.review(disabled=True)
+    db.session.add(comment)
+    db.session.commit()
+    return redirect(url_for('.moderate',
+                            page=request.args.get('page', type=int),
+                            cursor=request.args.get('cursor')))
+
+
+@main.route('/flag/<int:id>', methods=['POST'])
+@login_required
+@permission_required(Permission.COMMENT)
+def flag(id):
+    comment = Comment.query.get_or_404(id)
+    if not FlagForm().validate_on_submit():
+        abort(400)
+    comment.flagged = True
     db.session.add(comment)
     db.session.commit()
-    return redirect(url_for('.moderate', page=request.args.get('page', 1,
-                                                               type=int)))
+    flash('The comment has been reported to the moderators.')
+    return redirect(url_for('.post', id=comment.post_id))
+
+
+@main.route('/search')
+@read_only
+def search():
+    query = request.args.get('q', '').strip()
+    kinds = search_kinds(request.args.get('type'))
+    page = fulltext.query(query, kinds=kinds,
+                          cursor=request.args.get('cursor'))
+    return render_template('search.html', query=query, hits=page.hits,
+                           next_cursor=page.next_cursor,
+                           type=request.args.get('type'))
+
 
+@main.route('/avatar/<hash>/<int:size>')
+def avatar(hash, size):
+    return avatars.response(hash, size)
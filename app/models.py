@@ -7,10 +7,21 @@ from flask import current_app, url_for
 from flask import request
 from markdown import markdown
 import bleach
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import set_committed_value
 
 from . import db
 from . import login_manager
+from . import follow_graph
+from . import tasks
+from . import last_seen_buffer
+from . import auth_cache
+from . import search
+from . import avatars
+from . import replica
 from .exceptions import ValidationError
+from .follow_index import FollowGraph
+from .auth_cache import AuthCache
 
 
 class Permission:
@@ -81,6 +92,197 @@ class Follow(db.Model):
     followed_id = db.Column(db.Integer, db.ForeignKey('users.id'),
                             primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # The primary key serves lookups by follower; this serves followers
+    # of a user and the fan-out of their posts.
+    __table_args__ = (db.Index('ix_follows_followed_id_follower_id',
+                               'followed_id', 'follower_id'),)
+
+
+class TimelineEntry(db.Model):
+    """Materialized home timeline, one row per (reader, post).
+
+    Rows are written on post creation (fan-out on write) and on follow
+    (backfill). Authors with more than FLASKY_TIMELINE_FANOUT_LIMIT
+    followers are not fanned out, their posts are merged in at read time.
+    When such an author drops under the limit, the posts they wrote while
+    over it are backfilled.
+    """
+    __tablename__ = 'timeline_entries'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'),
+                        primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'),
+                        primary_key=True)
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    timestamp = db.Column(db.DateTime)
+    __table_args__ = (db.Index('ix_timeline_entries_user_id_timestamp',
+                               'user_id', 'timestamp'),)
+
+    @staticmethod
+    def is_fanout_author(connection, author_id):
+        """Authors over the fan-out limit are merged at read time."""
+        limit = current_app.config['FLASKY_TIMELINE_FANOUT_LIMIT']
+        users = User.__table__
+        count = connection.execute(
+            db.select([users.c.follower_count])
+            .where(users.c.id == author_id)).scalar()
+        return (count or 0) < limit
+
+    @staticmethod
+    def merged_authors(user_id):
+        """Ids of followed authors which are not fanned out."""
+        limit = current_app.config['FLASKY_TIMELINE_FANOUT_LIMIT']
+        authors = (db.session.query(Follow.followed_id)
+                   .join(User, User.id == Follow.followed_id)
+                   .filter(Follow.follower_id == user_id)
+                   .filter(User.follower_count >= limit))
+        return [author_id for author_id, in authors]
+
+    @staticmethod
+    def fan_out(connection, post):
+        if not TimelineEntry.is_fanout_author(connection, post.author_id):
+            return
+        entries = TimelineEntry.__table__
+        follows = Follow.__table__
+        known = (db.exists()
+                 .where(entries.c.user_id == follows.c.follower_id)
+                 .where(entries.c.post_id == post.id))
+        readers = (db.select([follows.c.follower_id,
+                              db.literal(post.id),
+                              db.literal(post.author_id),
+                              db.literal(post.timestamp)])
+                   .where(follows.c.followed_id == post.author_id)
+                   .where(~known))
+        connection.execute(entries.insert().from_select(
+            ['user_id', 'post_id', 'author_id', 'timestamp'], readers))
+
+    @staticmethod
+    def fan_out_since(connection, post_id):
+        """Fan out every post from ``post_id`` on in one statement.
+
+        For rows written with Core inserts, which skip the mapper events.
+        """
+        limit = current_app.config['FLASKY_TIMELINE_FANOUT_LIMIT']
+        entries = TimelineEntry.__table__
+        posts = Post.__table__
+        follows = Follow.__table__
+        users = User.__table__
+        readers = (db.select([follows.c.follower_id,
+                              posts.c.id,
+                              posts.c.author_id,
+                              posts.c.timestamp])
+                   .select_from(posts
+                                .join(follows,
+                                      follows.c.followed_id ==
+                                      posts.c.author_id)
+                                .join(users, users.c.id == posts.c.author_id))
+                   .where(posts.c.id >= post_id)
+                   .where(users.c.follower_count < limit))
+        connection.execute(entries.insert().from_select(
+            ['user_id', 'post_id', 'author_id', 'timestamp'], readers))
+
+    @staticmethod
+    def backfill(connection, follower_id, followed_id):
+        """Add the entries a follower of followed_id is missing: every post
+        since they followed, and the FLASKY_TIMELINE_BACKFILL newest
+        before. A follower_id of None fills in every follower.
+
+        The backfill is a deliberate depth limit: older posts of an author
+        never reach the home timeline.
+        """
+        if not TimelineEntry.is_fanout_author(connection, followed_id):
+            return
+        entries = TimelineEntry.__table__
+        posts = Post.__table__
+        follows = Follow.__table__
+        known = (db.exists()
+                 .where(entries.c.user_id == follows.c.follower_id)
+                 .where(entries.c.post_id == posts.c.id))
+        recent = (db.select([posts.c.id])
+                  .where(posts.c.author_id == followed_id)
+                  .order_by(posts.c.timestamp.desc())
+                  .limit(current_app.config['FLASKY_TIMELINE_BACKFILL']))
+        missing = (db.select([follows.c.follower_id,
+                              posts.c.id,
+                              posts.c.author_id,
+                              posts.c.timestamp])
+                   .select_from(follows.join(
+                       posts, posts.c.author_id == follows.c.followed_id))
+                   .where(follows.c.followed_id == followed_id)
+                   .where(db.or_(posts.c.timestamp >= follows.c.timestamp,
+                                 posts.c.id.in_(recent)))
+                   .where(~known))
+        if follower_id is not None:
+            missing = missing.where(follows.c.follower_id == follower_id)
+        connection.execute(entries.insert().from_select(
+            ['user_id', 'post_id', 'author_id', 'timestamp'], missing))
+
+    @staticmethod
+    def prune(connection, follower_id, followed_id):
+        entries = TimelineEntry.__table__
+        connection.execute(entries.delete()
+                           .where(entries.c.user_id == follower_id)
+                           .where(entries.c.author_id == followed_id))
+
+    @staticmethod
+    def rebuild():
+        """Recompute every timeline from the follows table."""
+        connection = db.session.connection()
+        connection.execute(TimelineEntry.__table__.delete())
+        for follow in Follow.query.all():
+            TimelineEntry.backfill(connection, follow.follower_id,
+                                   follow.followed_id)
+        db.session.commit()
+
+    @staticmethod
+    def on_follow_insert(mapper, connection, target):
+        TimelineEntry.backfill(connection, target.follower_id,
+                               target.followed_id)
+
+    @staticmethod
+    def on_follow_delete(mapper, connection, target):
+        TimelineEntry.prune(connection, target.follower_id,
+                            target.followed_id)
+
+    @staticmethod
+    def followers_dropped(connection, author_id, previous, count):
+        """Fan out an author whose follower count fell from ``previous`` to
+        ``count``, if that took them under the fan-out limit.
+
+        Their posts written while over it were merged at read time and
+        have no entries yet.
+        """
+        limit = current_app.config['FLASKY_TIMELINE_FANOUT_LIMIT']
+        if (previous or 0) >= limit > (count or 0):
+            TimelineEntry.backfill(connection, None, author_id)
+
+    @staticmethod
+    def on_follower_lost(mapper, connection, target):
+        # Runs after the follower_count update, which took one off.
+        users = User.__table__
+        count = connection.execute(
+            db.select([users.c.follower_count])
+            .where(users.c.id == target.followed_id)).scalar()
+        TimelineEntry.followers_dropped(connection, target.followed_id,
+                                        (count or 0) + 1, count)
+
+    @staticmethod
+    def on_post_write(mapper, connection, target):
+        TimelineEntry.fan_out(connection, target)
+
+    @staticmethod
+    def on_post_delete(mapper, connection, target):
+        entries = TimelineEntry.__table__
+        connection.execute(entries.delete()
+                           .where(entries.c.post_id == target.id))
+
+
+db.event.listen(Follow, 'after_insert', TimelineEntry.on_follow_insert)
+db.event.listen(Follow, 'after_delete', TimelineEntry.on_follow_delete)
+# Patching the in-process follow graph index once follows are committed.
+db.event.listen(Follow, 'after_insert', FollowGraph.follow_listener(1))
+db.event.listen(Follow, 'after_delete', FollowGraph.follow_listener(-1))
+db.event.listen(db.session, 'after_commit', follow_graph.after_commit)
+db.event.listen(db.session, 'after_rollback', follow_graph.after_rollback)
 
 
 class User(UserMixin, db.Model):
@@ -100,6 +302,11 @@ class User(UserMixin, db.Model):
     last_seen = db.Column(db.DateTime(), default=datetime.utcnow)
     # avatar gavatar email hash
     avatar_hash = db.Column(db.String(32))
+    # denormalized counters, kept current by the mapper events below.
+    # The follow counters include the user's own self-follow.
+    post_count = db.Column(db.Integer, default=0)
+    follower_count = db.Column(db.Integer, default=0)
+    followed_count = db.Column(db.Integer, default=0)
     # posts feild
     posts = db.relationship('Post', backref='author', lazy='dynamic')
     # follow feilds
@@ -164,18 +371,29 @@ class User(UserMixin, db.Model):
 
     @staticmethod
     def verify_auth_token(token):
-        data = parse_token(token)
-        if data is None:
-            return None
-        return User.query.get(data['id'])
+        user_id = auth_cache.token_user_id(token)
+        if user_id is None:
+            s = Serializer(current_app.config['SECRET_KEY'])
+            try:
+                data, header = s.loads(token.encode('utf-8'),
+                                       return_header=True)
+            except Exception:
+                return None
+            user_id = data.get('id')
+            if user_id is None:
+                return None
+            auth_cache.remember_token(token, user_id, header['exp'])
+        return auth_cache.load_user(user_id)
 
     def change_email(self, token):
         data = parse_token(token)
+        if data is None or data.get('confirm') != self.id:
+            return False
         newemail = data.get('newemail')
         if newemail:
-            current_user.email = newemail
+            self.email = newemail
             self.avatar_hash = self.gravatar_hash()
-            db.session.add(current_user)
+            db.session.add(self)
             return True
 
     def can(self, perm):
@@ -185,19 +403,19 @@ class User(UserMixin, db.Model):
         return self.can(Permission.ADMIN)
 
     def ping(self):
-        self.last_seen = datetime.utcnow()
-        db.session.add(self)
-        db.session.commit()
+        last_seen_buffer.touch(self)
 
     def gravatar_hash(self):
         return hashlib.md5(self.email.lower().encode('utf-8')).hexdigest()
 
     def gravatar(self, size=100, default='identicon', rating='g'):
+        hash = self.avatar_hash or self.gravatar_hash()
+        if current_app.config['FLASKY_LOCAL_AVATARS']:
+            return avatars.url(hash, size)
         if request.is_secure:
             url = 'https://secure.gravatar.com/avatar'
         else:
             url = 'http://www.gravatar.com/avatar'
-        hash = self.avatar_hash or self.gravatar_hash()
         return f'{url}/{hash}?s={size}&d={default}&r={rating}'
     
     def follow(self, user):
@@ -211,22 +429,32 @@ class User(UserMixin, db.Model):
             db.session.delete(f)
     
     def is_following(self, user):
-        if user.id is None:
+        if user.id is None or self.id is None:
             return False
-        f = self.followed.filter_by(followed_id=user.id).first()
-        return f is not None
+        return follow_graph.is_following(self.id, user.id)
     
     def is_followed_by(self, user):
-        if user.id is None:
+        if user.id is None or self.id is None:
             return False
-        f = self.followers.filter_by(follower_id=user.id).first()
-        return f is not None
+        return follow_graph.is_following(user.id, self.id)
+
+    def following_among(self, users):
+        """Ids of the given users which this user follows."""
+        ids = [user.id for user in users if user.id is not None]
+        if self.id is None or not ids:
+            return set()
+        return follow_graph.following_among(self.id, ids)
 
     @property
     def followed_posts(self):
-        return (Post.query
-                .join(Follow, Follow.followed_id == Post.author_id)
-                .filter(Follow.follower_id == self.id))
+        posts = (Post.query
+                 .join(TimelineEntry, TimelineEntry.post_id == Post.id)
+                 .filter(TimelineEntry.user_id == self.id))
+        authors = TimelineEntry.merged_authors(self.id)
+        if authors:
+            posts = posts.union(
+                Post.query.filter(Post.author_id.in_(authors)))
+        return posts
     
     @staticmethod
     def add_self_follows():
@@ -245,7 +473,7 @@ class User(UserMixin, db.Model):
                      'followed_posts_url': (url_for(
                                             'api.get_user_followed_posts',
                                             id=self.id)),
-                     'post_count': self.posts.count()}
+                     'post_count': self.post_count}
         return json_user
 
     def __repr__(self):
@@ -266,6 +494,18 @@ def parse_token(token):
     return data
 
 
+def preload_authors(items):
+    """Load the authors of posts or comments with a single query."""
+    ids = {item.author_id for item in items if item.author_id is not None}
+    if not ids:
+        return items
+    authors = {user.id: user
+               for user in User.query.filter(User.id.in_(ids))}
+    for item in items:
+        set_committed_value(item, 'author', authors.get(item.author_id))
+    return items
+
+
 class AnonymousUser(AnonymousUserMixin):
     def can(self, perm):
         return False
@@ -284,20 +524,40 @@ class Post(db.Model):
     body_html = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    comment_count = db.Column(db.Integer, default=0)
+    # Bumped by any write to the row, for incremental exports.
+    updated_at = db.Column(db.DateTime, index=True, default=datetime.utcnow,
+                           onupdate=datetime.utcnow)
     comments = db.relationship('Comment', backref='post', lazy='dynamic')
+    # A user's posts, newest first.
+    __table_args__ = (db.Index('ix_posts_author_id_timestamp',
+                               'author_id', 'timestamp'),)
 
     @staticmethod
-    def on_changed_body(target, value, oldvalue, initiator):
-        """for db.event.listen method"""
+    def preload(posts):
+        """Batch-load the authors of a list of posts."""
+        return preload_authors(posts)
+
+    @staticmethod
+    def render(body):
         allowed_tags = ['a', 'abbr', 'acronym', 'b', 'blockquote', 'code',
                         'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
                         'h1', 'h2', 'h3', 'p']
-        html = markdown(value, output_format='html')
+        html = markdown(body, output_format='html')
         # bleach.clean method filters html tags.
         # bleach.linkify method translates the URL text to <a tag> 
-        target.body_html = bleach.linkify(bleach.clean(html,
-                                                       tags=allowed_tags,
-                                                       strip=True))
+        return bleach.linkify(bleach.clean(html,
+                                           tags=allowed_tags,
+                                           strip=True))
+
+    @staticmethod
+    def on_changed_body(target, value, oldvalue, initiator):
+        """for db.event.listen method"""
+        if current_app.config['FLASKY_ASYNC_RENDER']:
+            # Pending, rendered by the task pool after commit.
+            target.body_html = None
+        else:
+            target.body_html = Post.render(value)
                                             
     def to_json(self):
         json_post = {'url': url_for('api.get_post', id=self.id),
@@ -307,7 +567,7 @@ class Post(db.Model):
                      'author_url': url_for('api.get_user', id=self.author_id),
                      'comments_url': url_for('api.get_post_comments',
                                              id=self.id),
-                     'comment_count': self.comments.count()}
+                     'comment_count': self.comment_count}
         return json_post
     
     @staticmethod
@@ -320,6 +580,10 @@ class Post(db.Model):
 
 # Setting event listening for updating Post.body_html while Post.body changing.
 db.event.listen(Post.body, 'set', Post.on_changed_body)
+# Keeping the materialized timelines in step with posts.
+db.event.listen(Post, 'after_insert', TimelineEntry.on_post_write)
+db.event.listen(Post, 'after_update', TimelineEntry.on_post_write)
+db.event.listen(Post, 'after_delete', TimelineEntry.on_post_delete)
 
 
 class Comment(db.Model):
@@ -330,16 +594,70 @@ class Comment(db.Model):
     disabled = db.Column(db.Boolean)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id'))
+    updated_at = db.Column(db.DateTime, index=True, default=datetime.utcnow,
+                           onupdate=datetime.utcnow)
+    # Moderation state: new and reported comments wait in the queue
+    # until a moderator enables or disables them.
+    reviewed = db.Column(db.Boolean, default=False, nullable=False,
+                         server_default=db.false())
+    flagged = db.Column(db.Boolean, default=False, nullable=False,
+                        server_default=db.false())
+    # The comments on a post, and a user's comments, in order. The queue
+    # index holds only the comments awaiting review, so it stays small
+    # however many comments have been written.
+    __table_args__ = (db.Index('ix_comment_post_id_timestamp',
+                               'post_id', 'timestamp'),
+                      db.Index('ix_comment_author_id_timestamp',
+                               'author_id', 'timestamp'),
+                      db.Index('ix_comment_review_queue', 'timestamp',
+                               sqlite_where=db.text(
+                                   'reviewed = 0 OR flagged = 1'),
+                               postgresql_where=db.text(
+                                   'NOT reviewed OR flagged')))
 
     @staticmethod
-    def on_changed_body(target, value, oldvalue, initiator):
-        """for db.event.listen method"""
+    def awaiting_review():
+        """Comments in the moderation queue."""
+        return Comment.query.filter(db.or_(Comment.reviewed == db.false(),
+                                           Comment.flagged == db.true()))
+
+    @staticmethod
+    def moderate(ids, disabled):
+        """Enable or disable the comments with the given ids.
+
+        Returns the comments found; the caller commits them together.
+        """
+        comments = Comment.query.filter(Comment.id.in_(ids)).all()
+        for comment in comments:
+            comment.review(disabled)
+        return comments
+
+    def review(self, disabled):
+        self.disabled = disabled
+        self.reviewed = True
+        self.flagged = False
+
+    @staticmethod
+    def preload(comments):
+        """Batch-load the authors of a list of comments."""
+        return preload_authors(comments)
+
+    @staticmethod
+    def render(body):
         allowed_tags = ['a', 'abbr', 'acronym', 'b', 'code', 'i',
                         'em', 'strong']
-        html = markdown(value, output_format='html')
-        target.body_html = bleach.linkify(bleach.clean(html,
-                                                       tags=allowed_tags,
-                                                       strip=True))
+        html = markdown(body, output_format='html')
+        return bleach.linkify(bleach.clean(html,
+                                           tags=allowed_tags,
+                                           strip=True))
+
+    @staticmethod
+    def on_changed_body(target, value, oldvalue, initiator):
+        """for db.event.listen method"""
+        if current_app.config['FLASKY_ASYNC_RENDER']:
+            target.body_html = None
+        else:
+            target.body_html = Comment.render(value)
 
     def to_json(self):
         return {
@@ -352,4 +670,213 @@ class Comment(db.Model):
             'post_url': url_for('api.get_post', id=self.post_id)
         }
 
-db.event.listen(Comment.body, 'set', Comment.on_changed_body)
\ No newline at end of file
+db.event.listen(Comment.body, 'set', Comment.on_changed_body)
+
+# Keeping the full-text index in step with post and comment bodies.
+for model in (Post, Comment):
+    db.event.listen(model, 'after_insert', search.on_write)
+    db.event.listen(model, 'after_update', search.on_write)
+    db.event.listen(model, 'after_delete', search.on_delete)
+db.event.listen(db.metadata, 'after_create', search.after_create)
+db.event.listen(db.metadata, 'after_drop', search.after_drop)
+
+
+class CollectionVersion(db.Model):
+    """Changes to a table that its ``updated_at`` column can't show.
+
+    Collection ETags are built from the latest id and ``updated_at``,
+    which notice new and edited rows but not deleted ones. ``deletions``
+    covers those, without counting the table. ``edits`` counts changes
+    to tables without ``updated_at``, such as the user names and
+    avatars shown next to posts and comments. ``changed_at`` is the
+    time of the last change, for Last-Modified.
+    """
+    __tablename__ = 'collection_versions'
+    name = db.Column(db.String(64), primary_key=True)
+    deletions = db.Column(db.Integer, nullable=False, default=0)
+    edits = db.Column(db.Integer, nullable=False, default=0,
+                      server_default='0')
+    changed_at = db.Column(db.DateTime)
+
+    @staticmethod
+    def bump(connection, name, counter):
+        versions = CollectionVersion.__table__
+        now = datetime.utcnow()
+        bumped = connection.execute(versions.update().where(
+            versions.c.name == name).values(
+            {counter: versions.c[counter] + 1, 'changed_at': now}))
+        if not bumped.rowcount:
+            connection.execute(versions.insert().values(
+                {'name': name, 'deletions': 0, 'edits': 0, counter: 1,
+                 'changed_at': now}))
+
+    @staticmethod
+    def on_delete(mapper, connection, target):
+        """for db.event.listen method"""
+        CollectionVersion.bump(connection, mapper.local_table.name,
+                               'deletions')
+
+    @staticmethod
+    def on_profile_change(mapper, connection, target):
+        """for db.event.listen method"""
+        state = db.inspect(target)
+        if state.attrs.username.history.has_changes() or \
+                state.attrs.avatar_hash.history.has_changes():
+            CollectionVersion.bump(connection, 'users', 'edits')
+
+    @staticmethod
+    def stamps(*names):
+        """(name, deletions, edits, changed_at) of the named tables."""
+        return [tuple(row) for row in db.session.query(
+            CollectionVersion.name, CollectionVersion.deletions,
+            CollectionVersion.edits, CollectionVersion.changed_at)
+            .filter(CollectionVersion.name.in_(names))
+            .order_by(CollectionVersion.name)]
+
+
+for model in (Post, Comment):
+    db.event.listen(model, 'after_delete', CollectionVersion.on_delete)
+db.event.listen(User, 'after_update', CollectionVersion.on_profile_change)
+
+
+class OutboxMessage(db.Model):
+    """An email waiting for, or done with, delivery by the outbox."""
+    __tablename__ = 'outbox'
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    id = db.Column(db.Integer, primary_key=True)
+    sender = db.Column(db.String(128))
+    recipient = db.Column(db.String(128))
+    subject = db.Column(db.String(256))
+    body = db.Column(db.Text)
+    html = db.Column(db.Text)
+    status = db.Column(db.String(16), default=PENDING)
+    attempts = db.Column(db.Integer, default=0)
+    # When a pending message is due, or a claimed one may be reclaimed.
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    __table_args__ = (db.Index('ix_outbox_status_next_attempt_at',
+                               'status', 'next_attempt_at'),)
+
+    def __repr__(self):
+        return '<OutboxMessage %r %r>' % (self.id, self.status)
+
+
+def counter_listener(column, foreign_key, delta):
+    """Mapper event listener moving a denormalized counter by delta."""
+    def listener(mapper, connection, target):
+        id = getattr(target, foreign_key)
+        if id is None:
+            return
+        table = column.table
+        connection.execute(table.update()
+                           .where(table.c.id == id)
+                           .values({column.key: column + delta}))
+    return listener
+
+
+def repair_counters():
+    """Recompute drifted counters, returning the rows fixed per counter."""
+    users = User.__table__
+    posts = Post.__table__
+    follows = Follow.__table__
+    comments = Comment.__table__
+    actual_counts = [
+        (users.c.post_count, posts.c.author_id == users.c.id),
+        (users.c.follower_count, follows.c.followed_id == users.c.id),
+        (users.c.followed_count, follows.c.follower_id == users.c.id),
+        (posts.c.comment_count, comments.c.post_id == posts.c.id),
+    ]
+    limit = current_app.config['FLASKY_TIMELINE_FANOUT_LIMIT']
+    followers = db.select([db.func.count()]).where(
+        follows.c.followed_id == users.c.id).as_scalar()
+    # Authors the repair takes under the fan-out limit, with their counts.
+    dropped = db.session.execute(
+        db.select([users.c.id, users.c.follower_count, followers])
+        .where(users.c.follower_count >= limit)
+        .where(followers < limit)).fetchall()
+    repaired = {}
+    for column, condition in actual_counts:
+        actual = db.select([db.func.count()]).where(condition).as_scalar()
+        result = db.session.execute(
+            column.table.update()
+            .where(db.or_(column.is_(None), column != actual))
+            .values({column.key: actual}))
+        repaired[f'{column.table.name}.{column.key}'] = result.rowcount
+    connection = db.session.connection()
+    for author_id, previous, count in dropped:
+        TimelineEntry.followers_dropped(connection, author_id, previous,
+                                        count)
+    db.session.commit()
+    return repaired
+
+
+for model, column, foreign_key in [
+        (Post, User.__table__.c.post_count, 'author_id'),
+        (Follow, User.__table__.c.follower_count, 'followed_id'),
+        (Follow, User.__table__.c.followed_count, 'follower_id'),
+        (Comment, Post.__table__.c.comment_count, 'post_id')]:
+    db.event.listen(model, 'after_insert',
+                    counter_listener(column, foreign_key, 1))
+    db.event.listen(model, 'after_delete',
+                    counter_listener(column, foreign_key, -1))
+# Once the follower counts are updated.
+db.event.listen(Follow, 'after_delete', TimelineEntry.on_follower_lost)
+
+
+def queue_render(mapper, connection, target):
+    """Queue a pending body for rendering once the flush commits."""
+    if target.body_html is None and target.body is not None:
+        pending = object_session(target).info.setdefault('render_pending',
+                                                         [])
+        pending.append((type(target), target.id, target.body))
+
+
+def submit_renders(session):
+    for model, id, body in session.info.pop('render_pending', []):
+        tasks.submit(render_body, model, id, body)
+
+
+def discard_renders(session):
+    session.info.pop('render_pending', None)
+
+
+def render_body(model, id, body):
+    """Store the rendered html unless the body was edited meanwhile."""
+    table = model.__table__
+    db.session.execute(table.update()
+                       .where(table.c.id == id)
+                       .where(table.c.body == body)
+                       .values(body_html=model.render(body)))
+    db.session.commit()
+
+
+for model in (Post, Comment):
+    db.event.listen(model, 'after_insert', queue_render)
+    db.event.listen(model, 'after_update', queue_render)
+db.event.listen(db.session, 'after_commit', submit_renders)
+db.event.listen(db.session, 'after_rollback', discard_renders)
+
+# Dropping cached API credentials and snapshots when they change. The
+# User.role backref only exists once the mappers are configured.
+db.configure_mappers()
+for attribute in (User.password_hash, User.email, User.role_id, User.role,
+                  User.confirmed):
+    db.event.listen(attribute, 'set', AuthCache.on_user_changed)
+db.event.listen(Role.permissions, 'set', AuthCache.on_role_changed)
+db.event.listen(db.session, 'after_commit', auth_cache.after_commit)
+db.event.listen(db.session, 'after_rollback', auth_cache.after_rollback)
+
+# Drawing the identicons of new avatar hashes in the background.
+db.event.listen(User, 'after_insert', avatars.on_user_write)
+db.event.listen(User, 'after_update', avatars.on_user_write)
+db.event.listen(db.session, 'after_commit', avatars.after_commit)
+db.event.listen(db.session, 'after_rollback', avatars.after_rollback)
+
+# Keeping a client that wrote on the primary for a while.
+db.event.listen(db.session, 'after_commit', replica.after_commit)
+db.event.listen(db.session, 'after_rollback', replica.after_rollback)
@@ -0,0 +1,138 @@
+"""Keyset (cursor) pagination on (timestamp, id).
+
+OFFSET pagination gets slower with every page and needs a COUNT(*) for the
+page links. A keyset page instead starts right after the last row shown,
+which is a single index range scan whatever the depth. Legacy ``?page=``
+links still go through Flask-SQLAlchemy's ``paginate()``.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from flask import request, url_for
+
+from . import db
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def encode_cursor(timestamp, id, direction):
+    data = json.dumps([timestamp.strftime(TIMESTAMP_FORMAT), id, direction])
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode(
+        'ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (timestamp, id, direction), or None for a bad cursor."""
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, id, direction = json.loads(data.decode('utf-8'))
+        timestamp = datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+    except (binascii.Error, TypeError, ValueError):
+        return None
+    if not isinstance(id, int) or direction not in ('next', 'prev'):
+        return None
+    return timestamp, id, direction
+
+
+class KeysetPagination:
+    cursor_based = True
+
+    def __init__(self, query, per_page, timestamp, id, cursor=None,
+                 descending=True, last=False):
+        self.per_page = per_page
+        self.timestamp = timestamp
+        self.id = id
+        self.descending = descending
+        key = decode_cursor(cursor) if cursor else None
+        if key is not None:
+            backward = key[2] == 'prev'
+            query = query.filter(self._beyond(key[0], key[1], backward))
+        else:
+            backward = last
+        rows = query.order_by(*self._order(backward)).limit(
+            per_page + 1).all()
+        more = len(rows) > per_page
+        self.items = rows[:per_page]
+        if backward:
+            self.items.reverse()
+            self.has_prev = more
+            self.has_next = key is not None
+        else:
+            self.has_prev = key is not None
+            self.has_next = more
+
+    def _beyond(self, timestamp, id, backward):
+        """Rows strictly after the key, in the direction of travel."""
+        if self.descending != backward:
+            return db.or_(self.timestamp < timestamp,
+                          db.and_(self.timestamp == timestamp, self.id < id))
+        return db.or_(self.timestamp > timestamp,
+                      db.and_(self.timestamp == timestamp, self.id > id))
+
+    def _order(self, backward):
+        if self.descending != backward:
+            return self.timestamp.desc(), self.id.desc()
+        return self.timestamp.asc(), self.id.asc()
+
+    def _cursor(self, item, direction):
+        return encode_cursor(getattr(item, self.timestamp.key),
+                             getattr(item, self.id.key), direction)
+
+    @property
+    def prev_cursor(self):
+        if self.has_prev and self.items:
+            return self._cursor(self.items[0], 'prev')
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.items:
+            return self._cursor(self.items[-1], 'next')
+
+
+def paginate(query, per_page, timestamp, id, descending=True):
+    """Paginate the query from the request's ``cursor`` or ``page``.
+
+    ``?page=-1`` asks for the last page. When the model defines a
+    ``preload`` loader it is run on the page items, so that the related
+    rows templates and ``to_json()`` need are fetched in bulk.
+    """
+    page = request.args.get('page', type=int)
+    if page == -1:
+        pagination = KeysetPagination(query, per_page, timestamp, id,
+                                      descending=descending, last=True)
+    elif page is not None:
+        if descending:
+            query = query.order_by(timestamp.desc(), id.desc())
+        else:
+            query = query.order_by(timestamp.asc(), id.asc())
+        pagination = query.paginate(page, per_page, error_out=False)
+    else:
+        pagination = KeysetPagination(query, per_page, timestamp, id,
+                                      cursor=request.args.get('cursor'),
+                                      descending=descending)
+    preload = getattr(query.column_descriptions[0]['type'], 'preload', None)
+    if preload is not None:
+        preload(pagination.items)
+    return pagination
+
+
+def pagination_json(pagination, endpoint, **kwargs):
+    """The paging fields of an API collection response."""
+    if getattr(pagination, 'cursor_based', False):
+        prev = pagination.prev_cursor
+        next = pagination.next_cursor
+        return {'prev_url': prev and url_for(endpoint, cursor=prev, **kwargs),
+                'next_url': next and url_for(endpoint, cursor=next, **kwargs),
+                'prev': prev,
+                'next': next}
+    prev = None
+    if pagination.has_prev:
+        prev = url_for(endpoint, page=pagination.page - 1, **kwargs)
+    next = None
+    if pagination.has_next:
+        next = url_for(endpoint, page=pagination.page + 1, **kwargs)
+    return {'prev_url': prev,
+            'next_url': next,
+            'count': pagination.total}
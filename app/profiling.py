@@ -0,0 +1,155 @@
+"""Per-request SQL and template timing.
+
+A sampled request (FLASKY_PROFILE_SAMPLE_RATE) counts its queries and
+their time, its template render time and its slowest statements. The
+totals are sent back in a ``Server-Timing`` header and logged as one
+JSON line. The same SQL run FLASKY_PROFILE_REPEAT_THRESHOLD times or
+more in a request is the N+1 pattern; it is logged with the line of
+application code that issued it. Requests that are not sampled only
+pay for a random() call and a lookup in ``g`` per statement.
+"""
+import json
+import os
+import random
+import time
+import traceback
+
+from flask import (before_render_template, current_app, g,
+                   has_request_context, request, template_rendered)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+THIS_FILE = os.path.abspath(__file__)
+APP_DIR = os.path.dirname(THIS_FILE)
+
+
+def call_site():
+    """The innermost frame in this application outside this module."""
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(APP_DIR) and \
+                frame.filename != THIS_FILE:
+            return f'{os.path.relpath(frame.filename, APP_DIR)}:' \
+                f'{frame.lineno} in {frame.name}'
+
+
+class RequestProfile:
+    def __init__(self, config):
+        self.start = time.perf_counter()
+        self.slow_limit = config['FLASKY_PROFILE_SLOW_STATEMENTS']
+        self.repeat_threshold = config['FLASKY_PROFILE_REPEAT_THRESHOLD']
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.template_start = None
+        # statement -> [count, total seconds, call site]
+        self.statements = {}
+
+    def record_query(self, statement, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+        entry = self.statements.get(statement)
+        if entry is None:
+            self.statements[statement] = [1, elapsed, None]
+            return
+        entry[0] += 1
+        entry[1] += elapsed
+        if entry[0] == self.repeat_threshold:
+            entry[2] = call_site()
+
+    def slowest(self):
+        """Statements by total time, with how often they ran."""
+        ranked = sorted(self.statements.items(), key=lambda item: -item[1][1])
+        return [{'statement': statement, 'count': count,
+                 'ms': round(total * 1000, 2)}
+                for statement, (count, total, site)
+                in ranked[:self.slow_limit]]
+
+    def repeated(self):
+        return [{'statement': statement, 'count': count, 'call_site': site}
+                for statement, (count, total, site) in self.statements.items()
+                if count >= self.repeat_threshold]
+
+
+class RequestProfiler:
+    def init_app(self, app):
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        before_render_template.connect(self.before_render, app)
+        template_rendered.connect(self.after_render, app)
+        if not event.contains(Engine, 'before_cursor_execute',
+                              self.before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute',
+                         self.before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         self.after_cursor_execute)
+
+    @staticmethod
+    def current():
+        if has_request_context():
+            return g.get('profile')
+
+    def start(self):
+        rate = current_app.config['FLASKY_PROFILE_SAMPLE_RATE']
+        if rate and random.random() < rate:
+            g.profile = RequestProfile(current_app.config)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        if self.current() is not None:
+            conn.info.setdefault('profile_start', []).append(
+                time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters,
+                             context, executemany):
+        profile = self.current()
+        if profile is not None and conn.info.get('profile_start'):
+            started = conn.info['profile_start'].pop()
+            profile.record_query(statement, time.perf_counter() - started)
+
+    def before_render(self, sender, template, context, **extra):
+        profile = self.current()
+        if profile is not None:
+            if profile.template_depth == 0:
+                profile.template_start = time.perf_counter()
+            profile.template_depth += 1
+
+    def after_render(self, sender, template, context, **extra):
+        profile = self.current()
+        if profile is not None and profile.template_depth:
+            profile.template_depth -= 1
+            if profile.template_depth == 0:
+                profile.template_time += \
+                    time.perf_counter() - profile.template_start
+
+    def finish(self, response):
+        profile = self.current()
+        if profile is None:
+            return response
+        total = time.perf_counter() - profile.start
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={profile.db_time * 1000:.2f};'
+            f'desc="{profile.queries} queries", '
+            f'tmpl;dur={profile.template_time * 1000:.2f}, '
+            f'total;dur={total * 1000:.2f}')
+        repeated = profile.repeated()
+        current_app.logger.info(json.dumps({
+            'event': 'request_profile',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'ms': round(total * 1000, 2),
+            'queries': profile.queries,
+            'db_ms': round(profile.db_time * 1000, 2),
+            'template_ms': round(profile.template_time * 1000, 2),
+            'slowest': profile.slowest(),
+            'repeated': repeated,
+        }))
+        for entry in repeated:
+            current_app.logger.warning(
+                'N+1: %s ran %d times in %s %s, from %s',
+                entry['statement'], entry['count'], request.method,
+                request.path, entry['call_site'])
+        return response
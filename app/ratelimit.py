@@ -0,0 +1,189 @@
+"""Token bucket rate limits for the API, shared by the processes of a host.
+
+Each client has a bucket of ``requests`` tokens that refills at
+``requests / seconds`` tokens a second, and every API request takes one.
+A client is a user, or the remote address for requests that did not
+authenticate. Buckets are kept per endpoint for the endpoints in
+FLASKY_API_ENDPOINT_RATE_LIMITS, and shared by the rest of the API
+otherwise. An authenticated user gets the most generous limit of
+FLASKY_API_PERMISSION_RATE_LIMITS among their permissions, else
+FLASKY_API_RATE_LIMIT. A limit of None means no limit.
+
+The buckets live in a small hash table in FLASKY_RATELIMIT_FILE. Every
+worker process maps the file and takes an exclusive flock around each
+update, so the limits hold for the host, not per worker. A full table
+reuses the slot that was updated longest ago; a bucket that was dropped
+that way starts over full. Without a file, buckets are kept in this
+process only.
+
+Limited responses carry RateLimit-Limit, RateLimit-Remaining,
+RateLimit-Reset and RateLimit-Policy headers. Refused requests get a
+429 with Retry-After.
+"""
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from flask import current_app, g, request
+
+# Key digest, a value, such as the tokens left, and the time of the last
+# update.
+SLOT = struct.Struct('<Qdd')
+# Slots tried from a key's home slot before one is reused.
+PROBES = 8
+
+Decision = namedtuple('Decision',
+                      'allowed limit period remaining reset retry_after')
+
+
+class SharedSlots:
+    """A hash table of SLOT records in a file mapped by every process.
+
+    Without a path the table lives in this process only.
+    """
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        self.size = slots * SLOT.size
+        self.lock = threading.Lock()
+        self.pid = None
+        self.fd = None
+        self.map = None
+
+    def open(self):
+        # Opened in each process, since flock does not tell apart the
+        # processes that inherited one open file.
+        if self.fd is not None:
+            os.close(self.fd)
+        if self.path is None:
+            self.fd = None
+            self.map = mmap.mmap(-1, self.size)
+        else:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(self.fd).st_size != self.size:
+                    # Laid out for another table size: start empty.
+                    os.ftruncate(self.fd, 0)
+                    os.ftruncate(self.fd, self.size)
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            self.map = mmap.mmap(self.fd, self.size)
+        self.pid = os.getpid()
+
+    @contextmanager
+    def locked(self):
+        """Hold the table for this thread and process."""
+        with self.lock:
+            if self.pid != os.getpid():
+                self.open()
+            if self.fd is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if self.fd is not None:
+                    fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def digest(key):
+        return int.from_bytes(hashlib.blake2b(
+            key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+
+    def slot(self, digest):
+        """The offset of the slot for a key digest."""
+        home = digest % self.slots
+        oldest = None
+        for probe in range(PROBES):
+            offset = (home + probe) % self.slots * SLOT.size
+            key, _, updated = SLOT.unpack_from(self.map, offset)
+            if key == digest or key == 0:
+                return offset
+            if oldest is None or updated < oldest[1]:
+                oldest = (offset, updated)
+        return oldest[0]
+
+
+class SharedBuckets(SharedSlots):
+    def take(self, key, requests, seconds, now=None):
+        """Take a token from the bucket of key; returns a Decision."""
+        digest = self.digest(key)
+        rate = requests / seconds
+        now = time.time() if now is None else now
+        with self.locked():
+            offset = self.slot(digest)
+            stored, tokens, updated = SLOT.unpack_from(self.map, offset)
+            if stored != digest:
+                tokens = requests
+            else:
+                tokens = min(requests,
+                             tokens + max(now - updated, 0) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            SLOT.pack_into(self.map, offset, digest, tokens, now)
+        return Decision(allowed=allowed, limit=requests, period=seconds,
+                        remaining=int(tokens),
+                        reset=(requests - tokens) / rate,
+                        retry_after=0 if allowed else (1 - tokens) / rate)
+
+
+class RateLimiter:
+    def init_app(self, app):
+        app.extensions['ratelimit'] = SharedBuckets(
+            app.config['FLASKY_RATELIMIT_FILE'],
+            app.config['FLASKY_RATELIMIT_SLOTS'])
+
+    @staticmethod
+    def limit_for(user):
+        """(bucket scope, (requests, seconds) or None) of this request."""
+        from .models import Permission
+        config = current_app.config
+        endpoint_limits = config['FLASKY_API_ENDPOINT_RATE_LIMITS']
+        if request.endpoint in endpoint_limits:
+            return request.endpoint, endpoint_limits[request.endpoint]
+        if user is None:
+            return 'api', config['FLASKY_API_ANONYMOUS_RATE_LIMIT']
+        limits = [limit for name, limit in
+                  config['FLASKY_API_PERMISSION_RATE_LIMITS'].items()
+                  if user.can(getattr(Permission, name))]
+        if not limits:
+            return 'api', config['FLASKY_API_RATE_LIMIT']
+        if None in limits:
+            return 'api', None
+        return 'api', max(limits, key=lambda limit: limit[0] / limit[1])
+
+    def hit(self, user):
+        """Count a request of user, or of the remote address when user is
+        None; returns the Decision, or None if there is no limit."""
+        if user is not None and user.is_anonymous:
+            user = None
+        scope, limit = self.limit_for(user)
+        g.rate_limit = None
+        if limit is None:
+            return None
+        client = f'user:{user.id}' if user is not None \
+            else f'ip:{request.remote_addr}'
+        g.rate_limit = current_app.extensions['ratelimit'].take(
+            f'{scope}:{client}', *limit)
+        return g.rate_limit
+
+    @staticmethod
+    def add_headers(response):
+        decision = g.get('rate_limit')
+        if decision is not None:
+            response.headers['RateLimit-Limit'] = str(decision.limit)
+            response.headers['RateLimit-Remaining'] = \
+                str(decision.remaining)
+            response.headers['RateLimit-Reset'] = \
+                str(math.ceil(decision.reset))
+            response.headers['RateLimit-Policy'] = \
+                f'{decision.limit};w={decision.period}'
+        return response
@@ -0,0 +1,175 @@
+"""Reads from a database replica, writes to the primary.
+
+With FLASKY_REPLICA_DATABASE_URL set, the replica becomes the 'replica'
+bind. The session then decides per statement where it goes:
+
+- Flushes and INSERT, UPDATE and DELETE statements go to the primary.
+  After one of them, the rest of the transaction stays there too.
+- Views decorated with ``read_only`` run their GET and HEAD requests
+  against the replica. Login checks in before_request hooks, and
+  anything outside a request, still use the primary.
+- A client that wrote in the last FLASKY_REPLICA_STICKY_SECONDS reads
+  from the primary, so their new post or comment does not vanish while
+  the replica catches up. Browsers carry the deadline in the session
+  cookie. For API users it is kept in FLASKY_REPLICA_PIN_FILE, which
+  every worker process of the host maps, so their next request finds
+  it whichever worker serves it.
+
+The window must be longer than the replica can lag. For a replica kept
+by the database server, that is its replication delay. With SQLite,
+``flask replica-sync`` copies the primary file into the replica file,
+once or every few seconds.
+"""
+import sqlite3
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import orm
+from sqlalchemy.engine.url import make_url
+
+from .ratelimit import SLOT, SharedSlots
+
+BIND = 'replica'
+# Session cookie key of the time until which reads use the primary.
+PINNED_UNTIL = '_replica_pinned_until'
+
+
+def read_only(f):
+    """Let the GET and HEAD requests of a view read from the replica."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            g.replica_reads = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or getattr(clause, 'is_dml', False):
+            self.info['wrote'] = True
+        elif not self.info.get('wrote'):
+            engine = ReplicaRouter.engine_for_reads(self.app)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with sessions that know about the replica."""
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class SharedPins(SharedSlots):
+    """The time until which each API user reads from the primary."""
+    def pin(self, key, until):
+        digest = self.digest(key)
+        with self.locked():
+            SLOT.pack_into(self.map, self.slot(digest), digest, until,
+                           time.time())
+
+    def pinned_until(self, key):
+        digest = self.digest(key)
+        with self.locked():
+            stored, until, _ = SLOT.unpack_from(self.map, self.slot(digest))
+        return until if stored == digest else 0
+
+
+class ReplicaRouter:
+    def init_app(self, app):
+        self.configure(app)
+        app.extensions['replication'] = SharedPins(
+            app.config['FLASKY_REPLICA_PIN_FILE'],
+            app.config['FLASKY_REPLICA_PIN_SLOTS'])
+        app.before_request(self.start)
+        app.after_request(self.pin)
+
+    @staticmethod
+    def configure(app):
+        """Add the replica bind. Call again if its URL changes before the
+        engines are created."""
+        url = app.config['FLASKY_REPLICA_DATABASE_URL']
+        if url:
+            binds = dict(app.config['SQLALCHEMY_BINDS'] or {})
+            binds[BIND] = url
+            app.config['SQLALCHEMY_BINDS'] = binds
+
+    @staticmethod
+    def engine_for_reads(app):
+        """The replica engine if this statement may read from it."""
+        if BIND not in (app.config['SQLALCHEMY_BINDS'] or ()) or \
+                not has_request_context() or not g.get('replica_reads') or \
+                ReplicaRouter.pinned(app):
+            return None
+        return get_state(app).db.get_engine(app, bind=BIND)
+
+    @staticmethod
+    def pinned(app):
+        """Whether the client wrote within the sticky window."""
+        if g.get('replica_wrote'):
+            return True
+        if g.get('replica_pinned') is None:
+            # Looked up once per request, not per statement.
+            until = session.get(PINNED_UNTIL, 0)
+            user_id = getattr(g.get('current_user'), 'id', None)
+            if user_id is not None:
+                until = max(until, app.extensions['replication']
+                            .pinned_until(f'user:{user_id}'))
+            g.replica_pinned = until > time.time()
+        return g.replica_pinned
+
+    @staticmethod
+    def start():
+        # The app context, and so g, may outlive a request.
+        g.replica_reads = False
+        g.replica_wrote = False
+        g.replica_pinned = None
+
+    @staticmethod
+    def pin(response):
+        if g.get('replica_wrote'):
+            until = time.time() + \
+                current_app.config['FLASKY_REPLICA_STICKY_SECONDS']
+            session[PINNED_UNTIL] = until
+            user_id = getattr(g.get('current_user'), 'id', None)
+            if user_id is not None:
+                current_app.extensions['replication'].pin(
+                    f'user:{user_id}', until)
+        return response
+
+    # Session events, registered in models.py.
+
+    @staticmethod
+    def after_commit(session):
+        if session.info.pop('wrote', False) and has_request_context():
+            g.replica_wrote = True
+
+    @staticmethod
+    def after_rollback(session):
+        session.info.pop('wrote', None)
+
+    @staticmethod
+    def sync():
+        """Copy the SQLite primary into the SQLite replica file.
+
+        The copy goes through SQLite's online backup, so readers of the
+        replica see either the old or the new snapshot, never a mix.
+        """
+        if not current_app.config['FLASKY_REPLICA_DATABASE_URL']:
+            raise ValueError('FLASKY_REPLICA_DATABASE_URL is not set')
+        primary = make_url(current_app.config['SQLALCHEMY_DATABASE_URI'])
+        replica = make_url(current_app.config['FLASKY_REPLICA_DATABASE_URL'])
+        for url in (primary, replica):
+            if url.get_backend_name() != 'sqlite' or \
+                    url.database in (None, '', ':memory:'):
+                raise ValueError(f'{url!r} is not an SQLite database file')
+        source = sqlite3.connect(primary.database)
+        target = sqlite3.connect(replica.database)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
@@ -1,5 +1,6 @@
 
 import os
+import tempfile
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -20,6 +21,131 @@ class Config:
     FLASKY_POSTS_PER_PAGE = 5
     FLASKY_FOLLOWERS_PER_PAGE = 10
     FLASKY_COMMENTS_PER_PAGE = 2
+    # Authors with at least this many followers are merged into home
+    # timelines at read time instead of being fanned out on write.
+    FLASKY_TIMELINE_FANOUT_LIMIT = 1000
+    # Timeline depth per followed author: every post since the follow,
+    # plus this many of the newest posts written before it.
+    FLASKY_TIMELINE_BACKFILL = 100
+    # Bounds of the in-process follow graph index: total followed ids
+    # held, and seconds before a user's entry is reloaded.
+    FLASKY_FOLLOW_INDEX_MAX_EDGES = 1000000
+    FLASKY_FOLLOW_INDEX_TTL = 60
+    # Threads of the background task pool.
+    FLASKY_TASK_WORKERS = int(os.environ.get('FLASKY_TASK_WORKERS', '2'))
+    # Render markdown bodies in the task pool instead of on save.
+    FLASKY_ASYNC_RENDER = os.environ.get('FLASKY_ASYNC_RENDER', '').lower() \
+        in ['true', 'on', '1']
+    # Size limit of the rendered post and comment fragment cache.
+    FLASKY_FRAGMENT_CACHE_BYTES = 8 * 1024 * 1024
+    # last_seen is updated at most once per granularity, and buffered
+    # updates are written every flush interval (both in seconds).
+    FLASKY_LAST_SEEN_GRANULARITY = 60
+    FLASKY_LAST_SEEN_FLUSH_INTERVAL = 10
+    # Verified API tokens and user snapshots kept by the API auth path,
+    # and how many seconds a user snapshot is trusted.
+    FLASKY_TOKEN_CACHE_SIZE = 10000
+    FLASKY_USER_SNAPSHOT_TTL = 5
+    # Seconds a successful Basic auth password check is remembered;
+    # 0 checks the password hash on every request.
+    FLASKY_CREDENTIAL_CACHE_TTL = int(
+        os.environ.get('FLASKY_CREDENTIAL_CACHE_TTL', '0'))
+    # Share of requests profiled (0 to 1), how many of their slowest
+    # statements are logged, and how often the same statement may run in
+    # one request before it is reported as an N+1 query.
+    FLASKY_PROFILE_SAMPLE_RATE = float(
+        os.environ.get('FLASKY_PROFILE_SAMPLE_RATE', '0'))
+    FLASKY_PROFILE_SLOW_STATEMENTS = 3
+    FLASKY_PROFILE_REPEAT_THRESHOLD = 5
+    # Email outbox: sender threads, messages per SMTP batch, attempts
+    # before a message is dead, first retry delay (doubling up to the
+    # maximum), idle poll interval and claim lease, all in seconds.
+    FLASKY_MAIL_WORKERS = int(os.environ.get('FLASKY_MAIL_WORKERS', '2'))
+    FLASKY_MAIL_BATCH_SIZE = 20
+    FLASKY_MAIL_MAX_ATTEMPTS = 5
+    FLASKY_MAIL_RETRY_BACKOFF = 30
+    FLASKY_MAIL_MAX_BACKOFF = 3600
+    FLASKY_MAIL_POLL_INTERVAL = 10
+    FLASKY_MAIL_LEASE = 300
+    # Rows fetched per server-side cursor round trip by the API export.
+    FLASKY_EXPORT_CHUNK_ROWS = 500
+    # Full-text search: 'fts5', 'like' or 'auto' (fts5 on SQLite), hits
+    # per page and the most words of a query that are used.
+    FLASKY_SEARCH_BACKEND = os.environ.get('FLASKY_SEARCH_BACKEND', 'auto')
+    FLASKY_SEARCH_PER_PAGE = 10
+    FLASKY_SEARCH_MAX_TERMS = 8
+    # Most comments one bulk moderation action may change.
+    FLASKY_MODERATION_BATCH_SIZE = 100
+    # Serve identicons from this app instead of linking to gravatar.com.
+    # Avatars are stored on disk in each of the sizes the templates use
+    # and may be cached by clients for max-age seconds.
+    FLASKY_LOCAL_AVATARS = os.environ.get(
+        'FLASKY_LOCAL_AVATARS', 'false').lower() in ['true', 'on', '1']
+    FLASKY_AVATAR_DIR = os.environ.get('FLASKY_AVATAR_DIR') or \
+        os.path.join(basedir, 'avatars')
+    FLASKY_AVATAR_SIZES = (40, 256)
+    FLASKY_AVATAR_MAX_AGE = 365 * 24 * 3600
+    # Database connection pool, for SQLite files and server databases.
+    FLASKY_DB_POOL_SIZE = int(os.environ.get('FLASKY_DB_POOL_SIZE', '5'))
+    FLASKY_DB_MAX_OVERFLOW = int(os.environ.get('FLASKY_DB_MAX_OVERFLOW',
+                                                '10'))
+    FLASKY_DB_POOL_RECYCLE = int(os.environ.get('FLASKY_DB_POOL_RECYCLE',
+                                                '3600'))
+    FLASKY_DB_POOL_TIMEOUT = int(os.environ.get('FLASKY_DB_POOL_TIMEOUT',
+                                                '30'))
+    # Run on every new SQLite connection. WAL lets pages be read while a
+    # write commits, and NORMAL sync is durable enough with WAL. The map
+    # and page cache sizes are in bytes and KiB (negative), busy_timeout
+    # in milliseconds.
+    FLASKY_SQLITE_PRAGMAS = {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,
+        'busy_timeout': 5000,
+    }
+    # Read replica for the read-only views, and the seconds a client that
+    # wrote keeps reading from the primary. Keep the window above the
+    # replica's lag, e.g. the replica-sync interval.
+    FLASKY_REPLICA_DATABASE_URL = os.environ.get('REPLICA_DATABASE_URL')
+    FLASKY_REPLICA_STICKY_SECONDS = int(
+        os.environ.get('FLASKY_REPLICA_STICKY_SECONDS', '10'))
+    # File holding those deadlines of API users for every worker process
+    # of the host, and how many users it has room for (24 bytes each).
+    FLASKY_REPLICA_PIN_FILE = os.environ.get('FLASKY_REPLICA_PIN_FILE') or \
+        os.path.join(tempfile.gettempdir(), 'flasky-replica-pins')
+    FLASKY_REPLICA_PIN_SLOTS = 10000
+    # Response compression: the types compressed, the smallest body worth
+    # it in bytes, and the gzip level and brotli quality used per request.
+    # Static files are compressed ahead of time by `flask assets compress`.
+    FLASKY_COMPRESS_MIMETYPES = {
+        'text/html', 'text/css', 'text/plain', 'text/xml',
+        'text/javascript', 'application/javascript', 'application/json',
+        'application/x-ndjson', 'image/svg+xml', 'image/x-icon',
+        'image/vnd.microsoft.icon'}
+    FLASKY_COMPRESS_MIN_SIZE = 500
+    FLASKY_COMPRESS_LEVEL = 6
+    FLASKY_COMPRESS_BROTLI_QUALITY = 4
+    # Seconds clients may cache static files under content-hashed names,
+    # built by `flask assets build`.
+    FLASKY_ASSETS_MAX_AGE = 365 * 24 * 3600
+    # API rate limits as (requests, seconds): a burst of that many
+    # requests, refilled evenly over that many seconds. Users get the
+    # most generous limit of their permissions, others the default;
+    # clients that did not log in are counted by address. Endpoints
+    # listed have buckets of their own. None means no limit.
+    FLASKY_API_RATE_LIMIT = (300, 60)
+    FLASKY_API_ANONYMOUS_RATE_LIMIT = (30, 60)
+    FLASKY_API_PERMISSION_RATE_LIMITS = {'MODERATE': (1200, 60),
+                                         'ADMIN': None}
+    FLASKY_API_ENDPOINT_RATE_LIMITS = {'api.get_token': (10, 60),
+                                       'api.export_user': (10, 3600),
+                                       'api.export_all': (10, 3600)}
+    # File holding the buckets for every worker process of the host, and
+    # how many clients it has room for (24 bytes each).
+    FLASKY_RATELIMIT_FILE = os.environ.get('FLASKY_RATELIMIT_FILE') or \
+        os.path.join(tempfile.gettempdir(), 'flasky-ratelimit')
+    FLASKY_RATELIMIT_SLOTS = 65536
 
     @staticmethod
     def init_app(app):
@@ -28,6 +154,8 @@ class Config:
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    FLASKY_PROFILE_SAMPLE_RATE = float(
+        os.environ.get('FLASKY_PROFILE_SAMPLE_RATE', '1'))
     SQLALCHEMY_DATABASE_URI = os.environ.get('DEV_DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'data-dev.sqlite')
 
@@ -37,6 +165,16 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite://'
+    # The in-memory database is one connection shared by every thread,
+    # concurrent tasks would roll back each other's transactions, so
+    # background work is serialized or done inline. Tests send queued
+    # mail by draining the outbox.
+    FLASKY_TASK_WORKERS = 1
+    FLASKY_LAST_SEEN_FLUSH_INTERVAL = 0
+    FLASKY_MAIL_WORKERS = 0
+    # Rate limit buckets and replica pins of each test app start empty.
+    FLASKY_RATELIMIT_FILE = None
+    FLASKY_REPLICA_PIN_FILE = None
 
 
 class ProductionConfig(Config):
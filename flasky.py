@@ -1,12 +1,19 @@
 
+import json
 import os
+import shutil
 import sys
+import tempfile
+import time
 import click
 
 from flask_migrate import Migrate
 
-from app import create_app, db
-from app.models import User, Role, Post, Follow
+from app import create_app, db, db_profile, last_seen_buffer, outbox, \
+    search, avatars, replica
+from app.models import User, Role, Post, Follow, repair_counters
+from app.compression import brotli, precompress
+from app.fingerprint import BUILD_DIR, build
 
 COV = None
 if os.environ.get('FLASK_COVERAGE'):
@@ -61,4 +68,172 @@ def profile(length, profile_dir):
     app.wsgi_app = ProfilerMiddleware(app.wsgi_app, restrictions=[length],
                                       profile_dir=profile_dir)
     os.environ['FLASK_RUN_FROM_CLI'] = '1'
-    app.run(debug=False)
\ No newline at end of file
+    app.run(debug=False)
+
+
+@app.cli.command('repair-counters')
+def repair_counters_command():
+    """Recompute the denormalized counters that have drifted."""
+    for counter, count in repair_counters().items():
+        print(f'{counter}: {count} repaired')
+
+
+@app.cli.command('outbox')
+@click.option('--drain', is_flag=True,
+              help='Send every due message before reporting.')
+def outbox_command(drain):
+    """Show the email outbox queue depth."""
+    if drain:
+        print(f'{outbox.drain()} sent')
+    print(json.dumps(outbox.stats(), indent=2))
+
+
+@app.cli.command('db-profile')
+def db_profile_command():
+    """Show the database pool and pragmas in effect."""
+    report = db_profile.report()
+    print(json.dumps(report, indent=2))
+    for name in db_profile.mismatches(report):
+        print(f'warning: {name} is {report["pragmas"][name]["effective"]}, '
+              f'not {report["pragmas"][name]["configured"]}')
+
+
+@app.cli.command('replica-sync')
+@click.option('--interval', default=0,
+              help='Copy again every this many seconds; 0 copies once.')
+def replica_sync_command(interval):
+    """Copy the SQLite primary database into the replica file."""
+    while True:
+        try:
+            replica.sync()
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        print(f'replica synced at {time.strftime("%H:%M:%S")}')
+        if not interval:
+            break
+        time.sleep(interval)
+
+
+@app.cli.group()
+def assets():
+    """Prepare the static files for serving."""
+
+
+@assets.command('compress')
+def assets_compress_command():
+    """Write a gzip and a brotli copy of each static file."""
+    if brotli is None:
+        print('brotli is not installed, writing gzip copies only')
+    for path in precompress(app.static_folder):
+        print(os.path.relpath(path))
+
+
+@assets.command('build')
+def assets_build_command():
+    """Copy the static files to content-hashed names and compress them."""
+    manifest = build(app.static_folder)
+    for name, hashed in sorted(manifest.items()):
+        print(f'{name} -> {hashed}')
+    precompress(os.path.join(app.static_folder, BUILD_DIR))
+    print(f'{len(manifest)} files built, restart the app to serve them')
+
+
+@app.cli.command('search-rebuild')
+def search_rebuild_command():
+    """Rebuild the full-text search index from every post and comment."""
+    search.rebuild()
+    print('search index rebuilt')
+
+
+@app.cli.command('avatars')
+def avatars_command():
+    """Draw the identicons of every user that are not stored yet."""
+    hashes = {hash for hash, in db.session.query(User.avatar_hash)
+              .filter(User.avatar_hash.isnot(None))}
+    print(f'{avatars.generate(sorted(hashes))} identicons drawn '
+          f'for {len(hashes)} users')
+
+
+@app.cli.command('fake')
+@click.option('--users', default=1000, help='Number of users.')
+@click.option('--posts', default=10000, help='Number of posts.')
+@click.option('--comments', default=10000, help='Number of comments.')
+@click.option('--follows', default=20,
+              help='Average number of users each user follows.')
+@click.option('--seed', default=0, help='Random seed, for repeatable data.')
+@click.option('--now', default=None, type=click.DateTime(),
+              help='Time the generated timestamps lead up to, for '
+                   'repeatable data. Defaults to 2024-01-01.')
+@click.option('--batch-size', default=5000, help='Rows per INSERT batch.')
+@click.option('--workers', default=None, type=int,
+              help='Markdown render processes, 0 renders in-process.')
+def fake_command(users, posts, comments, follows, seed, now, batch_size,
+                 workers):
+    """Bulk insert fake users, follows, posts and comments."""
+    from app import fake
+    fake.bulk(users, posts, comments, follows, seed=seed,
+              now=now or fake.EPOCH, batch_size=batch_size, workers=workers,
+              echo=click.echo)
+
+
+@app.cli.command()
+@click.option('--users', default=200, help='Users to seed.')
+@click.option('--posts', default=2000, help='Posts to seed.')
+@click.option('--comments', default=2000, help='Comments to seed.')
+@click.option('--requests', default=1000, help='Requests to send in total.')
+@click.option('--concurrency', default=1, help='Concurrent clients.')
+@click.option('--server/--no-server', default=False,
+              help='Send requests over HTTP to a threaded local server '
+                   'instead of the test client.')
+@click.option('--database', default=None,
+              help='SQLAlchemy URL to benchmark against. It is seeded if it '
+                   'has no users, and otherwise left as it was. Defaults to '
+                   'a temporary SQLite file.')
+@click.option('--seed', default=0, help='Random seed for data and traffic.')
+@click.option('--output', default=None, type=click.Path(),
+              help='Write the JSON report to this file.')
+@click.option('--baseline', default=None, type=click.Path(exists=True),
+              help='Report to compare against; exits 1 on a regression.')
+@click.option('--tolerance', default=0.1,
+              help='Allowed p95 slowdown against the baseline.')
+def bench(users, posts, comments, requests, concurrency, server, database,
+          seed, output, baseline, tolerance):
+    """Seed a database and load test the app."""
+    from app import fake
+    from app.bench import Benchmark, compare
+    tmpdir = None
+    if database is None:
+        tmpdir = tempfile.mkdtemp()
+        database = 'sqlite:///' + os.path.join(tmpdir, 'bench.sqlite')
+    bench_app = create_app(os.getenv('FLASK_CONFIG') or 'default')
+    bench_app.config.update(SQLALCHEMY_DATABASE_URI=database,
+                            WTF_CSRF_ENABLED=False,
+                            MAIL_SUPPRESS_SEND=True)
+    db_profile.configure(bench_app)
+    try:
+        with bench_app.app_context():
+            db.create_all()
+            if User.query.first() is None:
+                Role.insert_roles()
+                fake.bulk(users, posts, comments, seed=seed,
+                          echo=click.echo)
+        report = Benchmark(bench_app, requests=requests,
+                           concurrency=concurrency, server=server,
+                           seed=seed).run()
+    finally:
+        last_seen_buffer.flush(bench_app)
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    click.echo(text)
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(report, json.load(f), tolerance)
+        for name, regression in regressions.items():
+            click.echo(f'{name}: p95 {regression["p95"]:.1f}ms, baseline '
+                       f'{regression["baseline_p95"]:.1f}ms', err=True)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,41 @@
+"""Add outbox table
+
+Revision ID: 3f9b2c7d1e05
+Revises: 8c3e0f6a4d27
+Create Date: 2026-10-18 17:52:10.402915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9b2c7d1e05'
+down_revision = '8c3e0f6a4d27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sender', sa.String(length=128), nullable=True),
+    sa.Column('recipient', sa.String(length=128), nullable=True),
+    sa.Column('subject', sa.String(length=256), nullable=True),
+    sa.Column('body', sa.Text(), nullable=True),
+    sa.Column('html', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_outbox_status_next_attempt_at', 'outbox',
+                    ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_outbox_status_next_attempt_at', table_name='outbox')
+    op.drop_table('outbox')
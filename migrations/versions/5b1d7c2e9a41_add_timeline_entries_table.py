@@ -0,0 +1,48 @@
+"""Add timeline_entries table
+
+Revision ID: 5b1d7c2e9a41
+Revises: 28e7fb0365d6
+Create Date: 2026-10-18 09:12:40.118532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1d7c2e9a41'
+down_revision = '28e7fb0365d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('timeline_entries',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['author_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'post_id')
+    )
+    op.create_index(op.f('ix_timeline_entries_author_id'), 'timeline_entries',
+                    ['author_id'], unique=False)
+    op.create_index('ix_timeline_entries_user_id_timestamp',
+                    'timeline_entries', ['user_id', 'timestamp'],
+                    unique=False)
+    # Backfill every existing timeline from the follow graph.
+    op.execute('INSERT INTO timeline_entries '
+               '(user_id, post_id, author_id, timestamp) '
+               'SELECT follows.follower_id, posts.id, posts.author_id, '
+               'posts.timestamp FROM follows '
+               'JOIN posts ON posts.author_id = follows.followed_id')
+
+
+def downgrade():
+    op.drop_index('ix_timeline_entries_user_id_timestamp',
+                  table_name='timeline_entries')
+    op.drop_index(op.f('ix_timeline_entries_author_id'),
+                  table_name='timeline_entries')
+    op.drop_table('timeline_entries')
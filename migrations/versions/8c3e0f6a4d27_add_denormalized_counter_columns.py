@@ -0,0 +1,47 @@
+"""Add denormalized counter columns
+
+Revision ID: 8c3e0f6a4d27
+Revises: 5b1d7c2e9a41
+Create Date: 2026-10-18 11:40:02.551903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c3e0f6a4d27'
+down_revision = '5b1d7c2e9a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('post_count', sa.Integer(),
+                                     server_default='0', nullable=True))
+    op.add_column('users', sa.Column('follower_count', sa.Integer(),
+                                     server_default='0', nullable=True))
+    op.add_column('users', sa.Column('followed_count', sa.Integer(),
+                                     server_default='0', nullable=True))
+    op.add_column('posts', sa.Column('comment_count', sa.Integer(),
+                                     server_default='0', nullable=True))
+    # Backfill the counters from the existing rows.
+    op.execute('UPDATE users SET '
+               'post_count = (SELECT count(*) FROM posts '
+               'WHERE posts.author_id = users.id), '
+               'follower_count = (SELECT count(*) FROM follows '
+               'WHERE follows.followed_id = users.id), '
+               'followed_count = (SELECT count(*) FROM follows '
+               'WHERE follows.follower_id = users.id)')
+    op.execute('UPDATE posts SET '
+               'comment_count = (SELECT count(*) FROM comment '
+               'WHERE comment.post_id = posts.id)')
+
+
+def downgrade():
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('comment_count')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('followed_count')
+        batch_op.drop_column('follower_count')
+        batch_op.drop_column('post_count')
@@ -0,0 +1,39 @@
+"""Add updated_at columns to posts and comment
+
+Revision ID: a47e5c0b9d13
+Revises: 3f9b2c7d1e05
+Create Date: 2026-10-18 18:05:31.227460
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a47e5c0b9d13'
+down_revision = '3f9b2c7d1e05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('updated_at', sa.DateTime(),
+                                     nullable=True))
+    op.add_column('comment', sa.Column('updated_at', sa.DateTime(),
+                                       nullable=True))
+    # Existing rows count as last written when they were created.
+    op.execute('UPDATE posts SET updated_at = timestamp')
+    op.execute('UPDATE comment SET updated_at = timestamp')
+    op.create_index(op.f('ix_posts_updated_at'), 'posts', ['updated_at'],
+                    unique=False)
+    op.create_index(op.f('ix_comment_updated_at'), 'comment', ['updated_at'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_comment_updated_at'), table_name='comment')
+    op.drop_index(op.f('ix_posts_updated_at'), table_name='posts')
+    with op.batch_alter_table('comment') as batch_op:
+        batch_op.drop_column('updated_at')
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('updated_at')
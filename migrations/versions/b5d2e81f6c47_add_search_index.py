@@ -0,0 +1,34 @@
+"""Add the full-text search index
+
+Revision ID: b5d2e81f6c47
+Revises: a47e5c0b9d13
+Create Date: 2026-10-18 19:12:08.514302
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d2e81f6c47'
+down_revision = 'a47e5c0b9d13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Only SQLite has FTS5; other databases search with LIKE.
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("CREATE VIRTUAL TABLE search_index "
+               "USING fts5(body, tokenize='porter unicode61')")
+    op.execute('INSERT INTO search_index (rowid, body) '
+               'SELECT id * 2, body FROM posts WHERE body IS NOT NULL')
+    op.execute('INSERT INTO search_index (rowid, body) '
+               'SELECT id * 2 + 1, body FROM comment WHERE body IS NOT NULL '
+               'AND (disabled IS NULL OR disabled = 0)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute('DROP TABLE search_index')
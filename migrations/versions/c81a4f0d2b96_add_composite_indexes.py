@@ -0,0 +1,33 @@
+"""Add composite indexes for per-author, per-post and follower lookups
+
+Revision ID: c81a4f0d2b96
+Revises: b5d2e81f6c47
+Create Date: 2026-10-18 19:48:51.093317
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81a4f0d2b96'
+down_revision = 'b5d2e81f6c47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_posts_author_id_timestamp', 'posts',
+                    ['author_id', 'timestamp'], unique=False)
+    op.create_index('ix_comment_post_id_timestamp', 'comment',
+                    ['post_id', 'timestamp'], unique=False)
+    op.create_index('ix_comment_author_id_timestamp', 'comment',
+                    ['author_id', 'timestamp'], unique=False)
+    op.create_index('ix_follows_followed_id_follower_id', 'follows',
+                    ['followed_id', 'follower_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_follows_followed_id_follower_id', table_name='follows')
+    op.drop_index('ix_comment_author_id_timestamp', table_name='comment')
+    op.drop_index('ix_comment_post_id_timestamp', table_name='comment')
+    op.drop_index('ix_posts_author_id_timestamp', table_name='posts')
@@ -0,0 +1,39 @@
+"""Add comment reviewed and flagged columns and the review queue index
+
+Revision ID: d3f7a9c41e28
+Revises: c81a4f0d2b96
+Create Date: 2026-10-18 20:21:37.640195
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f7a9c41e28'
+down_revision = 'c81a4f0d2b96'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('comment', sa.Column('reviewed', sa.Boolean(),
+                                       server_default=sa.false(),
+                                       nullable=False))
+    op.add_column('comment', sa.Column('flagged', sa.Boolean(),
+                                       server_default=sa.false(),
+                                       nullable=False))
+    # Comments a moderator already disabled have been reviewed.
+    op.execute(sa.text('UPDATE comment SET reviewed = :true '
+                       'WHERE disabled = :true').bindparams(true=True))
+    op.create_index('ix_comment_review_queue', 'comment', ['timestamp'],
+                    unique=False,
+                    sqlite_where=sa.text('reviewed = 0 OR flagged = 1'),
+                    postgresql_where=sa.text('NOT reviewed OR flagged'))
+
+
+def downgrade():
+    op.drop_index('ix_comment_review_queue', table_name='comment')
+    with op.batch_alter_table('comment') as batch_op:
+        batch_op.drop_column('flagged')
+        batch_op.drop_column('reviewed')
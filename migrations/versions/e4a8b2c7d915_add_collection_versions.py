@@ -0,0 +1,27 @@
+"""Add collection_versions, the deletion stamps of collection ETags
+
+Revision ID: e4a8b2c7d915
+Revises: d3f7a9c41e28
+Create Date: 2026-10-18 22:40:12.318406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a8b2c7d915'
+down_revision = 'd3f7a9c41e28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('collection_versions',
+                    sa.Column('name', sa.String(length=64), nullable=False),
+                    sa.Column('deletions', sa.Integer(), nullable=False),
+                    sa.PrimaryKeyConstraint('name'))
+
+
+def downgrade():
+    op.drop_table('collection_versions')
@@ -0,0 +1,30 @@
+"""Add edits and changed_at to collection_versions
+
+Revision ID: f2c6d8a1b374
+Revises: e4a8b2c7d915
+Create Date: 2026-10-19 10:12:47.502916
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c6d8a1b374'
+down_revision = 'e4a8b2c7d915'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('collection_versions',
+                  sa.Column('edits', sa.Integer(), server_default='0',
+                            nullable=False))
+    op.add_column('collection_versions',
+                  sa.Column('changed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('collection_versions') as batch_op:
+        batch_op.drop_column('changed_at')
+        batch_op.drop_column('edits')
@@ -0,0 +1,67 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from flask import url_for
+from app import create_app, assets
+from app.fingerprint import build
+
+
+class AssetsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.static = tempfile.mkdtemp()
+        for name in ('styles.css', 'favicon.ico'):
+            shutil.copy(os.path.join(self.app.static_folder, name),
+                        self.static)
+        self.app.static_folder = self.static
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.app_context.pop()
+        shutil.rmtree(self.static)
+
+    def digest(self, name):
+        with open(os.path.join(self.static, name), 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()[:12]
+
+    def test_build_names_copies_by_content(self):
+        manifest = build(self.static)
+        hashed = f'dist/styles.{self.digest("styles.css")}.css'
+        self.assertEqual(manifest['styles.css'], hashed)
+        self.assertEqual(set(manifest), {'styles.css', 'favicon.ico'})
+        with open(os.path.join(self.static, 'styles.css'), 'a') as f:
+            f.write('p { margin: 0; }\n')
+        changed = build(self.static)['styles.css']
+        self.assertNotEqual(changed, hashed)
+        # The old copy stays for pages that still link to it.
+        for name in (hashed, changed):
+            self.assertTrue(os.path.isfile(os.path.join(self.static, name)))
+
+    def test_url_for_uses_manifest(self):
+        with self.app.test_request_context('/'):
+            self.assertEqual(url_for('static', filename='styles.css'),
+                             '/static/styles.css')
+        manifest = build(self.static)
+        assets.load(self.app)
+        with self.app.test_request_context('/'):
+            self.assertEqual(url_for('static', filename='styles.css'),
+                             '/static/' + manifest['styles.css'])
+            self.assertEqual(url_for('static', filename='missing.js'),
+                             '/static/missing.js')
+
+    def test_hashed_files_are_immutable(self):
+        manifest = build(self.static)
+        assets.load(self.app)
+        response = self.client.get('/static/' + manifest['styles.css'])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.cache_control.immutable)
+        self.assertTrue(response.cache_control.public)
+        self.assertEqual(response.cache_control.max_age, 365 * 24 * 3600)
+        response.close()
+        response = self.client.get('/static/styles.css')
+        self.assertFalse(response.cache_control.immutable)
+        response.close()
@@ -0,0 +1,168 @@
+import time
+import unittest
+from base64 import b64encode
+from sqlalchemy import event
+from app import create_app, db, auth_cache
+from app.models import Role, User
+
+
+class AuthCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.user = User(username='john', email='john@example.com',
+                         password='cat', confirmed=True)
+        db.session.add(self.user)
+        db.session.commit()
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.record)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.record)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def record(self, conn, cursor, statement, parameters, context,
+               executemany):
+        self.statements.append(statement)
+
+    def user_selects(self):
+        return [s for s in self.statements
+                if s.lstrip().startswith('SELECT') and 'FROM users' in s]
+
+    def get_posts(self, token, password=''):
+        return self.client.get('/api/v1/posts/', headers={
+            'Authorization': 'Basic ' + b64encode(
+                (token + ':' + password).encode('utf-8')).decode('utf-8'),
+            'Accept': 'application/json'})
+
+    def enable_credential_cache(self):
+        self.app.config['FLASKY_CREDENTIAL_CACHE_TTL'] = 60
+        self.app.extensions['auth_cache'] = type(
+            self.app.extensions['auth_cache'])(self.app.config)
+        return self.app.extensions['auth_cache'].credentials
+
+    def test_repeated_token_skips_user_query(self):
+        token = self.user.generate_auth_token()
+        self.assertEqual(self.get_posts(token).status_code, 200)
+        self.statements = []
+        self.assertEqual(self.get_posts(token).status_code, 200)
+        self.assertEqual(self.user_selects(), [])
+
+    def test_expired_token_is_rejected(self):
+        token = self.user.generate_auth_token(expiration=1)
+        self.assertEqual(self.get_posts(token).status_code, 200)
+        time.sleep(2)
+        self.assertEqual(self.get_posts(token).status_code, 401)
+
+    def test_bad_token_is_rejected(self):
+        self.assertEqual(self.get_posts('not-a-token').status_code, 401)
+
+    def test_confirmed_change_invalidates_snapshot(self):
+        token = self.user.generate_auth_token()
+        self.assertEqual(self.get_posts(token).status_code, 200)
+        self.user.confirmed = False
+        db.session.commit()
+        self.assertEqual(self.get_posts(token).status_code, 403)
+
+    def test_role_change_invalidates_snapshot(self):
+        token = self.user.generate_auth_token()
+        self.get_posts(token)
+        self.assertFalse(User.verify_auth_token(token).is_administrator())
+        self.user.role = Role.query.filter_by(name='Administrator').first()
+        db.session.commit()
+        db.session.remove()
+        self.assertTrue(User.verify_auth_token(token).is_administrator())
+
+    def test_password_change_invalidates_tokens(self):
+        token = self.user.generate_auth_token()
+        self.get_posts(token)
+        cache = self.app.extensions['auth_cache']
+        self.assertEqual(cache.tokens.stats()['entries'], 1)
+        self.user.password = 'dog'
+        db.session.commit()
+        self.assertEqual(cache.tokens.stats()['entries'], 0)
+        self.assertIsNone(cache.users.get(self.user.id))
+
+    def test_snapshot_does_not_overwrite_session_user(self):
+        token = self.user.generate_auth_token()
+        self.get_posts(token)
+        self.user.username = 'johnny'
+        db.session.flush()
+        user = auth_cache.load_user(self.user.id)
+        self.assertIs(user, self.user)
+        self.assertEqual(user.username, 'johnny')
+
+    def test_rollback_keeps_snapshot(self):
+        token = self.user.generate_auth_token()
+        # Users already in the session are used instead of a snapshot.
+        db.session.remove()
+        self.get_posts(token)
+        user = User.query.get(self.user.id)
+        user.email = 'other@example.com'
+        db.session.rollback()
+        cache = self.app.extensions['auth_cache']
+        self.assertIsNotNone(cache.users.get(self.user.id))
+
+    def test_credential_cache_is_off_by_default(self):
+        self.assertIsNone(self.app.extensions['auth_cache'].credentials)
+        self.assertEqual(
+            self.get_posts('john@example.com', 'cat').status_code, 200)
+
+    def test_repeated_credentials_skip_password_check(self):
+        credentials = self.enable_credential_cache()
+        self.assertEqual(
+            self.get_posts('john@example.com', 'cat').status_code, 200)
+        checks = []
+        verify = User.verify_password
+        User.verify_password = lambda user, password: \
+            checks.append(password) or verify(user, password)
+        try:
+            self.assertEqual(
+                self.get_posts('john@example.com', 'cat').status_code, 200)
+            self.assertEqual(
+                self.get_posts('john@example.com', 'dog').status_code, 401)
+        finally:
+            User.verify_password = verify
+        self.assertEqual(checks, ['dog'])
+        self.assertEqual(credentials.stats()['hits'], 1)
+        self.assertEqual(credentials.stats()['misses'], 2)
+        for key in credentials.entries:
+            self.assertNotIn(b'cat', key)
+
+    def test_password_change_invalidates_credentials(self):
+        self.enable_credential_cache()
+        self.get_posts('john@example.com', 'cat')
+        self.user.password = 'dog'
+        db.session.commit()
+        self.assertEqual(
+            self.get_posts('john@example.com', 'cat').status_code, 401)
+        self.assertEqual(
+            self.get_posts('john@example.com', 'dog').status_code, 200)
+
+    def test_email_change_invalidates_credentials(self):
+        self.enable_credential_cache()
+        self.get_posts('john@example.com', 'cat')
+        self.user.email = 'johnny@example.com'
+        db.session.commit()
+        self.assertEqual(
+            self.get_posts('john@example.com', 'cat').status_code, 401)
+
+    def test_stats_need_admin(self):
+        self.enable_credential_cache()
+        response = self.client.get('/api/v1/auth-cache/', headers={
+            'Authorization': 'Basic ' + b64encode(
+                b'john@example.com:cat').decode('utf-8')})
+        self.assertEqual(response.status_code, 403)
+        self.user.role = Role.query.filter_by(name='Administrator').first()
+        db.session.commit()
+        response = self.client.get('/api/v1/auth-cache/', headers={
+            'Authorization': 'Basic ' + b64encode(
+                b'john@example.com:cat').decode('utf-8')})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('credentials', response.get_json())
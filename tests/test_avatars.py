@@ -0,0 +1,103 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zlib
+from app import create_app, db, avatars, tasks
+from app.identicon import render
+from app.models import Role, User
+
+
+class AvatarTestCase(unittest.TestCase):
+    def setUp(self):
+        self.avatar_dir = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config.update(FLASKY_LOCAL_AVATARS=True,
+                               FLASKY_AVATAR_DIR=self.avatar_dir)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        tasks.wait()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.avatar_dir)
+
+    def add_user(self, email='john@example.com'):
+        user = User(username=email.split('@')[0], email=email,
+                    password='cat', confirmed=True)
+        db.session.add(user)
+        db.session.commit()
+        tasks.wait()
+        return user
+
+    def stored(self):
+        return sorted(name for _, _, names in os.walk(self.avatar_dir)
+                      for name in names)
+
+    def test_render_is_a_deterministic_png(self):
+        hash = 'd4c74594d841139328695756648b6bd6'
+        data = render(hash, 40)
+        self.assertEqual(data, render(hash, 40))
+        self.assertNotEqual(data, render('0' * 32, 40))
+        self.assertTrue(data.startswith(b'\x89PNG\r\n\x1a\n'))
+        width, height = struct.unpack('>II', data[16:24])
+        self.assertEqual((width, height), (40, 40))
+        # Decoded rows are mirror images, one filter byte then pixels.
+        start = data.index(b'IDAT') + 4
+        length, = struct.unpack('>I', data[start - 8:start - 4])
+        pixels = zlib.decompress(data[start:start + length])
+        self.assertEqual(len(pixels), 40 * 41)
+        for y in range(40):
+            row = pixels[y * 41 + 1:(y + 1) * 41]
+            self.assertEqual(row[:20], row[20:][::-1])
+
+    def test_gravatar_switches_to_local_url(self):
+        user = self.add_user()
+        with self.app.test_request_context('/'):
+            self.assertEqual(user.gravatar(size=40),
+                             f'/avatar/{user.avatar_hash}/40')
+            self.assertEqual(user.gravatar(size=100),
+                             f'/avatar/{user.avatar_hash}/256')
+            self.app.config['FLASKY_LOCAL_AVATARS'] = False
+            self.assertIn('gravatar.com', user.gravatar(size=40))
+
+    def test_new_hash_is_pregenerated(self):
+        user = self.add_user()
+        self.assertEqual(self.stored(), sorted([
+            f'{user.avatar_hash}-40-v1.png',
+            f'{user.avatar_hash}-256-v1.png']))
+        user.avatar_hash = 'f' * 32
+        db.session.commit()
+        tasks.wait()
+        self.assertEqual(len(self.stored()), 4)
+
+    def test_endpoint_caching(self):
+        user = self.add_user()
+        url = f'/avatar/{user.avatar_hash}/40'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/png')
+        self.assertEqual(response.get_data(), render(user.avatar_hash, 40))
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+        etag = response.headers['ETag']
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+
+    def test_endpoint_rejects_unknown_sizes_and_hashes(self):
+        self.assertEqual(self.client.get('/avatar/' + 'a' * 32 + '/41')
+                         .status_code, 404)
+        self.assertEqual(self.client.get('/avatar/..%2f..%2fetc/40')
+                         .status_code, 404)
+        self.assertEqual(self.stored(), [])
+
+    def test_generate_skips_stored(self):
+        self.assertEqual(avatars.generate(['a' * 32, 'b' * 32]), 4)
+        self.assertEqual(avatars.generate(['a' * 32, 'b' * 32]), 0)
@@ -0,0 +1,63 @@
+import unittest
+from app import create_app, db, fake
+from app.bench import Benchmark, MIX, compare, percentile
+from app.models import Role, User, Post, Follow, TimelineEntry
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        fake.bulk(users=10, posts=20, comments=20, follows=3, workers=0,
+                  echo=lambda line: None)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_test_client_run(self):
+        report = Benchmark(self.app, requests=70).run()
+        self.assertEqual(report['requests'], 70)
+        self.assertEqual(set(report['endpoints']),
+                         {name for name, weight in MIX})
+        for name, endpoint in report['endpoints'].items():
+            self.assertEqual(endpoint['errors'], 0, name)
+        self.assertEqual(compare(report, report), {})
+
+    def test_run_leaves_the_database_as_it_was(self):
+        def snapshot():
+            return (
+                db.session.query(User.id, User.role_id, User.follower_count,
+                                 User.post_count).order_by(User.id).all(),
+                db.session.query(Post.id).order_by(Post.id).all(),
+                db.session.query(Follow.follower_id, Follow.followed_id)
+                .order_by(Follow.follower_id, Follow.followed_id).all(),
+                db.session.query(TimelineEntry.user_id).count())
+        before = snapshot()
+        report = Benchmark(self.app, requests=70).run()
+        self.assertGreater(report['endpoints']['api_write']['requests'], 0)
+        self.assertEqual(snapshot(), before)
+
+    def test_login_failure_is_raised(self):
+        self.app.config['WTF_CSRF_ENABLED'] = True
+        with self.assertRaises(RuntimeError):
+            Benchmark(self.app, requests=1).run()
+
+    def test_compare_flags_slower_p95(self):
+        baseline = {'endpoints': {'index': {'p95': 10.0}}}
+        report = {'endpoints': {'index': {'p95': 12.0},
+                                'post': {'p95': 5.0}}}
+        self.assertEqual(list(compare(report, baseline)), ['index'])
+        self.assertEqual(compare(report, baseline, tolerance=0.5), {})
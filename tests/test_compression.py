@@ -0,0 +1,116 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from base64 import b64encode
+from app import create_app, db
+from app.compression import precompress
+from app.models import Role, User, Post
+
+
+class CompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.user = User(username='john', email='john@example.com',
+                         password='cat', confirmed=True)
+        db.session.add(self.user)
+        db.session.add_all(Post(body=f'post number {i} ' * 20,
+                                author=self.user) for i in range(5))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url, encoding='gzip', **headers):
+        headers.update({
+            'Authorization': 'Basic ' + b64encode(
+                b'john@example.com:cat').decode('utf-8'),
+            'Accept-Encoding': encoding})
+        return self.client.get(url, headers=headers)
+
+    def test_html_page_is_gzipped(self):
+        plain = self.get('/', encoding='identity')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+        response = self.get('/', encoding='br;q=1.0, gzip;q=0.8')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertLess(len(response.get_data()), len(plain.get_data()))
+        self.assertEqual(gzip.decompress(response.get_data()),
+                         plain.get_data())
+        self.assertNotIn('Content-Encoding',
+                         self.get('/', encoding='gzip;q=0').headers)
+
+    def test_small_bodies_are_left_alone(self):
+        self.app.config['FLASKY_COMPRESS_MIN_SIZE'] = 10 ** 6
+        response = self.get('/')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+
+    def test_compressed_json_revalidates(self):
+        response = self.get('/api/v1/posts/')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        etag = response.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        again = self.get('/api/v1/posts/', **{'If-None-Match': etag})
+        self.assertEqual(again.status_code, 304)
+
+    def test_stream_is_compressed_incrementally(self):
+        self.app.config['FLASKY_EXPORT_CHUNK_ROWS'] = 2
+        url = f'/api/v1/users/{self.user.id}/export'
+        plain = self.get(url, encoding='identity').get_data()
+        response = self.get(url)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual(gzip.decompress(response.get_data()), plain)
+
+
+class StaticCompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.static = tempfile.mkdtemp()
+        shutil.copy(os.path.join(self.app.static_folder, 'styles.css'),
+                    self.static)
+        self.app.static_folder = self.static
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.app_context.pop()
+        shutil.rmtree(self.static)
+
+    def test_precompressed_copy_is_sent(self):
+        path = os.path.join(self.static, 'styles.css')
+        self.assertIn(path + '.gz', precompress(self.static))
+        with open(path, 'rb') as f:
+            original = f.read()
+        response = self.client.get('/static/styles.css',
+                                   headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.mimetype, 'text/css')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(gzip.decompress(response.get_data()), original)
+        response.close()
+        response = self.client.get('/static/styles.css')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.get_data(), original)
+        response.close()
+
+    def test_stale_copy_is_ignored(self):
+        path = os.path.join(self.static, 'styles.css')
+        precompress(self.static)
+        stat = os.stat(path + '.gz')
+        os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+        response = self.client.get('/static/styles.css',
+                                   headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        response.close()
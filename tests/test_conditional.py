@@ -0,0 +1,159 @@
+import time
+import unittest
+from base64 import b64encode
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Role, User, Post, Comment
+
+
+class ConditionalGetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.user = User(username='john', email='john@example.com',
+                         password='cat', confirmed=True)
+        self.post = Post(body='hello', author=self.user)
+        db.session.add_all([self.user, self.post])
+        db.session.commit()
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.record)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.record)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def record(self, conn, cursor, statement, parameters, context,
+               executemany):
+        self.statements.append(statement)
+
+    def get(self, url, **headers):
+        headers.update({
+            'Authorization': 'Basic ' + b64encode(
+                b'john@example.com:cat').decode('utf-8'),
+            'Accept': 'application/json'})
+        return self.client.get(url, headers=headers)
+
+    def revalidate(self, url, get=None):
+        get = get or self.get
+        response = get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        again = get(url, **{'If-None-Match': etag})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.get_data(), b'')
+        self.assertEqual(again.headers['ETag'], etag)
+        return response
+
+    def test_api_resources_and_collections(self):
+        comment = Comment(body='hi', post=self.post, author=self.user)
+        db.session.add(comment)
+        db.session.commit()
+        for url in [f'/api/v1/posts/{self.post.id}',
+                    f'/api/v1/comments/{comment.id}',
+                    f'/api/v1/users/{self.user.id}',
+                    '/api/v1/posts/', '/api/v1/comments/',
+                    f'/api/v1/posts/{self.post.id}/comments/',
+                    f'/api/v1/users/{self.user.id}/posts/']:
+            self.revalidate(url)
+
+    def test_not_modified_skips_loading_the_row(self):
+        url = f'/api/v1/posts/{self.post.id}'
+        etag = self.get(url).headers['ETag']
+        self.statements = []
+        self.get(url, **{'If-None-Match': etag})
+        post_selects = [s for s in self.statements if 'FROM posts' in s]
+        self.assertEqual(len(post_selects), 1)
+        self.assertNotIn('posts.body', post_selects[0])
+
+    def test_collection_version_does_not_count_rows(self):
+        etag = self.get('/api/v1/posts/').headers['ETag']
+        self.statements = []
+        response = self.get('/api/v1/posts/', **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(any('count(' in s.lower() for s in self.statements))
+
+    def test_delete_changes_collection_etag(self):
+        older = Comment(body='older', post=self.post, author=self.user)
+        db.session.add(older)
+        db.session.commit()
+        db.session.add(Comment(body='newer', post=self.post,
+                               author=self.user))
+        db.session.commit()
+        urls = ['/api/v1/comments/',
+                f'/api/v1/posts/{self.post.id}/comments/']
+        etags = [self.get(url).headers['ETag'] for url in urls]
+        # Neither the latest id nor the latest updated_at moves.
+        db.session.delete(older)
+        db.session.commit()
+        for url, etag in zip(urls, etags):
+            response = self.get(url, **{'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_edit_changes_etag(self):
+        url = f'/api/v1/posts/{self.post.id}'
+        etag = self.get(url).headers['ETag']
+        self.post.body = 'edited'
+        db.session.commit()
+        response = self.get(url, **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_if_modified_since(self):
+        url = f'/api/v1/posts/{self.post.id}'
+        response = self.get(url)
+        last_modified = response.headers['Last-Modified']
+        response = self.get(url, **{'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+        self.post.updated_at = datetime.utcnow() + timedelta(minutes=1)
+        db.session.commit()
+        response = self.get(url, **{'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 200)
+
+    def test_pages_for_anonymous_viewers(self):
+        for url in [f'/post/{self.post.id}', '/user/john']:
+            self.revalidate(url, get=lambda url, **headers:
+                            self.client.get(url, headers=headers))
+        etag = self.client.get('/user/john').headers['ETag']
+        db.session.add(Post(body='another', author=self.user))
+        db.session.commit()
+        response = self.client.get('/user/john',
+                                   headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_page_follows_commenters_and_deletions(self):
+        susan = User(username='susan', email='susan@example.com',
+                     password='dog', confirmed=True)
+        comment = Comment(body='hi', post=self.post, author=susan)
+        db.session.add_all([susan, comment])
+        db.session.commit()
+        url = f'/post/{self.post.id}'
+        etag = self.client.get(url).headers['ETag']
+        susan.username = 'susanne'
+        db.session.commit()
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'susanne', response.get_data())
+        last_modified = response.headers['Last-Modified']
+        time.sleep(1)
+        db.session.delete(comment)
+        db.session.commit()
+        response = self.client.get(
+            url, headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 200)
+
+    def test_pages_for_logged_in_viewers_are_not_validated(self):
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.client.post('/auth/login', data={'email': 'john@example.com',
+                                              'password': 'cat'})
+        response = self.client.get(f'/post/{self.post.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response.headers)
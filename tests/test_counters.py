@@ -0,0 +1,49 @@
+import unittest
+from app import create_app, db
+from app.models import Role, User, Post, Comment, repair_counters
+
+
+class CounterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.u1 = User(username='u1', email='u1@example.com', password='1')
+        self.u2 = User(username='u2', email='u2@example.com', password='1')
+        db.session.add_all([self.u1, self.u2])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_counters_follow_inserts_and_deletes(self):
+        post = Post(body='hello', author=self.u1)
+        db.session.add_all([post, Comment(body='hi', author=self.u2,
+                                          post=post)])
+        self.u2.follow(self.u1)
+        db.session.commit()
+        self.assertEqual(self.u1.post_count, 1)
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.u1.follower_count, 2)
+        self.assertEqual(self.u2.followed_count, 2)
+        self.u2.unfollow(self.u1)
+        db.session.commit()
+        self.assertEqual(self.u1.follower_count, 1)
+        self.assertEqual(self.u2.followed_count, 1)
+
+    def test_repair_counters(self):
+        db.session.add(Post(body='hello', author=self.u1))
+        db.session.commit()
+        self.u1.post_count = 7
+        self.u2.follower_count = None
+        db.session.commit()
+        repaired = repair_counters()
+        self.assertEqual(repaired['users.post_count'], 1)
+        self.assertEqual(repaired['users.follower_count'], 1)
+        self.assertEqual(self.u1.post_count, 1)
+        self.assertEqual(self.u2.follower_count, 1)
+        self.assertEqual(repair_counters()['users.post_count'], 0)
@@ -0,0 +1,94 @@
+import json
+import unittest
+from base64 import b64encode
+from datetime import datetime, timedelta
+from app import create_app, db
+from app.models import Role, User, Post, Comment
+
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_EXPORT_CHUNK_ROWS'] = 3
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.john = User(username='john', email='john@example.com',
+                         password='cat', confirmed=True)
+        self.susan = User(username='susan', email='susan@example.com',
+                          password='dog', confirmed=True)
+        db.session.add_all([self.john, self.susan])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url, email='john@example.com', password='cat'):
+        return self.client.get(url, headers={
+            'Authorization': 'Basic ' + b64encode(
+                (email + ':' + password).encode('utf-8')).decode('utf-8'),
+            'Accept': 'application/json'})
+
+    def lines(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        return [json.loads(line) for line in
+                response.get_data(as_text=True).splitlines()]
+
+    def add_posts(self, author, count):
+        posts = [Post(body=f'post {i}', author=author) for i in range(count)]
+        db.session.add_all(posts)
+        db.session.commit()
+        return posts
+
+    def test_user_export_streams_posts_and_comments(self):
+        posts = self.add_posts(self.john, 7)
+        self.add_posts(self.susan, 2)
+        db.session.add(Comment(body='mine', author=self.john, post=posts[0]))
+        db.session.commit()
+        rows = self.lines(self.get(f'/api/v1/users/{self.john.id}/export'))
+        self.assertEqual([row['type'] for row in rows],
+                         ['post'] * 7 + ['comment'])
+        self.assertEqual({row['id'] for row in rows[:7]},
+                         {post.id for post in posts})
+        self.assertEqual(rows[-1]['body'], 'mine')
+        only_posts = self.lines(self.get(
+            f'/api/v1/users/{self.john.id}/export?type=posts'))
+        self.assertEqual(len(only_posts), 7)
+
+    def test_since_returns_new_and_edited_rows(self):
+        old, edited = self.add_posts(self.john, 2)
+        past = datetime.utcnow() - timedelta(days=1)
+        Post.query.update({'updated_at': past})
+        db.session.commit()
+        since = datetime.utcnow() - timedelta(hours=1)
+        edited.body = 'edited'
+        new, = self.add_posts(self.john, 1)
+        rows = self.lines(self.get(f'/api/v1/users/{self.john.id}/export'
+                                   f'?since={since.isoformat()}'))
+        self.assertEqual([row['id'] for row in rows], [edited.id, new.id])
+        self.assertGreaterEqual(
+            datetime.fromisoformat(rows[0]['updated_at']), since)
+
+    def test_bad_since(self):
+        response = self.get(f'/api/v1/users/{self.john.id}/export'
+                            '?since=yesterday')
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_permissions(self):
+        self.add_posts(self.john, 1)
+        response = self.get(f'/api/v1/users/{self.john.id}/export',
+                            'susan@example.com', 'dog')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.get('/api/v1/export').status_code, 403)
+        self.john.role = Role.query.filter_by(name='Administrator').first()
+        db.session.commit()
+        self.add_posts(self.susan, 2)
+        rows = self.lines(self.get('/api/v1/export'))
+        self.assertEqual(len(rows), 3)
+        rows = self.lines(self.get(f'/api/v1/users/{self.susan.id}/export'))
+        self.assertEqual(len(rows), 2)
@@ -0,0 +1,60 @@
+import unittest
+from app import create_app, db, fake
+from app.models import Role, User, Post, Comment, Follow, TimelineEntry, \
+    repair_counters
+
+
+class BulkGeneratorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def generate(self, seed=1):
+        fake.bulk(users=30, posts=60, comments=40, follows=5, seed=seed,
+                  batch_size=25, workers=0, echo=lambda line: None)
+
+    def test_bulk_rows_and_counters(self):
+        self.generate()
+        self.assertEqual(User.query.count(), 30)
+        self.assertEqual(Post.query.count(), 60)
+        self.assertEqual(Comment.query.count(), 40)
+        self.assertIsNone(Post.query.filter_by(body_html=None).first())
+        # everyone follows themselves
+        self.assertEqual(Follow.query.filter(
+            Follow.follower_id == Follow.followed_id).count(), 30)
+        self.assertEqual(set(repair_counters().values()), {0})
+        user = User.query.first()
+        self.assertTrue(user.verify_password('password'))
+        self.assertEqual(user.posts.count(), user.post_count)
+
+    def test_bulk_timelines_match_fan_out(self):
+        self.generate()
+        generated = set(db.session.query(TimelineEntry.user_id,
+                                         TimelineEntry.post_id))
+        TimelineEntry.rebuild()
+        rebuilt = set(db.session.query(TimelineEntry.user_id,
+                                       TimelineEntry.post_id))
+        self.assertEqual(generated, rebuilt)
+        self.assertTrue(generated)
+
+    def test_same_seed_same_data(self):
+        self.generate()
+        first = [(u.username, u.followed_count, u.member_since)
+                 for u in User.query]
+        posts = [p.timestamp for p in Post.query.order_by(Post.id)]
+        db.drop_all()
+        db.create_all()
+        Role.insert_roles()
+        self.generate()
+        self.assertEqual([(u.username, u.followed_count, u.member_since)
+                          for u in User.query], first)
+        self.assertEqual([p.timestamp for p in Post.query.order_by(Post.id)],
+                         posts)
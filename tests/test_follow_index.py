@@ -0,0 +1,76 @@
+import unittest
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Role, User
+from app.follow_index import FollowIndex
+
+
+class FollowIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.users = [User(username=f'user{i}', email=f'user{i}@example.com',
+                           password='1') for i in range(4)]
+        db.session.add_all(self.users)
+        db.session.commit()
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.record)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.record)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def record(self, conn, cursor, statement, parameters, context,
+               executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            self.statements.append(statement)
+
+    def test_membership_checks_are_served_from_memory(self):
+        u0, u1, u2, u3 = self.users
+        u0.follow(u1)
+        db.session.commit()
+        self.assertTrue(u0.is_following(u1))
+        # Refresh the expired users before counting statements.
+        [user.id for user in self.users]
+        self.statements = []
+        self.assertTrue(u0.is_following(u1))
+        self.assertFalse(u0.is_following(u2))
+        self.assertTrue(u1.is_followed_by(u0))
+        self.assertEqual(u0.following_among(self.users), {u0.id, u1.id})
+        self.assertEqual(self.statements, [])
+
+    def test_commit_and_rollback_update_index(self):
+        u0, u1, u2, u3 = self.users
+        self.assertFalse(u0.is_following(u2))
+        u0.follow(u2)
+        self.assertTrue(u0.is_following(u2))
+        db.session.commit()
+        self.assertTrue(u0.is_following(u2))
+        u0.unfollow(u2)
+        db.session.flush()
+        self.assertFalse(u0.is_following(u2))
+        db.session.rollback()
+        self.assertTrue(u0.is_following(u2))
+
+    def test_index_evicts_least_recently_used(self):
+        index = FollowIndex(max_edges=3, ttl=60)
+        index.put(1, [1, 2], 0)
+        index.put(2, [2], 0)
+        index.get(1)
+        index.put(3, [3], 0)
+        self.assertIsNone(index.get(2)[0])
+        self.assertIsNotNone(index.get(1)[0])
+        self.assertLessEqual(index.edges, 3)
+        index.put(4, [1, 2, 3, 4], 0)
+        self.assertIsNone(index.get(4)[0])
+
+    def test_index_expires_entries(self):
+        index = FollowIndex(max_edges=10, ttl=-1)
+        index.put(1, [1], 0)
+        self.assertIsNone(index.get(1)[0])
+        self.assertEqual(index.edges, 0)
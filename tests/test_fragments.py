@@ -0,0 +1,71 @@
+import unittest
+from app import create_app, db, fragment_cache
+from app.models import Role, User, Post, Comment
+from app.cache import LRUCache
+
+
+class FragmentCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.author = User(username='john', email='john@example.com',
+                           password='cat', confirmed=True)
+        self.reader = User(username='susan', email='susan@example.com',
+                           password='dog', confirmed=True)
+        self.post = Post(body='first body', author=self.author)
+        db.session.add_all([self.author, self.reader, self.post])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self, email, password):
+        self.client.post('/auth/login', data={'email': email,
+                                              'password': password})
+
+    def test_fragment_is_reused(self):
+        self.client.get('/')
+        self.client.get('/')
+        stats = fragment_cache.cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+
+    def test_changes_invalidate_fragment(self):
+        self.assertIn(b'first body', self.client.get('/').data)
+        self.post.body = 'second body'
+        db.session.commit()
+        self.assertIn(b'second body', self.client.get('/').data)
+        self.author.username = 'johnny'
+        db.session.commit()
+        self.assertIn(b'johnny', self.client.get('/').data)
+        db.session.add(Comment(body='hi', post=self.post,
+                               author=self.reader))
+        db.session.commit()
+        self.assertIn(b'1 Comments', self.client.get('/').data)
+
+    def test_viewer_controls_are_not_shared(self):
+        self.login('john@example.com', 'cat')
+        self.assertIn(b'>Edit<', self.client.get('/').data)
+        self.client.get('/auth/logout')
+        self.login('susan@example.com', 'dog')
+        self.assertNotIn(b'>Edit<', self.client.get('/').data)
+        self.assertEqual(fragment_cache.cache.stats()['misses'], 1)
+
+    def test_lru_cache_byte_limit(self):
+        cache = LRUCache(max_bytes=10)
+        cache.set('a', 'aaaa', size=4)
+        cache.set('b', 'bbbb', size=4)
+        cache.get('a')
+        cache.set('c', 'cccc', size=4)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'aaaa')
+        self.assertEqual(cache.bytes, 8)
+        cache.set('d', 'd' * 11, size=11)
+        self.assertIsNone(cache.get('d'))
@@ -0,0 +1,59 @@
+import gc
+import unittest
+import weakref
+from datetime import datetime, timedelta
+from app import create_app, db, last_seen_buffer
+from app.models import Role, User
+
+
+class LastSeenTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_LAST_SEEN_FLUSH_INTERVAL'] = 3600
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(username='john', email='john@example.com',
+                         password='cat')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        last_seen_buffer.flush(self.app)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @property
+    def pending(self):
+        return self.app.extensions['last_seen'].pending
+
+    def stored_last_seen(self):
+        return db.session.query(User.last_seen).filter_by(
+            id=self.user.id).scalar()
+
+    def test_ping_within_granularity_is_skipped(self):
+        self.user.ping()
+        self.assertEqual(self.pending, {})
+
+    def test_pings_are_buffered_and_flushed(self):
+        old = datetime.utcnow() - timedelta(hours=1)
+        self.user.last_seen = old
+        db.session.commit()
+        self.user.ping()
+        self.user.ping()
+        self.assertEqual(list(self.pending), [self.user.id])
+        self.assertFalse(db.session.dirty)
+        self.assertEqual(self.stored_last_seen(), old)
+        last_seen_buffer.flush(self.app)
+        self.assertEqual(self.pending, {})
+        self.assertGreater(self.stored_last_seen(), old)
+
+    def test_buffer_does_not_keep_apps_alive(self):
+        app = create_app('testing')
+        ref = weakref.ref(app)
+        self.assertIn(app, last_seen_buffer.apps)
+        del app
+        gc.collect()
+        self.assertIsNone(ref())
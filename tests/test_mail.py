@@ -1,13 +1,25 @@
-
 import unittest
+from app import create_app, db
 from app.email import send_email
+from app.models import OutboxMessage
 
 
 class EmailTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
     def test_send_email(self):
         try:
             send_email('goukun07@qq.com', 'TEST Flask-mail', 'mail/test')
         except:
             self.assertTrue(False)
         else:
-            self.assertTrue(True)
\ No newline at end of file
+            self.assertEqual(OutboxMessage.query.count(), 1)
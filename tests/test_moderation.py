@@ -0,0 +1,130 @@
+import re
+import unittest
+from base64 import b64encode
+from app import create_app, db, search
+from app.models import Role, User, Post, Comment
+
+
+class ModerationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config.update(WTF_CSRF_ENABLED=False,
+                               FLASKY_COMMENTS_PER_PAGE=10,
+                               FLASKY_MODERATION_BATCH_SIZE=3)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.moderator = User(
+            username='mod', email='mod@example.com', password='cat',
+            confirmed=True,
+            role=Role.query.filter_by(name='Moderator').one())
+        self.reader = User(username='susan', email='susan@example.com',
+                           password='dog', confirmed=True)
+        self.post = Post(body='a post', author=self.reader)
+        db.session.add_all([self.moderator, self.reader, self.post])
+        db.session.commit()
+        self.comments = [Comment(body=f'comment number {i}', post=self.post,
+                                 author=self.reader) for i in range(4)]
+        db.session.add_all(self.comments)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self, email, password):
+        self.client.post('/auth/login', data={'email': email,
+                                              'password': password})
+
+    def queue(self):
+        return sorted(comment.id for comment in Comment.awaiting_review())
+
+    def api(self, method, url, **kwargs):
+        credentials = b64encode(b'mod@example.com:cat').decode('utf-8')
+        return getattr(self.client, method)(url, headers={
+            'Authorization': 'Basic ' + credentials,
+            'Accept': 'application/json'}, **kwargs)
+
+    def test_queue_holds_unreviewed_and_reported(self):
+        first, second = self.comments[:2]
+        self.assertEqual(self.queue(), [c.id for c in self.comments])
+        Comment.moderate([first.id, second.id], disabled=False)
+        db.session.commit()
+        self.assertNotIn(first.id, self.queue())
+        self.login('susan@example.com', 'dog')
+        html = self.client.get(f'/post/{self.post.id}').get_data(
+            as_text=True)
+        self.assertIn(f'action="/flag/{first.id}"', html)
+        # Reporting changes state, so a plain link or image can't do it.
+        self.assertEqual(self.client.get(f'/flag/{first.id}').status_code,
+                         405)
+        self.app.config['WTF_CSRF_ENABLED'] = True
+        self.assertEqual(self.client.post(f'/flag/{first.id}').status_code,
+                         400)
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.assertFalse(first.flagged)
+        response = self.client.post(f'/flag/{first.id}')
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(first.flagged)
+        self.assertIn(first.id, self.queue())
+        self.assertNotIn(second.id, self.queue())
+
+    def test_bulk_disable_from_web_view(self):
+        self.login('mod@example.com', 'cat')
+        html = self.client.get('/moderate').get_data(as_text=True)
+        self.assertEqual(len(re.findall(r'name="ids"', html)), 4)
+        ids = [c.id for c in self.comments[:2]]
+        response = self.client.post('/moderate', data={
+            'ids': ids, 'disable': 'Disable selected'},
+            follow_redirects=True)
+        self.assertIn('2 comments disabled', response.get_data(as_text=True))
+        for comment in self.comments[:2]:
+            self.assertTrue(comment.disabled)
+            self.assertTrue(comment.reviewed)
+        self.assertEqual(self.queue(), [c.id for c in self.comments[2:]])
+        # Disabled comments drop out of search.
+        self.assertEqual(len(search.query('comment').hits), 2)
+
+    def test_web_bulk_limit(self):
+        self.login('mod@example.com', 'cat')
+        response = self.client.post('/moderate', data={
+            'ids': [c.id for c in self.comments], 'enable': 'Enable'},
+            follow_redirects=True)
+        self.assertIn('At most 3', response.get_data(as_text=True))
+        self.assertEqual(len(self.queue()), 4)
+
+    def test_readers_cannot_moderate(self):
+        self.login('susan@example.com', 'dog')
+        self.assertEqual(self.client.get('/moderate').status_code, 403)
+        response = self.client.post('/moderate', data={
+            'ids': [self.comments[0].id], 'disable': 'Disable'})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post('/api/v1/moderation', json={
+            'action': 'disable', 'ids': [self.comments[0].id]},
+            headers={'Authorization': 'Basic ' + b64encode(
+                b'susan@example.com:dog').decode('utf-8')})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(self.comments[0].disabled)
+
+    def test_api(self):
+        response = self.api('get', '/api/v1/moderation')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()['comments']), 4)
+        ids = [c.id for c in self.comments[:3]]
+        response = self.api('post', '/api/v1/moderation',
+                            json={'action': 'disable', 'ids': ids + [999]})
+        self.assertEqual(response.status_code, 400)
+        response = self.api('post', '/api/v1/moderation',
+                            json={'action': 'disable', 'ids': ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['updated'], ids)
+        queue = self.api('get', '/api/v1/moderation').get_json()['comments']
+        self.assertEqual([c['id'] for c in queue], [self.comments[3].id])
+        self.assertFalse(queue[0]['reviewed'])
+        for bad in ({'action': 'delete', 'ids': ids}, {'action': 'enable'},
+                    {'action': 'enable', 'ids': ['1']}):
+            response = self.api('post', '/api/v1/moderation', json=bad)
+            self.assertEqual(response.status_code, 400)
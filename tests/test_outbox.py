@@ -0,0 +1,153 @@
+import socketserver
+import threading
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db, mail, outbox
+from app.email import send_email
+from app.models import OutboxMessage, Role
+
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply('220 localhost SMTP stub')
+        data = None
+        for line in self.rfile:
+            line = line.decode('utf-8').rstrip('\r\n')
+            if data is not None:
+                if line == '.':
+                    server.messages.append('\n'.join(data))
+                    data = None
+                    self.reply('250 OK')
+                else:
+                    data.append(line)
+                continue
+            verb = line[:4].upper()
+            if verb == 'RCPT' and any(address in line
+                                      for address in server.reject):
+                self.reply('550 No such user')
+            elif verb == 'DATA':
+                data = []
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    """A local SMTP server that keeps what it receives."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPStubHandler)
+        self.connections = 0
+        self.messages = []
+        self.reject = set()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class OutboxTestCase(unittest.TestCase):
+    def setUp(self):
+        self.smtp = SMTPStub()
+        self.app = create_app('testing')
+        self.app.config.update(MAIL_SERVER='127.0.0.1',
+                               MAIL_PORT=self.smtp.server_address[1],
+                               MAIL_USE_TLS=False, MAIL_USERNAME=None,
+                               MAIL_PASSWORD=None, MAIL_SUPPRESS_SEND=False,
+                               FLASKY_MAIL_BATCH_SIZE=2,
+                               FLASKY_MAIL_MAX_ATTEMPTS=2,
+                               WTF_CSRF_ENABLED=False)
+        mail.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.smtp.stop()
+
+    def queue(self, count, to='john@example.com'):
+        return [send_email(to, f'Test {i}', 'mail/test') for i in range(count)]
+
+    def make_due(self):
+        OutboxMessage.query.update(
+            {'next_attempt_at': datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+
+    def test_send_email_only_queues(self):
+        message, = self.queue(1)
+        self.assertEqual(message.status, OutboxMessage.PENDING)
+        self.assertIn('Test 0', message.subject)
+        self.assertTrue(message.html)
+        self.assertEqual(self.smtp.connections, 0)
+        self.assertEqual(outbox.stats()['depth']['pending'], 1)
+
+    def test_drain_batches_over_one_connection(self):
+        self.queue(5)
+        self.assertEqual(outbox.drain(), 5)
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual(len(self.smtp.messages), 5)
+        stats = outbox.stats()
+        self.assertEqual(stats['depth']['sent'], 5)
+        self.assertEqual(stats['depth']['pending'], 0)
+        self.assertIsNone(stats['oldest_queued_seconds'])
+        self.assertEqual(outbox.drain(), 0)
+
+    def test_rejected_message_backs_off_then_dies(self):
+        self.smtp.reject.add('nobody@example.com')
+        message, = self.queue(1, to='nobody@example.com')
+        self.queue(1)
+        self.assertEqual(outbox.drain(), 1)
+        self.assertEqual(message.status, OutboxMessage.PENDING)
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt_at, datetime.utcnow())
+        self.assertIn('550', message.last_error)
+        self.assertEqual(outbox.drain(), 0)
+        self.make_due()
+        outbox.drain()
+        self.assertEqual(message.status, OutboxMessage.DEAD)
+        self.assertEqual(outbox.stats()['depth']['dead'], 1)
+
+    def test_unreachable_server_keeps_messages(self):
+        messages = self.queue(3)
+        self.smtp.stop()
+        self.assertEqual(outbox.drain(), 0)
+        self.assertEqual([m.status for m in messages],
+                         [OutboxMessage.PENDING, OutboxMessage.PENDING,
+                          OutboxMessage.PENDING])
+        self.assertEqual([m.attempts for m in messages], [1, 1, 0])
+
+    def test_expired_claim_is_taken_over(self):
+        message, = self.queue(1)
+        message.status = OutboxMessage.SENDING
+        message.next_attempt_at = datetime.utcnow() + timedelta(minutes=5)
+        db.session.commit()
+        self.assertEqual(outbox.drain(), 0)
+        self.make_due()
+        self.assertEqual(outbox.drain(), 1)
+
+    def test_register_queues_confirmation(self):
+        client = self.app.test_client()
+        response = client.post('/auth/register', data={
+            'email': 'john@example.com',
+            'username': 'john',
+            'password': 'cat',
+            'password2': 'cat'})
+        self.assertEqual(response.status_code, 302)
+        message = OutboxMessage.query.one()
+        self.assertEqual(message.recipient, 'john@example.com')
+        self.assertEqual(self.smtp.connections, 0)
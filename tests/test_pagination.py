@@ -0,0 +1,85 @@
+import unittest
+from base64 import b64encode
+from datetime import datetime, timedelta
+from flask import current_app
+from app import create_app, db
+from app.models import Role, User, Post
+from app.pagination import encode_cursor, decode_cursor
+
+
+class PaginationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(username='john', email='john@example.com',
+                         password='cat', confirmed=True)
+        db.session.add(self.user)
+        start = datetime(2019, 3, 1)
+        # Two posts share a timestamp so the id has to break the tie.
+        for i in range(12):
+            db.session.add(Post(body=f'post {i}', author=self.user,
+                                timestamp=start + timedelta(hours=i // 2)))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_api(self, url):
+        credentials = b64encode(b'john@example.com:cat').decode('utf-8')
+        return self.client.get(url, headers={
+            'Authorization': 'Basic ' + credentials,
+            'Accept': 'application/json'})
+
+    def walk(self, url):
+        bodies = []
+        while url:
+            json = self.get_api(url).get_json()
+            bodies.extend(post['body'] for post in json['posts'])
+            url = json['next_url']
+        return bodies
+
+    def test_cursor_round_trip(self):
+        timestamp = datetime(2019, 3, 1, 12, 30, 5, 42)
+        cursor = encode_cursor(timestamp, 7, 'next')
+        self.assertEqual(decode_cursor(cursor), (timestamp, 7, 'next'))
+        self.assertIsNone(decode_cursor('not a cursor'))
+
+    def test_api_cursor_walks_every_post_once(self):
+        expected = [post.body for post in
+                    Post.query.order_by(Post.timestamp.desc(),
+                                        Post.id.desc())]
+        self.assertEqual(self.walk('/api/v1/posts/'), expected)
+
+    def test_api_prev_cursor(self):
+        first = self.get_api('/api/v1/posts/').get_json()
+        self.assertIsNone(first['prev'])
+        second = self.get_api(first['next_url']).get_json()
+        back = self.get_api(second['prev_url']).get_json()
+        self.assertEqual(back['posts'], first['posts'])
+        self.assertIsNone(back['prev'])
+
+    def test_api_legacy_page(self):
+        json = self.get_api('/api/v1/posts/?page=2').get_json()
+        self.assertEqual(json['count'], 12)
+        self.assertTrue(json['next_url'].endswith('page=3'))
+        self.assertTrue(json['prev_url'].endswith('page=1'))
+
+    def test_timeline_with_merged_authors(self):
+        current_app.config['FLASKY_TIMELINE_FANOUT_LIMIT'] = 1
+        expected = [post.body for post in
+                    Post.query.order_by(Post.timestamp.desc(),
+                                        Post.id.desc())]
+        url = f'/api/v1/users/{self.user.id}/timeline/'
+        self.assertEqual(self.walk(url), expected)
+
+    def test_index_links_use_cursor(self):
+        response = self.client.get('/')
+        self.assertIn(b'cursor=', response.data)
+        response = self.client.get('/?page=2')
+        self.assertIn(b'page=3', response.data)
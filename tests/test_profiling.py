@@ -0,0 +1,66 @@
+import json
+import unittest
+from app import create_app, db
+from app.models import Role, User, Post
+
+
+class ProfilingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_PROFILE_SAMPLE_RATE'] = 1
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        user = User(username='john', email='john@example.com',
+                    password='cat', confirmed=True)
+        db.session.add_all([user] + [Post(body=f'post {i}', author=user)
+                                     for i in range(6)])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def profile_lines(self, logs):
+        return [json.loads(record.getMessage()) for record in logs.records
+                if record.getMessage().startswith('{')]
+
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs(self.app.logger, 'INFO') as logs:
+            response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        timing = response.headers['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('tmpl;dur=', timing)
+        self.assertIn('total;dur=', timing)
+        line, = self.profile_lines(logs)
+        self.assertEqual(line['endpoint'], 'main.index')
+        self.assertGreater(line['queries'], 0)
+        self.assertGreater(line['template_ms'], 0)
+        self.assertLessEqual(len(line['slowest']), 3)
+        self.assertEqual(line['repeated'], [])
+
+    def test_repeated_statement_is_reported_with_call_site(self):
+        def n_plus_one():
+            for post in Post.query.all():
+                db.session.expire(post, ['author'])
+                User.query.filter_by(id=post.author_id).first()
+            return 'ok'
+        self.app.add_url_rule('/n-plus-one', 'n_plus_one', n_plus_one)
+        with self.assertLogs(self.app.logger, 'INFO') as logs:
+            self.client.get('/n-plus-one')
+        line, = self.profile_lines(logs)
+        repeated, = line['repeated']
+        self.assertEqual(repeated['count'], 6)
+        warnings = [record.getMessage() for record in logs.records
+                    if record.levelname == 'WARNING']
+        self.assertEqual(len(warnings), 1)
+        self.assertIn('N+1', warnings[0])
+
+    def test_unsampled_request_has_no_header(self):
+        self.app.config['FLASKY_PROFILE_SAMPLE_RATE'] = 0
+        response = self.client.get('/')
+        self.assertNotIn('Server-Timing', response.headers)
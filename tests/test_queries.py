@@ -0,0 +1,59 @@
+import unittest
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Role, User, Post, Comment
+
+
+class QueryCountTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.record)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.record)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def record(self, conn, cursor, statement, parameters, context,
+               executemany):
+        self.statements.append(statement)
+
+    def add_posts(self, count):
+        start = User.query.count()
+        for i in range(start, start + count):
+            author = User(username=f'user{i}', email=f'user{i}@example.com',
+                          password='cat', confirmed=True)
+            post = Post(body=f'post {i}', author=author)
+            db.session.add_all([author, post,
+                                Comment(body='nice', author=author,
+                                        post=post)])
+        db.session.commit()
+
+    def count_queries(self, url):
+        self.statements = []
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(self.statements)
+
+    def test_index_query_count_is_constant(self):
+        self.app.config['FLASKY_POSTS_PER_PAGE'] = 5
+        self.add_posts(1)
+        single = self.count_queries('/')
+        self.add_posts(4)
+        self.assertEqual(self.count_queries('/'), single)
+
+    def test_preload_fills_authors_and_counts(self):
+        self.add_posts(3)
+        posts = Post.preload(Post.query.all())
+        self.statements = []
+        for post in posts:
+            self.assertIsNotNone(post.author.username)
+            self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.statements, [])
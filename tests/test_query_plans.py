@@ -0,0 +1,162 @@
+import re
+import unittest
+from base64 import b64encode
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Role, User, Post, Comment
+
+# A plan step that walks a whole table, or all of one of its indexes,
+# rather than an index range.
+SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)'
+                  r'(?: USING (?:COVERING )?INDEX \w+)?$')
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    """Runs each view and checks the plan of every SELECT it issues."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config.update(FLASKY_POSTS_PER_PAGE=2,
+                               FLASKY_COMMENTS_PER_PAGE=2,
+                               WTF_CSRF_ENABLED=False)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        john = User(username='john', email='john@example.com',
+                    password='cat', confirmed=True,
+                    role=Role.query.filter_by(name='Administrator').one())
+        susan = User(username='susan', email='susan@example.com',
+                     password='dog', confirmed=True)
+        db.session.add_all([john, susan])
+        db.session.commit()
+        User.add_self_follows()
+        john.follow(susan)
+        for i in range(3):
+            for author in (john, susan):
+                post = Post(body=f'post {i} by {author.username}',
+                            author=author)
+                db.session.add(post)
+                db.session.add_all([
+                    Comment(body=f'comment {j}', post=post, author=author)
+                    for j in range(3)])
+        db.session.commit()
+        self.post_id = Post.query.first().id
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.record)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.record)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def record(self, conn, cursor, statement, parameters, context,
+               executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            self.statements.append((statement, parameters))
+
+    def plans(self, url, **kwargs):
+        """{statement: plan lines} for the SELECTs a request runs."""
+        self.statements = []
+        response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200, url)
+        plans = {}
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            for statement, parameters in self.statements:
+                cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+                plans[statement] = [row[3] for row in cursor.fetchall()]
+        finally:
+            connection.close()
+        return plans
+
+    @staticmethod
+    def bounded(statement, line):
+        """An unfiltered walk of an index that stops at the LIMIT, as for
+        the newest posts, reads only a page of rows. A partial index holds
+        only the rows its queue needs, so walking it is fine too."""
+        partial = {index.name for table in db.metadata.tables.values()
+                   for index in table.indexes
+                   if index.dialect_options['sqlite']['where'] is not None}
+        if any(line.endswith(' INDEX ' + name) for name in partial):
+            return True
+        return 'INDEX' in line and \
+            not re.search(r'\bWHERE\b', statement) and \
+            re.search(r'\bLIMIT\b', statement) is not None
+
+    def full_scans(self, plans):
+        tables = db.metadata.tables
+        scans = []
+        for statement, lines in plans.items():
+            for line in lines:
+                match = SCAN.match(line)
+                if match and match.group(1) in tables and \
+                        not self.bounded(statement, line):
+                    scans.append((' '.join(statement.split()), line))
+        return scans
+
+    def assert_no_full_scans(self, urls, **kwargs):
+        for url in urls:
+            with self.subTest(url=url):
+                scans = self.full_scans(self.plans(url, **kwargs))
+                self.assertEqual(scans, [], url)
+
+    def uses_index(self, plans, table, index):
+        """Whether some statement reads table through index, unsorted."""
+        for statement, lines in plans.items():
+            if any(line.startswith(f'SEARCH {table} USING') and
+                   index in line for line in lines) and \
+                    not any('TEMP B-TREE' in line for line in lines):
+                return True
+        return False
+
+    def login(self):
+        response = self.client.post('/auth/login', data={
+            'email': 'john@example.com', 'password': 'cat'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_web_views(self):
+        self.login()
+        next_page = self.client.get('/user/susan').get_data(as_text=True)
+        cursor = re.search(r'cursor=([\w-]+)', next_page).group(1)
+        self.assert_no_full_scans([
+            '/', '/user/john', '/user/susan', f'/user/susan?cursor={cursor}',
+            f'/post/{self.post_id}', '/followers/john', '/followed_by/john',
+            '/moderate', '/search?q=post', f'/edit/{self.post_id}',
+            '/edit-profile'])
+        self.client.set_cookie('localhost', 'show_followed', '1')
+        self.assert_no_full_scans(['/'])
+
+    def test_api_views(self):
+        headers = {
+            'Authorization': 'Basic ' + b64encode(
+                b'john@example.com:cat').decode('utf-8'),
+            'Accept': 'application/json'}
+        user_id = User.query.filter_by(username='susan').one().id
+        self.assert_no_full_scans([
+            '/api/v1/posts/', '/api/v1/comments/',
+            f'/api/v1/posts/{self.post_id}',
+            f'/api/v1/posts/{self.post_id}/comments/',
+            f'/api/v1/users/{user_id}', f'/api/v1/users/{user_id}/posts/',
+            f'/api/v1/users/{user_id}/timeline/',
+            f'/api/v1/users/{user_id}/export', '/api/v1/search?q=comment',
+            '/api/v1/moderation'],
+            headers=headers)
+
+    def test_hot_paths_use_composite_indexes(self):
+        plans = self.plans('/user/susan')
+        self.assertTrue(self.uses_index(plans, 'posts',
+                                        'ix_posts_author_id_timestamp'))
+        plans = self.plans(f'/post/{self.post_id}')
+        self.assertTrue(self.uses_index(plans, 'comment',
+                                        'ix_comment_post_id_timestamp'))
+        self.login()
+        plans = self.plans('/moderate')
+        self.assertTrue(any('ix_comment_review_queue' in line
+                            for lines in plans.values() for line in lines))
+        plans = self.plans('/followers/john')
+        self.assertTrue(self.uses_index(
+            plans, 'follows', 'ix_follows_followed_id_follower_id'))
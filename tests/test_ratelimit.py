@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from base64 import b64encode
+from app import create_app, db
+from app.models import Role, User
+from app.ratelimit import SharedBuckets
+
+
+class SharedBucketsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'buckets')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_bucket_empties_and_refills(self):
+        buckets = SharedBuckets(self.path, 64)
+        for remaining in (2, 1, 0):
+            decision = buckets.take('a', 3, 60, now=1000)
+            self.assertTrue(decision.allowed)
+            self.assertEqual(decision.remaining, remaining)
+        decision = buckets.take('a', 3, 60, now=1000)
+        self.assertFalse(decision.allowed)
+        self.assertAlmostEqual(decision.retry_after, 20)
+        self.assertAlmostEqual(decision.reset, 60)
+        self.assertTrue(buckets.take('b', 3, 60, now=1000).allowed)
+        self.assertTrue(buckets.take('a', 3, 60, now=1020).allowed)
+        self.assertFalse(buckets.take('a', 3, 60, now=1020).allowed)
+
+    def test_full_table_reuses_oldest_slot(self):
+        buckets = SharedBuckets(None, 2)
+        buckets.take('a', 1, 60, now=1)
+        buckets.take('b', 1, 60, now=2)
+        buckets.take('c', 1, 60, now=3)
+        # 'a' was dropped for 'c' and starts over with a full bucket.
+        self.assertTrue(buckets.take('a', 1, 60, now=4).allowed)
+        self.assertFalse(buckets.take('c', 1, 60, now=5).allowed)
+
+    def test_processes_share_buckets(self):
+        buckets = SharedBuckets(self.path, 64)
+        buckets.take('a', 5, 3600)
+        context = multiprocessing.get_context('fork')
+        child = context.Process(target=lambda: [
+            buckets.take('a', 5, 3600) for _ in range(3)])
+        child.start()
+        child.join()
+        self.assertEqual(child.exitcode, 0)
+        self.assertEqual(buckets.take('a', 5, 3600).remaining, 0)
+        self.assertFalse(buckets.take('a', 5, 3600).allowed)
+
+
+class RateLimitTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config.update(
+            FLASKY_API_RATE_LIMIT=(3, 60),
+            FLASKY_API_ANONYMOUS_RATE_LIMIT=(2, 60))
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        admin = Role.query.filter_by(name='Administrator').one()
+        db.session.add_all([
+            User(email='john@example.com', password='cat', confirmed=True),
+            User(email='susan@example.com', password='dog', confirmed=True),
+            User(email='admin@example.com', password='cow', confirmed=True,
+                 role=admin)])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, credentials, url='/api/v1/posts/'):
+        return self.client.get(url, headers={
+            'Authorization': 'Basic ' + b64encode(
+                credentials.encode('utf-8')).decode('utf-8')})
+
+    def test_user_limit_and_headers(self):
+        for remaining in ('2', '1', '0'):
+            response = self.get('john@example.com:cat')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['RateLimit-Limit'], '3')
+            self.assertEqual(response.headers['RateLimit-Remaining'],
+                             remaining)
+            self.assertEqual(response.headers['RateLimit-Policy'], '3;w=60')
+        response = self.get('john@example.com:cat')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '20')
+        self.assertEqual(response.get_json()['error'], 'too many requests')
+        # Other users have buckets of their own.
+        self.assertEqual(self.get('susan@example.com:dog').status_code, 200)
+
+    def test_permission_and_endpoint_limits(self):
+        for _ in range(5):
+            response = self.get('admin@example.com:cow')
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('RateLimit-Limit', response.headers)
+        self.app.config['FLASKY_API_ENDPOINT_RATE_LIMITS'] = {
+            'api.get_posts': (1, 60)}
+        self.assertEqual(self.get('admin@example.com:cow').status_code, 200)
+        self.assertEqual(self.get('admin@example.com:cow').status_code, 429)
+        # The endpoint bucket is separate from the rest of the API.
+        self.assertEqual(self.get('john@example.com:cat', url='/api/v1/'
+                                  'comments/').headers['RateLimit-Limit'],
+                         '3')
+
+    def test_failed_logins_are_limited_by_address(self):
+        self.assertEqual(self.get('john@example.com:dog').status_code, 401)
+        self.assertEqual(self.get('nobody@example.com:x').status_code, 401)
+        response = self.get('john@example.com:dog')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+        # Logged in users are counted by user, not address.
+        self.assertEqual(self.get('john@example.com:cat').status_code, 200)
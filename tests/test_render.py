@@ -0,0 +1,46 @@
+import unittest
+from app import create_app, db, tasks
+from app.models import Role, User, Post, Comment, render_body
+
+
+class RenderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(username='john', email='john@example.com',
+                         password='cat')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_sync_render(self):
+        post = Post(body='*hello*', author=self.user)
+        self.assertEqual(post.body_html, '<p><em>hello</em></p>')
+
+    def test_async_render(self):
+        self.app.config['FLASKY_ASYNC_RENDER'] = True
+        post = Post(body='*hello*', author=self.user)
+        comment = Comment(body='**hi**', author=self.user, post=post)
+        self.assertIsNone(post.body_html)
+        db.session.add_all([post, comment])
+        db.session.commit()
+        tasks.wait()
+        db.session.expire_all()
+        self.assertEqual(post.body_html, '<p><em>hello</em></p>')
+        self.assertEqual(comment.body_html, '<strong>hi</strong>')
+
+    def test_async_render_skips_stale_body(self):
+        self.app.config['FLASKY_ASYNC_RENDER'] = True
+        post = Post(body='second', author=self.user)
+        db.session.add(post)
+        db.session.commit()
+        tasks.wait()
+        render_body(Post, post.id, 'first')
+        self.assertEqual(post.body_html, '<p>second</p>')
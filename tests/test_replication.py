@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+import unittest
+from base64 import b64encode
+from app import create_app, db, db_profile, replica
+from app.models import Role, User, Post
+from app.replication import PINNED_UNTIL, SharedPins
+
+
+class ReplicationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.app = self.create_app()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.john = User(email='john@example.com', username='john',
+                         password='cat', confirmed=True)
+        self.susan = User(email='susan@example.com', username='susan',
+                          password='dog', confirmed=True)
+        db.session.add_all([self.john, self.susan,
+                            Post(body='synced post', author=self.susan)])
+        db.session.commit()
+        replica.sync()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        for engine in (db.get_engine(), db.get_engine(bind='replica')):
+            engine.dispose()
+        self.app_context.pop()
+        shutil.rmtree(self.tmpdir)
+
+    def create_app(self):
+        app = create_app('testing')
+        app.config.update(
+            WTF_CSRF_ENABLED=False,
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(
+                self.tmpdir, 'primary.sqlite'),
+            FLASKY_REPLICA_DATABASE_URL='sqlite:///' + os.path.join(
+                self.tmpdir, 'replica.sqlite'))
+        db_profile.configure(app)
+        replica.configure(app)
+        return app
+
+    def add_post(self, body):
+        db.session.add(Post(body=body, author=self.susan))
+        db.session.commit()
+
+    def page(self, client=None, url='/'):
+        return (client or self.client).get(url).get_data(as_text=True)
+
+    def api(self, method, url, email, password, **kwargs):
+        credentials = b64encode(f'{email}:{password}'.encode('utf-8'))
+        return getattr(self.client, method)(url, headers={
+            'Authorization': 'Basic ' + credentials.decode('utf-8')},
+            **kwargs)
+
+    def test_read_only_views_read_the_replica(self):
+        self.add_post('unsynced post')
+        html = self.page()
+        self.assertIn('synced post', html)
+        self.assertNotIn('unsynced post', html)
+        replica.sync()
+        self.assertIn('unsynced post', self.page())
+
+    def test_writes_go_to_the_primary(self):
+        with self.app.test_request_context('/'):
+            self.app.preprocess_request()
+            self.app.view_functions['main.index']()
+            self.assertEqual(Post.query.count(), 1)
+            db.session.add(Post(body='new post', author=self.susan))
+            # The flush lands on the primary, and later reads follow it.
+            self.assertEqual(Post.query.count(), 2)
+            db.session.rollback()
+        # Outside a request everything uses the primary.
+        self.add_post('unsynced post')
+        self.assertEqual(Post.query.count(), 2)
+
+    def test_writer_reads_own_post(self):
+        self.client.post('/auth/login', data={'email': 'john@example.com',
+                                              'password': 'cat'})
+        response = self.client.post('/', data={'body': 'fresh post'},
+                                    follow_redirects=True)
+        self.assertIn('fresh post', response.get_data(as_text=True))
+        self.assertNotIn('fresh post',
+                         self.page(self.app.test_client()))
+        # Once the window is over, the writer is back on the replica.
+        with self.client.session_transaction() as session:
+            session[PINNED_UNTIL] = 0
+        self.assertNotIn('fresh post', self.page())
+
+    def test_api_writer_reads_own_post(self):
+        response = self.api('post', '/api/v1/posts/', 'john@example.com',
+                            'cat', json={'body': 'api post'})
+        self.assertEqual(response.status_code, 201)
+        url = f'/api/v1/users/{self.john.id}/posts/'
+        response = self.api('get', url, 'john@example.com', 'cat')
+        self.assertEqual(len(response.get_json()['posts']), 1)
+        # Without the cookie the first client got, only the user counts.
+        self.client = self.app.test_client()
+        response = self.api('get', url, 'john@example.com', 'cat')
+        self.assertEqual(len(response.get_json()['posts']), 1)
+        response = self.api('get', url, 'susan@example.com', 'dog')
+        self.assertEqual(len(response.get_json()['posts']), 0)
+
+    def test_api_pin_is_seen_by_other_workers(self):
+        # Two apps on the same databases and pin file, as two workers.
+        other = self.create_app()
+        path = os.path.join(self.tmpdir, 'pins')
+        for app in (self.app, other):
+            app.extensions['replication'] = SharedPins(path, 64)
+        response = self.api('post', '/api/v1/posts/', 'john@example.com',
+                            'cat', json={'body': 'api post'})
+        self.assertEqual(response.status_code, 201)
+        # Start the other worker's request with a session of its own.
+        db.session.remove()
+        self.client = other.test_client()
+        try:
+            response = self.api('get', f'/api/v1/users/{self.john.id}/posts/',
+                                'john@example.com', 'cat')
+            self.assertEqual(len(response.get_json()['posts']), 1)
+        finally:
+            with other.app_context():
+                for engine in (db.get_engine(),
+                               db.get_engine(bind='replica')):
+                    engine.dispose()
+
+    def test_sync_needs_sqlite_files(self):
+        self.app.config['FLASKY_REPLICA_DATABASE_URL'] = \
+            'postgresql://replica.example.com/flasky'
+        with self.assertRaises(ValueError):
+            replica.sync()
@@ -0,0 +1,146 @@
+import unittest
+from base64 import b64encode
+from app import create_app, db, search
+from app.models import Role, User, Post, Comment
+
+
+class SearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_SEARCH_PER_PAGE'] = 2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.john = User(username='john', email='john@example.com',
+                         password='cat', confirmed=True)
+        db.session.add(self.john)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def post(self, body):
+        post = Post(body=body, author=self.john)
+        db.session.add(post)
+        db.session.commit()
+        return post
+
+    def comment(self, body, post):
+        comment = Comment(body=body, post=post, author=self.john)
+        db.session.add(comment)
+        db.session.commit()
+        return comment
+
+    def found(self, query, **kwargs):
+        return [(hit.kind, hit.item.id)
+                for hit in search.query(query, **kwargs).hits]
+
+    def test_ranked_by_relevance(self):
+        once = self.post('a note about gardens and other things entirely')
+        twice = self.post('gardens, gardens')
+        self.post('nothing relevant')
+        self.assertEqual(self.found('gardens'),
+                         [('post', twice.id), ('post', once.id)])
+        # Stemmed, and every word must match.
+        self.assertEqual(self.found('garden note'), [('post', once.id)])
+
+    def test_snippet_is_highlighted_and_escaped(self):
+        self.post('<script>alert(1)</script> kittens are great')
+        hit, = search.query('kittens').hits
+        self.assertIn('<mark>kittens</mark>', hit.snippet)
+        self.assertIn('&lt;script&gt;', hit.snippet)
+        self.assertNotIn('<script>', hit.snippet)
+
+    def test_cursor_pages_through_results(self):
+        posts = [self.post('llama ' * n) for n in range(1, 6)]
+        seen = []
+        cursor = None
+        while True:
+            page = search.query('llama', cursor=cursor)
+            seen.extend(hit.item.id for hit in page.hits)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(sorted(seen), [post.id for post in posts])
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_index_follows_edits_disables_and_deletes(self):
+        post = self.post('original words')
+        comment = self.comment('a comment about otters', post)
+        self.assertEqual(self.found('otters'), [('comment', comment.id)])
+        post.body = 'replacement text'
+        db.session.commit()
+        self.assertEqual(self.found('original'), [])
+        self.assertEqual(self.found('replacement'), [('post', post.id)])
+        comment.disabled = True
+        db.session.commit()
+        self.assertEqual(self.found('otters'), [])
+        comment.disabled = False
+        db.session.commit()
+        self.assertEqual(self.found('otters'), [('comment', comment.id)])
+        db.session.delete(comment)
+        db.session.commit()
+        self.assertEqual(self.found('otters'), [])
+
+    def test_kinds(self):
+        post = self.post('walrus')
+        comment = self.comment('walrus', post)
+        self.assertEqual(self.found('walrus', kinds=('comment',)),
+                         [('comment', comment.id)])
+        self.assertEqual(self.found('walrus', kinds=('post',)),
+                         [('post', post.id)])
+
+    def test_rebuild_indexes_core_inserts(self):
+        db.session.execute(Post.__table__.insert().values(
+            body='bulk loaded badger', author_id=self.john.id))
+        db.session.commit()
+        self.assertEqual(self.found('badger'), [])
+        search.rebuild()
+        self.assertEqual(len(self.found('badger')), 1)
+
+    def test_like_backend(self):
+        self.app.config['FLASKY_SEARCH_BACKEND'] = 'like'
+        post = self.post('the heron_flies at dawn')
+        self.post('herons elsewhere')
+        self.assertEqual(self.found('heron_flies'), [('post', post.id)])
+        hit, = search.query('dawn').hits
+        self.assertIn('<mark>dawn</mark>', hit.snippet)
+
+    def test_punctuation_only_query(self):
+        self.post('anything')
+        self.assertEqual(self.found('"*() -'), [])
+
+    def test_web_view(self):
+        self.post('penguins <b>waddle</b>')
+        response = self.client.get('/search?q=penguins')
+        self.assertEqual(response.status_code, 200)
+        html = response.get_data(as_text=True)
+        self.assertIn('<mark>penguins</mark>', html)
+        self.assertNotIn('<b>waddle', html)
+
+    def test_api(self):
+        for n in range(3):
+            self.post('lemur ' * (n + 1))
+        headers = {
+            'Authorization': 'Basic ' + b64encode(
+                b'john@example.com:cat').decode('utf-8'),
+            'Accept': 'application/json'}
+        response = self.client.get('/api/v1/search?q=lemur',
+                                   headers=headers)
+        self.assertEqual(response.status_code, 200)
+        first = response.get_json()
+        self.assertEqual(len(first['results']), 2)
+        self.assertEqual(first['results'][0]['type'], 'post')
+        self.assertIn('<mark>lemur</mark>', first['results'][0]['snippet'])
+        response = self.client.get(first['next_url'], headers=headers)
+        second = response.get_json()
+        self.assertEqual(len(second['results']), 1)
+        self.assertIsNone(second['next_url'])
+        ids = {r['id'] for r in first['results'] + second['results']}
+        self.assertEqual(len(ids), 3)
+        response = self.client.get('/api/v1/search', headers=headers)
+        self.assertEqual(response.status_code, 400)
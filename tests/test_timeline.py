@@ -0,0 +1,99 @@
+import unittest
+from flask import current_app
+from app import create_app, db
+from app.models import Role, User, Post, TimelineEntry, repair_counters
+
+
+class TimelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.reader = User(username='reader', email='reader@example.com',
+                           password='1')
+        self.writer = User(username='writer', email='writer@example.com',
+                           password='1')
+        db.session.add_all([self.reader, self.writer])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def entries(self, user):
+        return TimelineEntry.query.filter_by(user_id=user.id).count()
+
+    def test_post_fans_out_to_followers(self):
+        self.reader.follow(self.writer)
+        db.session.commit()
+        post = Post(body='hello', author=self.writer)
+        db.session.add(post)
+        db.session.commit()
+        self.assertEqual(self.reader.followed_posts.all(), [post])
+        self.assertEqual(self.entries(self.reader), 1)
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        post = Post(body='hello', author=self.writer)
+        db.session.add(post)
+        db.session.commit()
+        self.assertEqual(self.entries(self.reader), 0)
+        self.reader.follow(self.writer)
+        db.session.commit()
+        self.assertEqual(self.reader.followed_posts.all(), [post])
+        self.reader.unfollow(self.writer)
+        db.session.commit()
+        self.assertEqual(self.reader.followed_posts.all(), [])
+        self.assertEqual(self.entries(self.reader), 0)
+
+    def test_popular_author_merged_at_read_time(self):
+        current_app.config['FLASKY_TIMELINE_FANOUT_LIMIT'] = 2
+        self.reader.follow(self.writer)
+        db.session.commit()
+        post = Post(body='hello', author=self.writer)
+        db.session.add(post)
+        db.session.commit()
+        self.assertEqual(self.entries(self.reader), 0)
+        self.assertEqual(self.reader.followed_posts.all(), [post])
+        own = Post(body='mine', author=self.reader)
+        db.session.add(own)
+        db.session.commit()
+        timeline = self.reader.followed_posts.order_by(Post.timestamp.desc())
+        self.assertEqual(timeline.all(), [own, post])
+
+    def test_author_dropping_under_limit_is_backfilled(self):
+        current_app.config['FLASKY_TIMELINE_FANOUT_LIMIT'] = 3
+        # Posts since the follow are kept past the backfill depth.
+        current_app.config['FLASKY_TIMELINE_BACKFILL'] = 0
+        other = User(username='other', email='other@example.com',
+                     password='1')
+        db.session.add(other)
+        self.reader.follow(self.writer)
+        other.follow(self.writer)
+        db.session.commit()
+        post = Post(body='hello', author=self.writer)
+        db.session.add(post)
+        db.session.commit()
+        self.assertEqual(self.entries(self.reader), 0)
+        other.unfollow(self.writer)
+        db.session.commit()
+        self.assertEqual(self.entries(self.reader), 1)
+        self.assertEqual(self.reader.followed_posts.all(), [post])
+
+    def test_repaired_counter_under_limit_is_backfilled(self):
+        current_app.config['FLASKY_TIMELINE_FANOUT_LIMIT'] = 3
+        self.reader.follow(self.writer)
+        db.session.commit()
+        # A drifted counter puts the writer well over the limit.
+        self.writer.follower_count = 5
+        db.session.commit()
+        post = Post(body='hello', author=self.writer)
+        db.session.add(post)
+        db.session.commit()
+        self.assertEqual(self.entries(self.reader), 0)
+        repair_counters()
+        self.assertEqual(self.writer.follower_count, 2)
+        self.assertEqual(self.entries(self.reader), 1)
+        self.assertEqual(self.reader.followed_posts.all(), [post])